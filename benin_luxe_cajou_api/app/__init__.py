@@ -5,6 +5,11 @@ from flask_cors import CORS # <<< 1. IMPORTER CORS
 import cloudinary
 from config import Config
 from .extensions import db, migrate, jwt, ma, mail
+# Alias : le sous-module app.cache, une fois importé, remplace l'attribut `cache` du paquet
+from .extensions import cache as shared_cache
+from . import statement_budget, outbox, commands
+from .push import push_dispatcher
+from .background import scheduler
 import logging
 
 def create_app(config_class=Config):
@@ -41,6 +46,10 @@ def create_app(config_class=Config):
     jwt.init_app(app)
     ma.init_app(app)
     mail.init_app(app)
+    shared_cache.init_app(app)
+    statement_budget.init_app(app)
+    commands.init_app(app)
+    push_dispatcher.init_app(app)
 
     with app.app_context():
         from . import models
@@ -71,6 +80,15 @@ def create_app(config_class=Config):
     app.register_blueprint(user_profile_bp, url_prefix='/api/profile')
     app.register_blueprint(payment_bp, url_prefix='/api/payment')
 
+    # Démarré après l'enregistrement des blueprints, qui déclarent les handlers de l'outbox
+    outbox.dispatcher.init_app(app)
+
+    from .payment import reconciliation, webhooks  # tâches périodiques et handler de l'outbox
+    scheduler.init_app(app)
+
+    from .payment.status_stream import status_hub
+    status_hub.init_app(app)
+
     return app
 
 
@@ -3,11 +3,11 @@
 from flask import Blueprint, jsonify, request, current_app
 from .admin_auth import admin_required
 from flask_jwt_extended import get_jwt_identity
-from datetime import datetime, timedelta
-from sqlalchemy import func # <<<--- CORRECTION : Ajout de l'import manquant
+from datetime import datetime
 
-from app.models import Utilisateur, Commande, Produit
+from app.models import Utilisateur, Produit
 from app.extensions import db
+from app.stats import dashboard_totals
 
 admin_bp = Blueprint('admin', __name__)
 
@@ -18,39 +18,11 @@ def get_dashboard_stats():
     Retourne les statistiques clés pour le tableau de bord de l'administrateur.
     """
     try:
-        # --- Calculs pour les dates ---
         today = datetime.utcnow().date()
-        start_of_week = today - timedelta(days=today.weekday())
-        start_of_month = today.replace(day=1)
 
-        # --- 1. Chiffre d'Affaires (CA) ---
-        ca_today = db.session.query(func.sum(Commande.total)).filter(
-            Commande.statut_paiement == 'paye',
-            func.date(Commande.date_commande) == today
-        ).scalar() or 0
-
-        ca_week = db.session.query(func.sum(Commande.total)).filter(
-            Commande.statut_paiement == 'paye',
-            func.date(Commande.date_commande) >= start_of_week
-        ).scalar() or 0
-
-        ca_month = db.session.query(func.sum(Commande.total)).filter(
-            Commande.statut_paiement == 'paye',
-            func.date(Commande.date_commande) >= start_of_month
-        ).scalar() or 0
-
-        # --- 2. Commandes en Attente ---
-        # Commandes payées ('confirmee') mais pas encore en préparation ou expédiées.
-        pending_orders_count = db.session.query(func.count(Commande.id)).filter(
-            Commande.statut == 'confirmee'
-        ).scalar() or 0
-
-        # --- 3. Nouveaux Clients ---
-        seven_days_ago = today - timedelta(days=7)
-        new_clients_count = db.session.query(func.count(Utilisateur.id)).filter(
-            Utilisateur.role == 'client',
-            func.date(Utilisateur.date_creation) >= seven_days_ago
-        ).scalar() or 0
+        # --- 1 à 3. CA, commandes à préparer, nouveaux clients ---
+        # Lus dans les agrégats quotidiens (app/stats.py) plutôt que recalculés sur les commandes
+        totals = dashboard_totals(today)
 
         # --- 4. Alertes de Stock Faible ---
         low_stock_products = Produit.query.filter(
@@ -66,11 +38,11 @@ def get_dashboard_stats():
         
         # --- Assemblage de la réponse finale ---
         stats = {
-            "ca_today": str(ca_today),
-            "ca_week": str(ca_week),
-            "ca_month": str(ca_month),
-            "pending_orders_count": pending_orders_count,
-            "new_clients_last_7_days": new_clients_count,
+            "ca_today": str(totals['ca_today']),
+            "ca_week": str(totals['ca_week']),
+            "ca_month": str(totals['ca_month']),
+            "pending_orders_count": totals['pending_orders_count'],
+            "new_clients_last_7_days": totals['new_clients_last_7_days'],
             "low_stock_products": low_stock_list
         }
 
@@ -0,0 +1,104 @@
+# app/background.py
+
+import threading
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import or_, update
+from sqlalchemy.exc import IntegrityError
+
+from .extensions import cache, db
+from .models import TachePlanifiee
+
+
+class Scheduler:
+    """
+    Tâches périodiques exécutées dans un thread de chaque worker gunicorn.
+    À chaque échéance, un seul worker exécute la tâche : il la "réserve"
+    dans le cache partagé pour toute la durée de l'intervalle. Si le cache
+    est indisponible, la réservation se fait en base (table
+    taches_planifiees), pour que la réconciliation des paiements et
+    l'expiration des réservations de stock continuent pendant la panne.
+    """
+
+    def __init__(self):
+        self.app = None
+        self.jobs = {}   # nom -> (clé de config de l'intervalle, fonction)
+        self._next_run = {}
+        self._start_lock = threading.Lock()
+        self._thread = None
+
+    def job(self, name, interval_config_key):
+        """Déclare une tâche lancée toutes les `app.config[interval_config_key]` secondes."""
+        def wrapper(fn):
+            self.jobs[name] = (interval_config_key, fn)
+            return fn
+        return wrapper
+
+    def init_app(self, app):
+        self.app = app
+        app.extensions['scheduler'] = self
+        # Comme l'outbox : démarrage à la première requête, jamais dans la CLI
+        app.before_request(self._ensure_started)
+
+    def _ensure_started(self):
+        if self._thread is not None or self.app.testing or not self.app.config['BACKGROUND_JOBS_ENABLED']:
+            return
+        with self._start_lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, name='scheduler', daemon=True)
+            self._thread.start()
+
+    def run_job(self, name):
+        """Exécute une tâche immédiatement (dans un contexte d'application)."""
+        _, fn = self.jobs[name]
+        with self.app.app_context():
+            return fn()
+
+    def _claim(self, name, interval):
+        """Réserve l'échéance de la tâche ; True si ce worker doit l'exécuter."""
+        claimed = cache.add(f'job:{name}', int(time.time()), ttl=interval)
+        # add() renvoie aussi False quand le cache vient de tomber : on passe à la base
+        if claimed or cache.available:
+            return claimed
+        return self._claim_in_db(name, interval)
+
+    def _claim_in_db(self, name, interval):
+        """Réservation par compare-and-swap sur taches_planifiees (la ligne est créée au premier appel)."""
+        with self.app.app_context():
+            now = datetime.utcnow()
+            until = now + timedelta(seconds=interval)
+            claimed = db.session.execute(update(TachePlanifiee).where(
+                TachePlanifiee.nom == name,
+                or_(TachePlanifiee.verrouille_jusqu_a.is_(None), TachePlanifiee.verrouille_jusqu_a <= now),
+            ).values(verrouille_jusqu_a=until)).rowcount == 1
+            if not claimed and db.session.get(TachePlanifiee, name) is None:
+                db.session.add(TachePlanifiee(nom=name, verrouille_jusqu_a=until))
+                try:
+                    db.session.flush()
+                    claimed = True
+                except IntegrityError:
+                    # Un autre worker a créé la ligne en même temps : l'échéance est à lui
+                    db.session.rollback()
+                    return False
+            db.session.commit()
+            return claimed
+
+    def _run(self):
+        while True:
+            now = time.monotonic()
+            for name, (interval_key, _) in list(self.jobs.items()):
+                interval = self.app.config[interval_key]
+                if now < self._next_run.get(name, 0):
+                    continue
+                self._next_run[name] = now + interval
+                try:
+                    if self._claim(name, interval):
+                        self.run_job(name)
+                except Exception as e:
+                    self.app.logger.error(f"Tâche périodique '{name}' en erreur: {e}", exc_info=True)
+            time.sleep(1)
+
+
+scheduler = Scheduler()
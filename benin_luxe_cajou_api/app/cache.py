@@ -0,0 +1,358 @@
+# app/cache.py
+
+import hashlib
+import itertools
+import random
+import threading
+from collections import defaultdict, deque
+from functools import wraps
+
+from flask import current_app, request, make_response, g
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from .extensions import cache
+from .extensions import db
+from .models import Categorie, TypeProduit, Produit, ImageProduit, ZoneLivraison, Commande
+
+# Chaque modèle suivi est rattaché à un "espace" de version.
+# Toute écriture validée (commit) sur l'un de ces modèles incrémente la version
+# de son espace, ce qui invalide d'un coup tous les instantanés qui en dépendent.
+TRACKED_MODELS = {
+    Categorie: 'catalogue',
+    TypeProduit: 'catalogue',
+    Produit: 'catalogue',
+    ImageProduit: 'catalogue',
+    ZoneLivraison: 'delivery_zones',
+}
+
+
+def user_orders_namespace(user_id):
+    """Espace de l'historique de commandes d'un client."""
+    return f'user_orders:{user_id}'
+
+
+def product_stock_namespace(product_id):
+    """
+    Espace du stock d'un produit. Les mouvements de stock (commandes) n'invalident
+    que cet espace et l'espace global 'stock', jamais le 'catalogue' : ni la
+    structure du catalogue, ni l'index de recherche ne sont reconstruits.
+    """
+    return f'stock:{product_id}'
+
+
+# Modèles dont l'espace dépend de la ligne modifiée
+TRACKED_INSTANCES = {
+    Commande: lambda commande: user_orders_namespace(commande.utilisateur_id),
+}
+
+# Les versions et les instantanés vivent dans le cache partagé (extensions.cache) :
+# avec Redis, tous les workers gunicorn voient la même version.
+# Versions produites par CE processus, pour que les index en mémoire (recherche)
+# sachent si un changement de version vient d'un autre worker.
+_local_lock = threading.Lock()
+_local_bumps = defaultdict(lambda: deque(maxlen=1000))
+# Constructions d'instantanés en cours dans ce processus (single-flight) : clé -> Event
+_inflight = {}
+# Invalidations validées en base mais non répercutées (cache indisponible) :
+# rejouées dès que le cache répond de nouveau.
+_deferred_bumps = set()
+
+
+# --- VERSIONS ---
+
+def get_version(namespace):
+    """
+    Retourne la version courante d'un espace (ex: 'catalogue'), ou None si
+    le cache est indisponible : l'appelant construit alors sans cache.
+    """
+    if _deferred_bumps and cache.available:
+        _replay_deferred_bumps()
+    key = f'version:{namespace}'
+    value = cache.get(key)
+    if value is None:
+        # Départ aléatoire : une version perdue (éviction, redémarrage) ne
+        # redonnera pas un numéro déjà servi avec un contenu différent.
+        cache.add(key, random.randrange(1, 2 ** 40))
+        value = cache.get(key)
+    return value.decode('ascii') if value is not None else None
+
+
+def bump_version(namespace):
+    """
+    Invalide tous les instantanés d'un espace en incrémentant sa version.
+    Cache indisponible : l'invalidation est différée et retourne None.
+    """
+    if get_version(namespace) is None:
+        version = None
+    else:
+        version = cache.incr(f'version:{namespace}')
+    with _local_lock:
+        if version is None:
+            _deferred_bumps.add(namespace)
+        else:
+            _local_bumps[namespace].append(version)
+    return version
+
+
+def get_versions(namespaces):
+    """
+    Versions de plusieurs espaces en un aller-retour : {espace: version}, ou
+    None si le cache est indisponible.
+    """
+    values = cache.get_many([f'version:{namespace}' for namespace in namespaces])
+    if values is None:
+        return None
+    versions = {}
+    for namespace, value in zip(namespaces, values):
+        # Espace jamais lu : initialisé comme dans get_version()
+        versions[namespace] = value.decode('ascii') if value is not None else get_version(namespace)
+    return None if None in versions.values() else versions
+
+
+def combined_version(namespaces):
+    """
+    Version d'un espace, ou d'un tuple d'espaces (ex: ('catalogue', 'stock')) :
+    elle change dès que l'un d'eux change. None si le cache est indisponible.
+    """
+    if isinstance(namespaces, str):
+        return get_version(namespaces)
+    versions = get_versions(list(namespaces))
+    return None if versions is None else '.'.join(versions[namespace] for namespace in namespaces)
+
+
+def _replay_deferred_bumps():
+    with _local_lock:
+        namespaces = list(_deferred_bumps)
+        _deferred_bumps.clear()
+    for namespace in namespaces:
+        bump_version(namespace)
+
+
+def bumped_locally(namespace, since, until):
+    """
+    Retourne True si toutes les versions de `since` (exclue) à `until` (incluse)
+    ont été produites par ce processus, c'est-à-dire si aucun autre worker n'a
+    modifié l'espace entre-temps.
+    """
+    since, until = int(since), int(until)
+    if until < since or until - since > 1000:
+        return False
+    with _local_lock:
+        local = set(_local_bumps[namespace])
+    return all(version in local for version in range(since + 1, until + 1))
+
+
+# --- INSTANTANÉS JSON PRÉ-SÉRIALISÉS ---
+
+def get_snapshot(key, version):
+    """Retourne les octets JSON mis en cache pour `key` s'ils sont à jour, sinon None."""
+    if version is None:
+        return None
+    return cache.get(f'snapshot:{key}:{version}')
+
+
+def set_snapshot(key, version, payload):
+    """
+    Enregistre les octets JSON `payload` pour `key` à la version donnée.
+    Les instantanés des versions dépassées ne sont plus lus et expirent (TTL / LRU).
+    La dernière valeur est aussi conservée sans version, comme copie de secours.
+    """
+    if version is None:
+        return
+    cache.set(f'snapshot:{key}:{version}', payload)
+    cache.set(f'snapshot:{key}:stale', payload, ttl=current_app.config['CACHE_STALE_TTL'])
+
+
+def dumps_json(data):
+    """Sérialise `data` en octets JSON compacts (mêmes règles que jsonify)."""
+    return current_app.json.dumps(data, separators=(',', ':')).encode('utf-8')
+
+
+def get_or_build_snapshot(key, namespace, build):
+    """
+    Retourne les octets JSON de `key` pour la version courante de `namespace`
+    (un espace ou un tuple d'espaces). En cas d'absence, `build()` est appelé (requête + sérialisation) et son
+    résultat est mis en cache. Un hit n'interroge ni la BDD ni Marshmallow.
+    """
+    # La version est lue AVANT la construction : si un commit survient pendant
+    # le calcul, l'instantané est rangé sous l'ancienne version et sera ignoré.
+    version = combined_version(namespace)
+    if version is None:
+        # Cache indisponible : ni lecture, ni verrou partagé
+        return dumps_json(build())
+    payload = get_snapshot(key, version)
+    if payload is None:
+        payload = _build_single_flight(key, version, build)
+    return payload
+
+
+def _build_single_flight(key, version, build):
+    """
+    Construit l'instantané une seule fois pour toutes les requêtes concurrentes :
+    - dans le processus, les threads suivants attendent l'Event du premier ;
+    - entre workers, le premier prend un verrou dans le cache partagé.
+    L'attente est bornée par SINGLE_FLIGHT_WAIT : au-delà, on sert la dernière
+    copie connue (périmée) si elle existe, sinon on construit soi-même.
+    """
+    wait = current_app.config['SINGLE_FLIGHT_WAIT']
+    flight = f'{key}:{version}'
+
+    with _local_lock:
+        event = _inflight.get(flight)
+        leader = event is None
+        if leader:
+            event = _inflight[flight] = threading.Event()
+
+    if not leader:
+        event.wait(wait)
+        payload = get_snapshot(key, version)
+        if payload is not None:
+            return payload
+        return _stale_or_build(key, version, build)
+
+    try:
+        with cache.lock(f'snapshot:{flight}', ttl=current_app.config['SINGLE_FLIGHT_LOCK_TTL'], wait=wait) as acquired:
+            # Un autre worker a pu terminer pendant qu'on attendait le verrou
+            payload = get_snapshot(key, version)
+            if payload is not None:
+                return payload
+            if not acquired:
+                return _stale_or_build(key, version, build)
+            payload = dumps_json(build())
+            set_snapshot(key, version, payload)
+            return payload
+    finally:
+        with _local_lock:
+            _inflight.pop(flight, None)
+        event.set()
+
+
+def _stale_or_build(key, version, build):
+    payload = cache.get(f'snapshot:{key}:stale')
+    if payload is not None:
+        current_app.logger.warning(f"Instantané '{key}' servi périmé (construction trop longue)")
+        # Le contenu ne correspond pas à la version courante : pas d'ETag pour cette réponse
+        g.served_stale_snapshot = True
+        return payload
+    payload = dumps_json(build())
+    set_snapshot(key, version, payload)
+    return payload
+
+
+def json_bytes_response(payload, status=200):
+    """Construit une réponse JSON à partir d'octets déjà sérialisés."""
+    return current_app.response_class(payload, status=status, mimetype='application/json')
+
+
+# --- RÉPONSES CONDITIONNELLES (ETag / Cache-Control) ---
+
+def conditional_response(namespace):
+    """
+    Décorateur pour les routes publiques en lecture.
+    L'ETag est dérivé de la version de `namespace` (un espace ou un tuple
+    d'espaces) et de l'URL complète
+    (paramètres inclus) : si le client présente un If-None-Match identique,
+    on répond 304 sans exécuter la route ni sérialiser quoi que ce soit.
+    """
+    def wrapper(fn):
+        @wraps(fn)
+        def decorator(*args, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                return fn(*args, **kwargs)
+            version = combined_version(namespace)
+            if version is None:
+                # Sans version fiable, pas d'ETag : la réponse est recalculée
+                response = make_response(fn(*args, **kwargs))
+                response.headers['Cache-Control'] = 'no-cache'
+                return response
+            etag = hashlib.sha1(f"{version}|{request.full_path}".encode('utf-8')).hexdigest()
+
+            if request.if_none_match.contains(etag):
+                response = current_app.response_class(status=304)
+            else:
+                response = make_response(fn(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+                if g.pop('served_stale_snapshot', False):
+                    response.headers['Cache-Control'] = 'no-cache'
+                    return response
+
+            response.set_etag(etag)
+            response.headers['Cache-Control'] = (
+                f"public, max-age={current_app.config['PUBLIC_CACHE_MAX_AGE']}, "
+                f"stale-while-revalidate={current_app.config['PUBLIC_CACHE_STALE_WHILE_REVALIDATE']}"
+            )
+            return response
+        return decorator
+    return wrapper
+
+
+# --- INVALIDATION VIA LES ÉVÉNEMENTS SQLALCHEMY ---
+
+def _pending_namespaces(session):
+    return session.info.setdefault('cache_pending_namespaces', set())
+
+
+@event.listens_for(Session, 'after_flush')
+def _collect_flushed_changes(session, flush_context):
+    # Dans after_flush, new/dirty/deleted reflètent encore l'état d'avant le flush
+    pending = _pending_namespaces(session)
+    for obj in itertools.chain(session.new, session.dirty, session.deleted):
+        namespace = TRACKED_MODELS.get(type(obj))
+        if namespace:
+            pending.add(namespace)
+        namespace_of = TRACKED_INSTANCES.get(type(obj))
+        if namespace_of:
+            pending.add(namespace_of(obj))
+
+
+@event.listens_for(Session, 'do_orm_execute')
+def _collect_bulk_changes(orm_execute_state):
+    # Couvre les query.update()/delete() qui ne passent pas par le flush
+    if not (orm_execute_state.is_update or orm_execute_state.is_delete):
+        return
+    if orm_execute_state.execution_options.get('stock_only'):
+        # Mouvement de stock : invalidé produit par produit (voir invalidate_stock_after_commit)
+        return
+    mapper = orm_execute_state.bind_mapper
+    namespace = TRACKED_MODELS.get(mapper.class_) if mapper is not None else None
+    if namespace:
+        _pending_namespaces(orm_execute_state.session).add(namespace)
+
+
+def invalidate_after_commit(namespace):
+    """
+    Invalide `namespace` au prochain commit de la session courante. Pour les
+    query.update() sur un modèle de TRACKED_INSTANCES : la requête ne dit pas
+    quelles lignes (donc quels espaces) elle touche.
+    """
+    _pending_namespaces(db.session()).add(namespace)
+
+
+def invalidate_stock_after_commit(product_ids):
+    """
+    Invalide, au prochain commit, le stock des produits `product_ids` : leurs
+    instantanés et les listes de produits, sans toucher au 'catalogue'.
+    """
+    pending = _pending_namespaces(db.session())
+    pending.add('stock')
+    pending.update(product_stock_namespace(product_id) for product_id in product_ids)
+
+
+@event.listens_for(Session, 'after_commit')
+def _bump_committed_namespaces(session):
+    # Le commit a eu lieu : une erreur ici ne doit pas remonter à l'appelant
+    pending = session.info.pop('cache_pending_namespaces', None)
+    for namespace in pending or ():
+        try:
+            bump_version(namespace)
+        except Exception as e:
+            with _local_lock:
+                _deferred_bumps.add(namespace)
+            current_app.logger.error(f"Invalidation de '{namespace}' différée: {e}", exc_info=True)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_pending_namespaces(session):
+    session.info.pop('cache_pending_namespaces', None)
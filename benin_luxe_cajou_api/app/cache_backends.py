@@ -0,0 +1,499 @@
+# app/cache_backends.py
+
+import logging
+import socket
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from contextlib import contextmanager
+from urllib.parse import urlparse
+
+logger = logging.getLogger(__name__)
+
+
+class CacheError(Exception):
+    """Erreur renvoyée par un backend de cache (ex: réponse d'erreur Redis)."""
+
+
+# -----------------------------------------------------------------------------
+# BACKEND MÉMOIRE (LRU BORNÉ, UN SEUL PROCESSUS)
+# -----------------------------------------------------------------------------
+
+class MemoryBackend:
+    """
+    Cache LRU en mémoire, borné en nombre d'entrées, avec TTL et tags.
+    Partagé entre les threads d'un worker, mais pas entre workers gunicorn.
+    """
+
+    def __init__(self, max_entries=2048):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()   # clé -> (valeur, expiration ou None)
+        self._tags = {}                 # tag -> {clés}
+        self._key_tags = {}             # clé -> {tags}
+
+    def _expired(self, entry):
+        return entry[1] is not None and entry[1] <= time.monotonic()
+
+    def _drop(self, key):
+        self._entries.pop(key, None)
+        for tag in self._key_tags.pop(key, ()):
+            keys = self._tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tags[tag]
+
+    def _live(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if self._expired(entry):
+            self._drop(key)
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def _store(self, key, value, ttl, tags=()):
+        self._entries[key] = (value, time.monotonic() + ttl if ttl else None)
+        self._entries.move_to_end(key)
+        for tag in tags:
+            self._tags.setdefault(tag, set()).add(key)
+            self._key_tags.setdefault(key, set()).add(tag)
+        while len(self._entries) > self.max_entries:
+            oldest = next(iter(self._entries))
+            self._drop(oldest)
+
+    def get(self, key):
+        with self._lock:
+            entry = self._live(key)
+            return entry[0] if entry else None
+
+    def set(self, key, value, ttl=None, tags=()):
+        with self._lock:
+            self._store(key, value, ttl, tags)
+
+    def add(self, key, value, ttl=None):
+        with self._lock:
+            if self._live(key) is not None:
+                return False
+            self._store(key, value, ttl)
+            return True
+
+    def get_many(self, keys):
+        with self._lock:
+            return [entry[0] if entry else None for entry in map(self._live, keys)]
+
+    def delete(self, *keys):
+        with self._lock:
+            for key in keys:
+                self._drop(key)
+
+    def delete_if_equals(self, key, value):
+        with self._lock:
+            entry = self._live(key)
+            if entry and entry[0] == value:
+                self._drop(key)
+                return True
+            return False
+
+    def incr(self, key):
+        with self._lock:
+            entry = self._live(key)
+            value = int(entry[0]) + 1 if entry else 1
+            self._store(key, str(value).encode('utf-8'), None)
+            return value
+
+    def delete_tag(self, tag):
+        with self._lock:
+            for key in list(self._tags.get(tag, ())):
+                self._drop(key)
+
+
+# -----------------------------------------------------------------------------
+# CLIENT REDIS (PROTOCOLE RESP) ET SON SUBSTITUT HORS-LIGNE
+# -----------------------------------------------------------------------------
+
+# Libération d'un verrou : suppression seulement si la clé contient encore
+# notre jeton (comparaison et suppression atomiques côté Redis)
+COMPARE_AND_DELETE_SCRIPT = (
+    "if redis.call('GET', KEYS[1]) == ARGV[1] then return redis.call('DEL', KEYS[1]) else return 0 end"
+)
+
+
+class RedisConnection:
+    """
+    Client minimal du protocole Redis (RESP2) sur une socket TCP.
+    Une seule connexion par processus, protégée par un verrou ; elle est
+    rouverte automatiquement après une coupure. Une commande non idempotente
+    (INCR, SET NX) n'est jamais renvoyée une fois émise : la coupure a pu
+    survenir après son exécution par le serveur.
+    """
+
+    def __init__(self, url, timeout=2.0):
+        parsed = urlparse(url)
+        self.host = parsed.hostname or 'localhost'
+        self.port = parsed.port or 6379
+        self.password = parsed.password
+        self.db = int(parsed.path.lstrip('/') or 0)
+        self.use_ssl = parsed.scheme == 'rediss'
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._sock = None
+        self._file = None
+
+    def _connect(self):
+        sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+        if self.use_ssl:
+            import ssl
+            sock = ssl.create_default_context().wrap_socket(sock, server_hostname=self.host)
+        self._sock = sock
+        self._file = sock.makefile('rb')
+        if self.password:
+            self._send(('AUTH', self.password))
+        if self.db:
+            self._send(('SELECT', self.db))
+
+    def close(self):
+        if self._sock is not None:
+            try:
+                self._sock.close()
+            except OSError:
+                pass
+        self._sock = None
+        self._file = None
+
+    @staticmethod
+    def _encode(args):
+        parts = [b'*%d\r\n' % len(args)]
+        for arg in args:
+            if isinstance(arg, bytes):
+                data = arg
+            else:
+                data = str(arg).encode('utf-8')
+            parts.append(b'$%d\r\n%s\r\n' % (len(data), data))
+        return b''.join(parts)
+
+    def _read(self):
+        line = self._file.readline()
+        if not line:
+            raise ConnectionError("Connexion Redis fermée")
+        kind, payload = line[:1], line[1:-2]
+        if kind == b'+':
+            return payload.decode('utf-8')
+        if kind == b'-':
+            raise CacheError(payload.decode('utf-8'))
+        if kind == b':':
+            return int(payload)
+        if kind == b'$':
+            length = int(payload)
+            if length == -1:
+                return None
+            return self._file.read(length + 2)[:-2]
+        if kind == b'*':
+            length = int(payload)
+            if length == -1:
+                return None
+            return [self._read() for _ in range(length)]
+        raise CacheError(f"Réponse Redis inattendue: {line!r}")
+
+    def _send(self, args):
+        self._sock.sendall(self._encode(args))
+        return self._read()
+
+    @staticmethod
+    def _idempotent(args):
+        command = str(args[0]).upper()
+        if command == 'INCR':
+            return False
+        return not (command == 'SET' and 'NX' in (str(arg).upper() for arg in args[3:]))
+
+    def execute(self, *args):
+        with self._lock:
+            for attempt in (1, 2):
+                sent = False
+                try:
+                    if self._sock is None:
+                        self._connect()
+                    sent = True
+                    return self._send(args)
+                except (OSError, ConnectionError):
+                    self.close()
+                    if attempt == 2 or (sent and not self._idempotent(args)):
+                        raise
+
+
+class FakeRedis:
+    """
+    Substitut en mémoire d'un serveur Redis, qui comprend le sous-ensemble
+    de commandes utilisé par RedisBackend. Permet de tester le backend Redis
+    (et le comportement multi-workers) sans serveur.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._data = {}      # clé -> bytes ou set
+        self._expires = {}   # clé -> expiration (time.monotonic)
+
+    def _alive(self, key):
+        expires = self._expires.get(key)
+        if expires is not None and expires <= time.monotonic():
+            self._data.pop(key, None)
+            self._expires.pop(key, None)
+        return key in self._data
+
+    @staticmethod
+    def _bytes(value):
+        return value if isinstance(value, bytes) else str(value).encode('utf-8')
+
+    def execute(self, *args):
+        command, args = str(args[0]).upper(), list(args[1:])
+        with self._lock:
+            handler = getattr(self, f'_cmd_{command.lower()}', None)
+            if handler is None:
+                raise CacheError(f"ERR unknown command '{command}'")
+            return handler(*args)
+
+    def _cmd_ping(self):
+        return 'PONG'
+
+    def _cmd_get(self, key):
+        return self._data.get(key) if self._alive(key) else None
+
+    def _cmd_mget(self, *keys):
+        return [self._cmd_get(key) for key in keys]
+
+    def _cmd_set(self, key, value, *options):
+        options = [str(o).upper() for o in options]
+        if 'NX' in options and self._alive(key):
+            return None
+        self._data[key] = self._bytes(value)
+        self._expires.pop(key, None)
+        if 'PX' in options:
+            self._expires[key] = time.monotonic() + int(options[options.index('PX') + 1]) / 1000
+        return 'OK'
+
+    def _cmd_del(self, *keys):
+        removed = 0
+        for key in keys:
+            if self._alive(key):
+                removed += 1
+            self._data.pop(key, None)
+            self._expires.pop(key, None)
+        return removed
+
+    def _cmd_incr(self, key):
+        value = int(self._data[key]) + 1 if self._alive(key) else 1
+        self._data[key] = str(value).encode('utf-8')
+        return value
+
+    def _cmd_sadd(self, key, *members):
+        self._alive(key)
+        members_set = self._data.setdefault(key, set())
+        before = len(members_set)
+        members_set.update(self._bytes(m) for m in members)
+        return len(members_set) - before
+
+    def _cmd_smembers(self, key):
+        return list(self._data[key]) if self._alive(key) else []
+
+    def _cmd_pexpire(self, key, milliseconds):
+        if not self._alive(key):
+            return 0
+        self._expires[key] = time.monotonic() + int(milliseconds) / 1000
+        return 1
+
+    def _cmd_eval(self, script, numkeys, *args):
+        # Seul le script de libération des verrous est émulé (sous le verrou : atomique)
+        if script != COMPARE_AND_DELETE_SCRIPT or int(numkeys) != 1:
+            raise CacheError("ERR script non pris en charge par FakeRedis")
+        key, value = args
+        if self._cmd_get(key) == self._bytes(value):
+            return self._cmd_del(key)
+        return 0
+
+
+class RedisBackend:
+    """
+    Backend partagé entre workers, au-dessus d'une connexion Redis
+    (RedisConnection) ou de son substitut FakeRedis.
+    Les tags sont des SET Redis listant les clés associées ; ils expirent
+    avec le TTL le plus long de leurs membres.
+    """
+
+    def __init__(self, connection):
+        self.connection = connection
+
+    def get(self, key):
+        return self.connection.execute('GET', key)
+
+    def get_many(self, keys):
+        return self.connection.execute('MGET', *keys) if keys else []
+
+    def set(self, key, value, ttl=None, tags=()):
+        if ttl:
+            self.connection.execute('SET', key, value, 'PX', int(ttl * 1000))
+        else:
+            self.connection.execute('SET', key, value)
+        for tag in tags:
+            tag_key = f'tag:{tag}'
+            self.connection.execute('SADD', tag_key, key)
+            if ttl:
+                self.connection.execute('PEXPIRE', tag_key, int(ttl * 1000))
+
+    def add(self, key, value, ttl=None):
+        if ttl:
+            return self.connection.execute('SET', key, value, 'NX', 'PX', int(ttl * 1000)) is not None
+        return self.connection.execute('SET', key, value, 'NX') is not None
+
+    def delete(self, *keys):
+        if keys:
+            self.connection.execute('DEL', *keys)
+
+    def delete_if_equals(self, key, value):
+        # Un GET puis DEL pourrait supprimer le verrou d'un autre worker s'il
+        # expire entre les deux : la comparaison se fait dans le script Lua
+        return self.connection.execute('EVAL', COMPARE_AND_DELETE_SCRIPT, 1, key, value) == 1
+
+    def incr(self, key):
+        return self.connection.execute('INCR', key)
+
+    def delete_tag(self, tag):
+        tag_key = f'tag:{tag}'
+        keys = [k.decode('utf-8') if isinstance(k, bytes) else k for k in self.connection.execute('SMEMBERS', tag_key) or []]
+        self.connection.execute('DEL', tag_key, *keys)
+
+
+# -----------------------------------------------------------------------------
+# FAÇADE ENREGISTRÉE DANS app/extensions.py
+# -----------------------------------------------------------------------------
+
+class Cache:
+    """
+    Point d'accès unique au cache de l'application (comme `db` ou `mail`).
+    Le backend est choisi par CACHE_BACKEND : 'memory', 'redis' ou 'fakeredis'.
+    Toutes les clés sont préfixées par CACHE_KEY_PREFIX et les valeurs
+    stockées en octets.
+
+    Le cache n'est jamais indispensable : si le backend est injoignable,
+    les lectures renvoient None, les écritures sont ignorées, add() et
+    lock() échouent, et le backend n'est plus sollicité pendant
+    CACHE_RETRY_INTERVAL secondes (une ligne de log à la coupure, une au retour).
+    """
+
+    def __init__(self, app=None):
+        self.backend = None
+        self.prefix = ''
+        self.default_ttl = None
+        self.retry_interval = 5
+        self._down_until = 0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        name = app.config.get('CACHE_BACKEND', 'memory')
+        if name == 'redis':
+            self.backend = RedisBackend(RedisConnection(app.config['CACHE_REDIS_URL']))
+        elif name == 'fakeredis':
+            self.backend = RedisBackend(FakeRedis())
+        elif name == 'memory':
+            # Versions, instantanés et verrous seraient propres à chaque worker :
+            # un commit dans l'un laisserait les autres servir l'ancien catalogue
+            if app.config.get('CACHE_WORKERS', 1) > 1:
+                raise ValueError("CACHE_BACKEND 'memory' impossible avec plusieurs workers "
+                                 "(WEB_CONCURRENCY > 1) : définir REDIS_URL")
+            if not (app.debug or app.testing):
+                logger.warning("Cache 'memory' local au processus : à réserver à un seul worker "
+                               "(définir REDIS_URL en production)")
+            self.backend = MemoryBackend(max_entries=app.config.get('CACHE_MAX_ENTRIES', 2048))
+        else:
+            raise ValueError(f"CACHE_BACKEND inconnu : {name}")
+        self.prefix = app.config.get('CACHE_KEY_PREFIX', '')
+        self.default_ttl = app.config.get('CACHE_DEFAULT_TTL')
+        self.retry_interval = app.config.get('CACHE_RETRY_INTERVAL', 5)
+        self._down_until = 0
+        app.extensions['cache'] = self
+
+    def _key(self, key):
+        return f'{self.prefix}{key}'
+
+    @staticmethod
+    def _value(value):
+        return value if isinstance(value, bytes) else str(value).encode('utf-8')
+
+    # --- DISPONIBILITÉ ---
+
+    @property
+    def available(self):
+        """False pendant CACHE_RETRY_INTERVAL secondes après une erreur du backend."""
+        return time.monotonic() >= self._down_until
+
+    def _call(self, method, *args, default=None, **kwargs):
+        if not self.available:
+            return default
+        try:
+            result = getattr(self.backend, method)(*args, **kwargs)
+        except (OSError, ConnectionError, CacheError) as e:
+            if self._down_until == 0:
+                logger.error(f"Cache indisponible ({method}): {e} - fonctionnement sans cache")
+            self._down_until = time.monotonic() + self.retry_interval
+            return default
+        if self._down_until:
+            self._down_until = 0
+            logger.warning("Cache de nouveau disponible")
+        return result
+
+    # --- OPÉRATIONS ---
+
+    def get(self, key):
+        """Retourne la valeur (bytes) associée à `key`, ou None (aussi si le cache est indisponible)."""
+        return self._call('get', self._key(key))
+
+    def get_many(self, keys):
+        """Retourne les valeurs de plusieurs clés en un aller-retour (liste), ou None si le cache est indisponible."""
+        return self._call('get_many', [self._key(key) for key in keys])
+
+    def set(self, key, value, ttl=None, tags=()):
+        """Enregistre `value`. `tags` permet une invalidation groupée via invalidate_tag()."""
+        self._call('set', self._key(key), self._value(value), ttl or self.default_ttl,
+                   tags=[self._key(tag) for tag in tags])
+
+    def add(self, key, value, ttl=None):
+        """Enregistre `value` seulement si `key` est absente. Retourne True si ajoutée."""
+        return self._call('add', self._key(key), self._value(value), ttl, default=False)
+
+    def delete(self, *keys):
+        self._call('delete', *[self._key(key) for key in keys])
+
+    def incr(self, key):
+        """
+        Incrémente atomiquement un compteur (créé à 1 s'il n'existe pas).
+        Retourne None si le cache est indisponible.
+        """
+        return self._call('incr', self._key(key))
+
+    def invalidate_tag(self, tag):
+        """Supprime toutes les clés enregistrées avec ce tag."""
+        self._call('delete_tag', self._key(tag))
+
+    @contextmanager
+    def lock(self, name, ttl=30, wait=10, poll_interval=0.05):
+        """
+        Verrou partagé entre threads et workers (single-flight).
+        Produit True si le verrou a été obtenu avant `wait` secondes, False sinon ;
+        le verrou expire de lui-même après `ttl` secondes si son détenteur meurt.
+        Cache indisponible : produit False sans attendre.
+        """
+        key = self._key(f'lock:{name}')
+        token = uuid.uuid4().hex.encode('ascii')
+        deadline = time.monotonic() + wait
+        acquired = self._call('add', key, token, ttl, default=False)
+        while not acquired and self.available and time.monotonic() < deadline:
+            time.sleep(poll_interval)
+            acquired = self._call('add', key, token, ttl, default=False)
+        try:
+            yield acquired
+        finally:
+            if acquired:
+                self._call('delete_if_equals', key, token, default=False)
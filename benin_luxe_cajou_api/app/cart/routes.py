@@ -5,11 +5,14 @@ from flask_jwt_extended import jwt_required, get_jwt_identity # On importe jwt_r
 from app.models import Panier, Produit
 from app.extensions import db
 from app.schemas import paniers_schema
+from app.eager_loading import eager
+from app.statement_budget import statement_budget
 
 cart_bp = Blueprint('cart', __name__)
 
 # --- CORRECTION : On utilise le décorateur jwt_required(optional=True) ---
 @cart_bp.route('/', methods=['POST'])
+@statement_budget(4)
 @jwt_required(optional=True) 
 def handle_cart():
     """
@@ -57,7 +60,7 @@ def handle_cart():
                     db.session.commit()
                 return jsonify({"msg": f"'{produit.nom}' a été retiré du panier."}), 200
         else:
-            cart_items = Panier.query.filter_by(**filter_criteria).all()
+            cart_items = eager(Panier.query, paniers_schema).filter_by(**filter_criteria).all()
             return jsonify(paniers_schema.dump(cart_items)), 200
 
     except Exception as e:
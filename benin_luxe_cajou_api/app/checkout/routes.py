@@ -5,6 +5,7 @@ from flask_jwt_extended import jwt_required, get_jwt_identity
 from decimal import Decimal
 
 from app.extensions import db
+from app import stock, stats
 from app.models import Utilisateur, Panier, Produit, AdresseLivraison, ZoneLivraison, Coupon, Commande, DetailsCommande
 from app.schemas import commande_schema
 
@@ -44,8 +45,6 @@ def place_order():
 
         sous_total = Decimal(0)
         for item in cart_items:
-            if item.produit.gestion_stock == 'limite' and item.quantite > item.produit.stock_disponible:
-                raise ValueError(f"Stock insuffisant pour le produit : {item.produit.nom}")
             sous_total += item.produit.prix_unitaire * item.quantite
 
         # Frais de livraison (utilisé ici, mais pas stocké dans l'adresse)
@@ -84,6 +83,7 @@ def place_order():
         )
         db.session.add(new_order)
         db.session.flush()
+        stats.record_order_created(new_order)
 
         for item in cart_items:
             detail = DetailsCommande(
@@ -94,9 +94,9 @@ def place_order():
                 sous_total=item.produit.prix_unitaire * item.quantite
             )
             db.session.add(detail)
-            
-            if item.produit.gestion_stock == 'limite':
-                item.produit.stock_disponible -= item.quantite
+
+        # Décrément atomique de toute la commande (InsufficientStock -> 400)
+        stock.decrement(stock.merge_quantities((item.produit_id, item.quantite) for item in cart_items))
 
         Panier.query.filter_by(utilisateur_id=user.id).delete()
         db.session.commit()
@@ -6,8 +6,11 @@ from flask_mail import Message
 from jwt.exceptions import ExpiredSignatureError  # Importation correcte
 import secrets
 import bcrypt
+from sqlalchemy import select, delete, func, literal, or_
 from app.models import Utilisateur, Panier
 from app.extensions import db, mail
+from app import stats
+from app.upsert import additive_upsert
 from datetime import timedelta
 
 client_auth_bp = Blueprint('client_auth', __name__)
@@ -67,29 +70,51 @@ def send_verification_email(user_email, code, subject):
 
 def merge_guest_cart_to_user(user_id, session_id):
     """
-    Fonction locale pour fusionner le panier invité avec le panier de l'utilisateur.
+    Fusionne le panier invité dans le panier de l'utilisateur, en deux requêtes
+    quelle que soit la taille du panier :
+        INSERT INTO paniers (utilisateur_id, produit_id, quantite)
+            SELECT user_id, produit_id, SUM(quantite) FROM paniers WHERE session_id = ...
+        ON DUPLICATE KEY UPDATE quantite = quantite + VALUES(quantite)
+    puis suppression des lignes invitées. Repose sur la contrainte unique
+    (utilisateur_id, produit_id).
     """
     if not session_id:
         return
 
-    guest_cart_items = Panier.query.filter_by(session_id=session_id).all()
-    if not guest_cart_items:
-        return
+    table = Panier.__table__
+    guest_cart = select(
+        literal(user_id).label('utilisateur_id'), table.c.produit_id, func.sum(table.c.quantite)
+    ).where(table.c.session_id == session_id).group_by(table.c.produit_id)
+    columns = ['utilisateur_id', 'produit_id', 'quantite']
 
-    for guest_item in guest_cart_items:
-        user_item = Panier.query.filter_by(utilisateur_id=user_id, produit_id=guest_item.produit_id).first()
-        
+    stmt = additive_upsert(table, ['utilisateur_id', 'produit_id'], ['quantite'], from_select=(columns, guest_cart))
+    if stmt is None:
+        _merge_guest_cart_rows(user_id, session_id)
+    else:
+        db.session.execute(stmt)
+        db.session.execute(delete(table).where(table.c.session_id == session_id))
+    db.session.commit()
+
+
+def _merge_guest_cart_rows(user_id, session_id):
+    """Fusion pour les bases sans upsert : les deux paniers sont lus en une requête."""
+    items = Panier.query.filter(
+        or_(Panier.session_id == session_id, Panier.utilisateur_id == user_id)
+    ).order_by(Panier.id).all()
+    user_items = {item.produit_id: item for item in items if item.utilisateur_id == user_id}
+    for guest_item in items:
+        if guest_item.session_id != session_id or guest_item.utilisateur_id == user_id:
+            continue
+        user_item = user_items.get(guest_item.produit_id)
         if user_item:
             # Si l'utilisateur avait déjà ce produit, on additionne les quantités
             user_item.quantite += guest_item.quantite
-            # On supprime l'ancien item invité car il a été fusionné
             db.session.delete(guest_item)
         else:
             # Sinon, on transfère l'item en changeant le propriétaire
             guest_item.session_id = None
             guest_item.utilisateur_id = user_id
-    
-    db.session.commit()
+            user_items[guest_item.produit_id] = guest_item
 
 
 # --- ROUTES D'AUTHENTIFICATION CLIENT ---
@@ -128,6 +153,8 @@ def client_register():
         new_client.set_password(password)
         
         db.session.add(new_client)
+        db.session.flush()
+        stats.record_new_client(new_client)
         db.session.commit()
         
         # 3. Envoyer le code simple par email
@@ -135,6 +162,7 @@ def client_register():
         
         if not email_sent:
             # Si l'email n'a pas pu être envoyé, on peut choisir de supprimer l'utilisateur ou de renvoyer une erreur
+            stats.record_new_client(new_client, count=-1)
             db.session.delete(new_client)
             db.session.commit()
             return jsonify({"msg": "Erreur lors de l'envoi de l'email. Veuillez réessayer."}), 500
@@ -0,0 +1,171 @@
+# app/commands.py
+
+import statistics
+import time
+import uuid
+
+import click
+from sqlalchemy import event
+
+from . import outbox, newsletter, stats, query_plans
+
+
+@click.command('outbox-drain')
+@click.option('--limit', type=int, default=None, help="Nombre maximum de messages à traiter.")
+def outbox_drain_command(limit):
+    """Envoie immédiatement les notifications dues de l'outbox."""
+    from flask import current_app
+    sent, failed = outbox.drain(current_app._get_current_object(), limit=limit)
+    click.echo(f"{sent} message(s) envoyé(s), {failed} en échec (re-planifiés ou abandonnés).")
+
+
+@click.command('newsletter-send')
+@click.argument('campaign_id', type=int)
+def newsletter_send_command(campaign_id):
+    """Envoie (ou reprend) une campagne newsletter jusqu'à la fin."""
+    from flask import current_app
+    sender = newsletter.CampaignSender(current_app._get_current_object())
+    while True:
+        # Les tranches s'enchaînent ici : rien n'est planifié dans l'outbox
+        finished = sender.run(campaign_id, schedule_next=False)
+        if finished is None:
+            raise click.ClickException(f"Campagne {campaign_id} déjà en cours d'envoi par un autre processus.")
+        if finished:
+            break
+    click.echo(f"Campagne {campaign_id} terminée.")
+
+
+@click.command('payments-reconcile')
+@click.option('--limit', type=int, default=None, help="Nombre maximum de commandes à traiter.")
+def payments_reconcile_command(limit):
+    """Réconcilie avec FedaPay les commandes sans transaction et les paiements en attente."""
+    from .payment.reconciliation import reconcile_stranded_orders, reconcile_pending_payments
+    results = reconcile_stranded_orders(limit=limit)
+    click.echo(f"Commandes réconciliées : {dict(results) or 'aucune'}")
+    results = reconcile_pending_payments(limit=limit)
+    click.echo(f"Paiements en attente réconciliés : {dict(results) or 'aucun'}")
+
+
+@click.command('webhooks-replay')
+@click.option('--event-id', 'event_ids', type=int, multiple=True, help="Événement(s) à rejouer.")
+@click.option('--transaction', 'transaction_id', default=None, help="Tous les événements d'une transaction FedaPay.")
+@click.option('--since-id', type=int, default=None, help="Tous les événements à partir de cet id.")
+@click.option('--inline', is_flag=True, help="Traite immédiatement au lieu de passer par l'outbox (mesure du débit).")
+def webhooks_replay_command(event_ids, transaction_id, since_id, inline):
+    """Rejoue des webhooks FedaPay enregistrés (reprise après incident, tests de charge)."""
+    from .payment.webhooks import replay_events
+    if not (event_ids or transaction_id or since_id is not None):
+        raise click.UsageError("Préciser --event-id, --transaction ou --since-id.")
+    count, elapsed = replay_events(event_ids, transaction_id, since_id, inline=inline)
+    if inline:
+        rate = count / elapsed if elapsed else 0
+        click.echo(f"{count} événement(s) rejoué(s) en {elapsed:.2f}s ({rate:.1f}/s).")
+    else:
+        click.echo(f"{count} événement(s) remis dans l'outbox.")
+
+
+@click.command('stats-backfill')
+@click.option('--since', type=click.DateTime(formats=['%Y-%m-%d']), default=None,
+              help="Premier jour à recalculer (AAAA-MM-JJ) ; tout l'historique par défaut.")
+def stats_backfill_command(since):
+    """Recalcule les statistiques quotidiennes du tableau de bord depuis les commandes."""
+    days = stats.backfill(since.date() if since else None)
+    click.echo(f"{days} jour(s) de statistiques recalculé(s).")
+
+
+@click.command('db-explain')
+@click.option('--seed-rows', type=int, default=2000, show_default=True,
+              help="Lignes du jeu de données représentatif inséré (puis annulé) avant les EXPLAIN ; 0 pour la base telle quelle.")
+def db_explain_command(seed_rows):
+    """
+    Affiche le plan (EXPLAIN) de chaque requête fréquente et échoue si l'une
+    d'elles parcourt toute une table. Sur des tables presque vides, MySQL
+    préfère souvent un parcours complet : un jeu de données représentatif
+    est donc inséré dans une transaction annulée avant les EXPLAIN.
+    """
+    try:
+        plans = query_plans.check_hot_queries(seed_rows=seed_rows)
+    except NotImplementedError as e:
+        raise click.ClickException(str(e))
+
+    failed = []
+    for name, plan in plans.items():
+        full_scan = any(scan for _, scan in plan)
+        click.echo(f"{'ÉCHEC' if full_scan else 'OK   '} {name}")
+        for description, scan in plan:
+            click.echo(f"      {description}{'  <- parcours complet' if scan else ''}")
+        if full_scan:
+            failed.append(name)
+    if failed:
+        raise click.ClickException(f"Parcours complet pour : {', '.join(failed)}")
+    click.echo(f"{len(plans)} requête(s) servie(s) par un index.")
+
+
+@click.command('cart-merge-bench')
+@click.option('--sizes', default='1,10,50', help="Tailles de panier invité à mesurer (séparées par des virgules).")
+@click.option('--repeat', type=int, default=5, help="Mesures par taille (la médiane est affichée).")
+@click.option('--yes-this-is-a-test-db', 'test_db', is_flag=True,
+              help="Confirme que la base visée est une base de test (inutile si TESTING est activé).")
+def cart_merge_bench_command(sizes, repeat, test_db):
+    """
+    Mesure la fusion du panier invité à la connexion selon la taille du
+    panier (durée médiane et nombre de requêtes SQL). Crée un client et des
+    paniers temporaires, supprimés à la fin : refuse de tourner hors d'une
+    base de test.
+    """
+    from flask import current_app
+    from .client_auth.routes import merge_guest_cart_to_user
+    from .extensions import db
+    from .models import Utilisateur, Produit, Panier
+
+    if not (current_app.testing or test_db):
+        raise click.ClickException("Ce banc d'essai écrit dans la base : relancez avec --yes-this-is-a-test-db "
+                                   "sur une base de test.")
+
+    sizes = [int(size) for size in sizes.split(',')]
+    product_ids = [row.id for row in db.session.query(Produit.id).order_by(Produit.id).limit(max(sizes))]
+    if len(product_ids) < max(sizes):
+        raise click.ClickException(f"Seulement {len(product_ids)} produit(s) en base pour un panier de {max(sizes)}.")
+
+    user = Utilisateur(nom='Bench', prenom='Panier', email=f'bench-{uuid.uuid4().hex}@example.invalid',
+                       mot_de_passe='!', role='client', statut='inactif')
+    db.session.add(user)
+    db.session.commit()
+    statements = []
+    count_statement = lambda *args: statements.append(args[2])
+    try:
+        click.echo("taille  médiane (ms)  requêtes")
+        for size in sizes:
+            durations = []
+            for _ in range(repeat):
+                # Panier client : la moitié des produits, qui entreront en conflit avec le panier invité
+                Panier.query.filter_by(utilisateur_id=user.id).delete()
+                session_id = f'bench-{uuid.uuid4().hex}'
+                db.session.add_all([Panier(utilisateur_id=user.id, produit_id=pid, quantite=1)
+                                    for pid in product_ids[:size // 2]])
+                db.session.add_all([Panier(session_id=session_id, produit_id=pid, quantite=2)
+                                    for pid in product_ids[:size]])
+                db.session.commit()
+
+                statements.clear()
+                event.listen(db.engine, 'before_cursor_execute', count_statement)
+                started = time.perf_counter()
+                merge_guest_cart_to_user(user.id, session_id)
+                durations.append(time.perf_counter() - started)
+                event.remove(db.engine, 'before_cursor_execute', count_statement)
+            click.echo(f"{size:>6}  {statistics.median(durations) * 1000:>12.2f}  {len(statements):>8}")
+    finally:
+        db.session.rollback()
+        Panier.query.filter_by(utilisateur_id=user.id).delete()
+        db.session.delete(db.session.get(Utilisateur, user.id))
+        db.session.commit()
+
+
+def init_app(app):
+    app.cli.add_command(outbox_drain_command)
+    app.cli.add_command(newsletter_send_command)
+    app.cli.add_command(payments_reconcile_command)
+    app.cli.add_command(webhooks_replay_command)
+    app.cli.add_command(stats_backfill_command)
+    app.cli.add_command(db_explain_command)
+    app.cli.add_command(cart_merge_bench_command)
@@ -0,0 +1,59 @@
+# app/eager_loading.py
+
+from sqlalchemy.orm import selectinload, joinedload
+
+from .models import Categorie, TypeProduit, Produit, Panier, Commande, DetailsCommande
+from .schemas import (
+    ProduitSchema, PanierSchema, DetailsCommandeSchema, CommandeSchema, CommandeDetailSchema
+)
+
+# --- STRATÉGIES DE CHARGEMENT PAR SCHÉMA ---
+# Chaque schéma est associé aux options de chargement qui couvrent ses champs imbriqués.
+# Les options sont indexées par le nom du champ racine : si le schéma est
+# restreint (`only=`), seules les relations réellement sérialisées sont chargées.
+
+# Le backref `categorie` pointe vers Categorie, dont `types_produits` est en lazy='joined' :
+# on coupe cette jointure inutile, seuls l'id et le nom de la catégorie sont sérialisés.
+_TYPE_PRODUIT_AVEC_CATEGORIE = joinedload(Produit.type_produit).joinedload(TypeProduit.categorie).lazyload(Categorie.types_produits)
+
+_PRODUIT_OPTIONS = {
+    'images': selectinload(Produit.images),
+    'type_produit': _TYPE_PRODUIT_AVEC_CATEGORIE,
+}
+
+_DETAILS_COMMANDE_OPTIONS = {
+    'produit': joinedload(DetailsCommande.produit).selectinload(Produit.images),
+}
+
+EAGER_OPTIONS = {
+    ProduitSchema: _PRODUIT_OPTIONS,
+    PanierSchema: {
+        'produit': joinedload(Panier.produit).options(*_PRODUIT_OPTIONS.values()),
+    },
+    DetailsCommandeSchema: _DETAILS_COMMANDE_OPTIONS,
+    CommandeSchema: {
+        'client': joinedload(Commande.client),
+        'adresse_livraison': joinedload(Commande.adresse_livraison),
+        'details': selectinload(Commande.details).options(*_DETAILS_COMMANDE_OPTIONS.values()),
+    },
+    CommandeDetailSchema: {
+        'client': joinedload(Commande.client),
+        'adresse_livraison': joinedload(Commande.adresse_livraison),
+        'details': selectinload(Commande.details).options(*_DETAILS_COMMANDE_OPTIONS.values()),
+        'suivi': selectinload(Commande.suivi),
+    },
+}
+
+
+def options_for(schema):
+    """Retourne les options de chargement nécessaires pour sérialiser `schema`."""
+    options = EAGER_OPTIONS.get(type(schema), {})
+    if schema.only is None:
+        return list(options.values())
+    roots = {name.split('.')[0] for name in schema.only}
+    return [option for field, option in options.items() if field in roots]
+
+
+def eager(query, schema):
+    """Applique à `query` les options de chargement associées à `schema`."""
+    return query.options(*options_for(schema))
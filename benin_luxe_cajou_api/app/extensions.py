@@ -3,9 +3,11 @@ from flask_migrate import Migrate
 from flask_jwt_extended import JWTManager
 from flask_marshmallow import Marshmallow
 from flask_mail import Mail
+from .cache_backends import Cache
 
 db = SQLAlchemy()
 migrate = Migrate()
 jwt = JWTManager()
 ma = Marshmallow()
-mail = Mail()
\ No newline at end of file
+mail = Mail()
+cache = Cache()
\ No newline at end of file
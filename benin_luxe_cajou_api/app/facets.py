@@ -0,0 +1,184 @@
+# app/facets.py
+
+import bisect
+import threading
+from collections import defaultdict
+from decimal import Decimal, InvalidOperation
+
+from .cache import get_version
+from .extensions import db
+from .models import TypeProduit, Produit
+
+# Tranches utilisées pour les facettes (bornes basses incluses)
+QUANTITE_BUCKETS = [(0, '0-249'), (250, '250-499'), (500, '500-999'), (1000, '1000+')]
+PRIX_BUCKETS = [(0, '0-2499'), (2500, '2500-4999'), (5000, '5000-9999'), (10000, '10000+')]
+
+FACET_DIMENSIONS = ('category_id', 'type_id', 'type_contenant', 'quantite', 'prix', 'en_stock')
+
+
+def _bucket(value, buckets):
+    label = buckets[0][1]
+    for lower, bucket_label in buckets:
+        if value >= lower:
+            label = bucket_label
+    return label
+
+
+def _en_stock(row):
+    return row.gestion_stock == 'illimite' or (row.stock_disponible or 0) > 0
+
+
+def parse_facet_filters(args):
+    """
+    Extrait les filtres à facettes des paramètres d'URL.
+    Retourne (filtres, (prix_min, prix_max)) ; les valeurs multiples d'une
+    même dimension sont séparées par des virgules (ex: quantite=250-499,500-999).
+    Lève ValueError si une valeur est invalide.
+    """
+    filters = {}
+    for dimension in ('category_id', 'type_id', 'type_contenant', 'quantite'):
+        raw = args.get(dimension)
+        if not raw:
+            continue
+        values = {v.strip() for v in raw.split(',') if v.strip()}
+        if dimension in ('category_id', 'type_id'):
+            try:
+                values = {int(v) for v in values}
+            except ValueError:
+                raise ValueError(f"Valeur invalide pour {dimension}")
+        filters[dimension] = values
+
+    if args.get('en_stock', '').lower() in ('1', 'true', 'oui'):
+        filters['en_stock'] = {'oui'}
+
+    try:
+        prix_min = Decimal(args['prix_min']) if args.get('prix_min') else None
+        prix_max = Decimal(args['prix_max']) if args.get('prix_max') else None
+    except InvalidOperation:
+        raise ValueError("Fourchette de prix invalide")
+    return filters, (prix_min, prix_max)
+
+
+class ProductFacetIndex:
+    """
+    Index de facettes précalculé sur les produits actifs.
+    Chaque valeur de facette est un bitset (entier Python) dont le bit i
+    correspond au i-ème produit actif : filtrer revient à intersecter des
+    bitsets et compter à un popcount. L'index est reconstruit lorsque la
+    version du catalogue change ; après un simple mouvement de stock
+    (espace 'stock'), seule la facette en_stock est recalculée.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._version = None
+        self._stock_version = None
+        self._ids = []
+        self._all = 0
+        self._bitsets = {}
+        self._prices = []   # [(prix, position)] trié par prix
+
+    def _refresh(self):
+        version = get_version('catalogue')
+        stock_version = get_version('stock')
+        # Cache indisponible (version None) : reconstruction à chaque appel
+        if version is not None and version == self._version:
+            if stock_version is None or stock_version != self._stock_version:
+                self._refresh_stock()
+                self._stock_version = stock_version
+            return
+        rows = db.session.query(
+            Produit.id,
+            Produit.type_produit_id,
+            TypeProduit.category_id,
+            Produit.type_contenant,
+            Produit.quantite_contenant,
+            Produit.prix_unitaire,
+            Produit.gestion_stock,
+            Produit.stock_disponible,
+        ).join(TypeProduit, Produit.type_produit_id == TypeProduit.id
+        ).filter(Produit.statut == 'actif').order_by(Produit.id).all()
+
+        bitsets = {dimension: defaultdict(int) for dimension in FACET_DIMENSIONS}
+        prices = []
+        for position, row in enumerate(rows):
+            bit = 1 << position
+            bitsets['category_id'][row.category_id] |= bit
+            bitsets['type_id'][row.type_produit_id] |= bit
+            bitsets['type_contenant'][row.type_contenant] |= bit
+            bitsets['quantite'][_bucket(row.quantite_contenant, QUANTITE_BUCKETS)] |= bit
+            bitsets['prix'][_bucket(row.prix_unitaire, PRIX_BUCKETS)] |= bit
+            bitsets['en_stock']['oui' if _en_stock(row) else 'non'] |= bit
+            prices.append((row.prix_unitaire, position))
+
+        self._ids = [row.id for row in rows]
+        self._all = (1 << len(rows)) - 1
+        self._bitsets = {dimension: dict(values) for dimension, values in bitsets.items()}
+        self._prices = sorted(prices)
+        self._version = version
+        self._stock_version = stock_version
+
+    def _refresh_stock(self):
+        """Recalcule la facette en_stock des produits indexés (une requête sur deux colonnes)."""
+        positions = {product_id: position for position, product_id in enumerate(self._ids)}
+        rows = db.session.query(Produit.id, Produit.gestion_stock, Produit.stock_disponible).filter(
+            Produit.statut == 'actif').all()
+        en_stock = {'oui': 0, 'non': 0}
+        for row in rows:
+            position = positions.get(row.id)
+            if position is not None:
+                en_stock['oui' if _en_stock(row) else 'non'] |= 1 << position
+        self._bitsets['en_stock'] = {value: mask for value, mask in en_stock.items() if mask}
+
+    def _price_mask(self, prix_min, prix_max):
+        if prix_min is None and prix_max is None:
+            return self._all
+        lo = 0 if prix_min is None else bisect.bisect_left(self._prices, (prix_min, -1))
+        hi = len(self._prices) if prix_max is None else bisect.bisect_right(self._prices, (prix_max, len(self._prices)))
+        mask = 0
+        for _, position in self._prices[lo:hi]:
+            mask |= 1 << position
+        return mask
+
+    def _dimension_mask(self, dimension, values):
+        mask = 0
+        for value in values:
+            mask |= self._bitsets[dimension].get(value, 0)
+        return mask
+
+    def query(self, filters, price_range=(None, None), with_counts=False):
+        """
+        Retourne (ids_correspondants, compteurs). Les compteurs d'une dimension
+        sont calculés avec tous les filtres SAUF le sien, pour que chaque valeur
+        indique combien de produits on obtiendrait en la sélectionnant.
+        """
+        with self._lock:
+            self._refresh()
+            masks = {dimension: self._dimension_mask(dimension, values) for dimension, values in filters.items()}
+            price_mask = self._price_mask(*price_range)
+
+            matched = self._all & price_mask
+            for mask in masks.values():
+                matched &= mask
+
+            counts = None
+            if with_counts:
+                counts = {}
+                for dimension in FACET_DIMENSIONS:
+                    # La fourchette de prix est le filtre propre à la dimension 'prix'
+                    base = self._all if dimension == 'prix' else self._all & price_mask
+                    for other, mask in masks.items():
+                        if other != dimension:
+                            base &= mask
+                    counts[dimension] = {
+                        str(value): (bitset & base).bit_count()
+                        for value, bitset in self._bitsets[dimension].items()
+                    }
+
+            # bin() donne les bits du poids fort au poids faible : on l'inverse
+            bits = bin(matched)[:1:-1]
+            ids = [self._ids[position] for position, bit in enumerate(bits) if bit == '1']
+        return ids, counts
+
+
+product_facet_index = ProductFacetIndex()
@@ -1,6 +1,7 @@
 # app/models.py
 
 import bcrypt
+from datetime import datetime
 from .extensions import db
 from sqlalchemy.orm import relationship
 
@@ -24,6 +25,10 @@ class Utilisateur(db.Model):
     notifications = relationship('Notification', backref='utilisateur', lazy=True, cascade="all, delete-orphan")
     paniers = relationship('Panier', backref='utilisateur', lazy=True, cascade="all, delete-orphan")
     avis = relationship('AvisProduit', backref='utilisateur', lazy=True, cascade="all, delete-orphan")
+    __table_args__ = (
+        # Nouveaux clients par période (tableau de bord, recalcul des statistiques)
+        db.Index('ix_utilisateurs_role_date_creation', 'role', 'date_creation'),
+    )
     def set_password(self, password):
         pw_hash = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt())
         self.mot_de_passe = pw_hash.decode('utf-8')
@@ -78,6 +83,10 @@ class Produit(db.Model):
     date_modification = db.Column(db.TIMESTAMP, server_default=db.func.current_timestamp(), onupdate=db.func.current_timestamp())
     images = relationship('ImageProduit', backref='produit', lazy=True, cascade="all, delete-orphan")
     avis = relationship('AvisProduit', backref='produit', lazy=True, cascade="all, delete-orphan")
+    __table_args__ = (
+        # Catalogue public : produits actifs d'un type
+        db.Index('ix_produits_statut_type_produit_id', 'statut', 'type_produit_id'),
+    )
 
 class ImageProduit(db.Model):
     __tablename__ = 'images_produits'
@@ -125,6 +134,12 @@ class Commande(db.Model):
     date_livraison_prevue = db.Column(db.Date)
     date_livraison_effective = db.Column(db.DateTime)
     date_modification = db.Column(db.TIMESTAMP, server_default=db.func.current_timestamp(), onupdate=db.func.current_timestamp())
+    __table_args__ = (
+        # Historique d'un client ; commandes par paiement et période ; liste admin par date
+        db.Index('ix_commandes_utilisateur_id_statut_date_commande', 'utilisateur_id', 'statut', 'date_commande'),
+        db.Index('ix_commandes_statut_paiement_date_commande', 'statut_paiement', 'date_commande'),
+        db.Index('ix_commandes_date_commande', 'date_commande'),
+    )
     details = relationship('DetailsCommande', back_populates='commande', cascade="all, delete-orphan")
     suivi = relationship('SuiviCommande', backref='commande', lazy=True, cascade="all, delete-orphan")
     paiements = relationship('Paiement', backref='commande', lazy=True, cascade="all, delete-orphan")
@@ -140,6 +155,9 @@ class DetailsCommande(db.Model):
     prix_unitaire = db.Column(db.Numeric(10, 2), nullable=False)
     sous_total = db.Column(db.Numeric(10, 2), nullable=False)
     date_creation = db.Column(db.TIMESTAMP, server_default=db.func.current_timestamp())
+    __table_args__ = (
+        db.Index('ix_details_commande_commande_id', 'commande_id'),
+    )
     commande = relationship('Commande', back_populates='details')
     produit = relationship('Produit')
 
@@ -165,6 +183,12 @@ class Paiement(db.Model):
     callback_data = db.Column(db.JSON)
     date_creation = db.Column(db.TIMESTAMP, server_default=db.func.current_timestamp())
     date_paiement = db.Column(db.TIMESTAMP)
+    __table_args__ = (
+        # Webhooks et suivi de statut ; paiements d'une commande ; réconciliation des paiements en attente
+        db.Index('ix_paiements_fedapay_transaction_id', 'fedapay_transaction_id'),
+        db.Index('ix_paiements_commande_id', 'commande_id'),
+        db.Index('ix_paiements_statut_id', 'statut', 'id'),
+    )
 
 class Notification(db.Model):
     __tablename__ = 'notifications'
@@ -187,6 +211,11 @@ class Panier(db.Model):
     # <<<--- CORRECTION : Ajout des champs de date manquants
     date_ajout = db.Column(db.TIMESTAMP, server_default=db.func.current_timestamp())
     date_modification = db.Column(db.TIMESTAMP, server_default=db.func.current_timestamp(), onupdate=db.func.current_timestamp())
+    __table_args__ = (
+        # Une ligne par produit dans le panier d'un client (NULL pour les invités : non concernés)
+        db.UniqueConstraint('utilisateur_id', 'produit_id', name='uq_paniers_utilisateur_id_produit_id'),
+        db.Index('ix_paniers_session_id', 'session_id'),
+    )
     produit = relationship('Produit')
 
 class AvisProduit(db.Model):
@@ -242,6 +271,138 @@ class NewsletterSubscription(db.Model):
     is_active = db.Column(db.Boolean, default=True)
 
 
+class NewsletterCampaign(db.Model):
+    """
+    Envoi groupé d'un email aux abonnés de la newsletter.
+    Le contenu est rendu une seule fois à la création ; `dernier_abonne_id`
+    mémorise la progression pour reprendre après un crash sans renvoyer.
+    Un seul expéditeur à la fois : celui qui détient le bail (`verrouille_par`
+    jusqu'à `verrouille_jusqu_a`), renouvelé à chaque lot.
+    """
+    __tablename__ = 'newsletter_campaigns'
+    id = db.Column(db.Integer, primary_key=True)
+    type = db.Column(db.String(50), nullable=False)
+    produit_id = db.Column(db.Integer, db.ForeignKey('produits.id', ondelete='SET NULL'))
+    sujet = db.Column(db.String(255), nullable=False)
+    contenu_html = db.Column(db.Text, nullable=False)
+    statut = db.Column(db.Enum('en_attente', 'en_cours', 'terminee'), nullable=False, default='en_attente')
+    dernier_abonne_id = db.Column(db.Integer, nullable=False, default=0)
+    nb_envoyes = db.Column(db.Integer, nullable=False, default=0)
+    nb_echecs = db.Column(db.Integer, nullable=False, default=0)
+    date_creation = db.Column(db.TIMESTAMP, server_default=db.func.current_timestamp())
+    date_debut = db.Column(db.DateTime)
+    date_fin = db.Column(db.DateTime)
+    verrouille_par = db.Column(db.String(64))
+    verrouille_jusqu_a = db.Column(db.DateTime)
+
+
+class OutboxMessage(db.Model):
+    """
+    Notification sortante (email, push) à envoyer en arrière-plan.
+    Écrite dans la même transaction que le changement qui la déclenche :
+    si le commit réussit, elle sera envoyée, même après un crash.
+    """
+    __tablename__ = 'outbox_messages'
+    id = db.Column(db.Integer, primary_key=True)
+    type = db.Column(db.String(50), nullable=False)
+    payload = db.Column(db.JSON, nullable=False)
+    statut = db.Column(db.Enum('en_attente', 'en_cours', 'envoye', 'echoue'), nullable=False, default='en_attente')
+    tentatives = db.Column(db.Integer, nullable=False, default=0)
+    # Horodatages en UTC (comparés à datetime.utcnow() par le dispatcher)
+    prochaine_tentative = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    verrouille_jusqu_a = db.Column(db.DateTime)
+    derniere_erreur = db.Column(db.Text)
+    date_creation = db.Column(db.TIMESTAMP, server_default=db.func.current_timestamp())
+    date_envoi = db.Column(db.DateTime)
+    __table_args__ = (
+        db.Index('ix_outbox_statut_prochaine_tentative', 'statut', 'prochaine_tentative'),
+    )
+
+
+class ConfirmationPaiement(db.Model):
+    """
+    Trace de la confirmation d'une transaction FedaPay. La contrainte d'unicité
+    garantit qu'un paiement n'est traité qu'une fois (stock, panier,
+    notifications), quel que soit le canal qui le confirme.
+    """
+    __tablename__ = 'confirmations_paiement'
+    id = db.Column(db.Integer, primary_key=True)
+    fedapay_transaction_id = db.Column(db.String(100), unique=True, nullable=False)
+    commande_id = db.Column(db.Integer, db.ForeignKey('commandes.id', ondelete='CASCADE'), nullable=False)
+    source = db.Column(db.Enum('webhook', 'statut', 'reconciliation'), nullable=False)
+    date_creation = db.Column(db.TIMESTAMP, server_default=db.func.current_timestamp())
+
+
+class EvenementWebhook(db.Model):
+    """
+    Événement webhook FedaPay tel que reçu (journal en ajout seul) : le
+    contenu n'est jamais modifié, seul l'état de traitement évolue. Permet
+    de rejouer les événements (reprise après incident, tests de charge).
+    """
+    __tablename__ = 'evenements_webhook'
+    id = db.Column(db.Integer, primary_key=True)
+    nom = db.Column(db.String(100), nullable=False)
+    fedapay_transaction_id = db.Column(db.String(100), index=True)
+    payload = db.Column(db.JSON, nullable=False)
+    statut = db.Column(db.Enum('recu', 'traite', 'ignore'), nullable=False, default='recu')
+    derniere_erreur = db.Column(db.Text)
+    date_reception = db.Column(db.TIMESTAMP, server_default=db.func.current_timestamp())
+    date_traitement = db.Column(db.DateTime)
+
+
+class StockReservation(db.Model):
+    """
+    Quantité d'un produit retenue pour une commande en attente de paiement.
+    Le stock est décrémenté dès la réservation ; il est rendu si elle expire
+    ou si la commande est annulée, et définitivement acquis au paiement.
+    """
+    __tablename__ = 'reservations_stock'
+    id = db.Column(db.Integer, primary_key=True)
+    commande_id = db.Column(db.Integer, db.ForeignKey('commandes.id', ondelete='CASCADE'), nullable=False)
+    produit_id = db.Column(db.Integer, db.ForeignKey('produits.id'), nullable=False)
+    quantite = db.Column(db.Integer, nullable=False)
+    statut = db.Column(db.Enum('active', 'consommee', 'liberee', 'expiree'), nullable=False, default='active')
+    # Horodatage en UTC (comparé à datetime.utcnow() par la tâche d'expiration)
+    expire_le = db.Column(db.DateTime, nullable=False)
+    date_creation = db.Column(db.TIMESTAMP, server_default=db.func.current_timestamp())
+    __table_args__ = (
+        db.Index('ix_reservations_stock_statut_expire_le', 'statut', 'expire_le'),
+        db.Index('ix_reservations_stock_commande_id', 'commande_id'),
+    )
+
+
+class StatistiqueJournaliere(db.Model):
+    """
+    Agrégats du tableau de bord par jour de commande (ou d'inscription pour
+    les clients), tenus à jour à chaque changement d'état d'une commande.
+    Le détail est dans app/stats.py ; `flask stats-backfill` les recalcule.
+    """
+    __tablename__ = 'statistiques_journalieres'
+    jour = db.Column(db.Date, primary_key=True)
+    chiffre_affaires = db.Column(db.Numeric(12, 2), nullable=False, server_default='0')
+    commandes_payees = db.Column(db.Integer, nullable=False, server_default='0')
+    # Nombre de commandes du jour dans chaque statut
+    commandes_en_attente = db.Column(db.Integer, nullable=False, server_default='0')
+    commandes_confirmee = db.Column(db.Integer, nullable=False, server_default='0')
+    commandes_en_preparation = db.Column(db.Integer, nullable=False, server_default='0')
+    commandes_expedie = db.Column(db.Integer, nullable=False, server_default='0')
+    commandes_livree = db.Column(db.Integer, nullable=False, server_default='0')
+    commandes_annulee = db.Column(db.Integer, nullable=False, server_default='0')
+    nouveaux_clients = db.Column(db.Integer, nullable=False, server_default='0')
+    date_modification = db.Column(db.TIMESTAMP, server_default=db.func.current_timestamp(), onupdate=db.func.current_timestamp())
+
+
+class TachePlanifiee(db.Model):
+    """
+    Réservation d'une tâche périodique en base, utilisée par le planificateur
+    (app/background.py) quand le cache partagé est indisponible : le worker
+    qui pose `verrouille_jusqu_a` par compare-and-swap exécute l'échéance.
+    """
+    __tablename__ = 'taches_planifiees'
+    nom = db.Column(db.String(100), primary_key=True)
+    verrouille_jusqu_a = db.Column(db.DateTime, nullable=True)
+
+
 
 
 
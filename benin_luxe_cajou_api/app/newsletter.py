@@ -0,0 +1,301 @@
+# app/newsletter.py
+
+import os
+import smtplib
+import socket
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from flask import current_app
+from flask_mail import Message
+from sqlalchemy import func, or_, select, update
+
+from . import outbox
+from .extensions import db, mail
+from .models import NewsletterCampaign, NewsletterSubscription, Produit
+
+# Erreurs de connexion : on rouvre la session SMTP et on renvoie une fois.
+# (SMTPException hérite d'OSError : OSError ne peut pas figurer ici.)
+_CONNECTION_ERRORS = (smtplib.SMTPServerDisconnected, smtplib.SMTPConnectError, ConnectionError, socket.timeout)
+
+# Refus d'un message par le serveur (adresse, expéditeur, contenu) : la
+# session reste valide, le destinataire est compté en échec sans renvoi
+_REFUSED_ERRORS = (smtplib.SMTPRecipientsRefused, smtplib.SMTPSenderRefused, smtplib.SMTPDataError)
+
+
+class CampaignBusy(Exception):
+    """La campagne est déjà envoyée par un autre expéditeur (l'outbox retentera)."""
+
+
+# --- CRÉATION DES CAMPAGNES ---
+
+def render_new_product_email(product):
+    """Retourne (sujet, html) de l'annonce d'un nouveau produit."""
+    # On récupère l'image principale du produit
+    main_image = next((img.url_image for img in product.images if img.est_principale), None)
+    subject = f"Nouveau Produit : Découvrez notre {product.nom} !"
+    html = f"""
+                <div style="font-family: Arial, sans-serif;">
+                    <h3>Un nouveau délice est arrivé !</h3>
+                    <p>Bonjour,</p>
+                    <p>Nous avons le plaisir de vous présenter notre nouveau produit : <strong>{product.nom}</strong>.</p>
+
+                    {'<img src="' + main_image + '" alt="' + product.nom + '" style="max-width: 100%; height: auto;"/>' if main_image else ''}
+
+                    <p>{product.description or ''}</p>
+                    <p><strong>Prix :</strong> {product.prix_unitaire} FCFA</p>
+                    <a href="https://VOTRE_SITE_WEB_URL/products/{product.id}" style="...">Voir le produit</a>
+                </div>
+                """
+    return subject, html
+
+
+def create_new_product_campaign(product):
+    """
+    Crée la campagne d'annonce d'un produit et planifie son envoi via l'outbox,
+    dans la transaction en cours. Le contenu est rendu une seule fois ici.
+    """
+    subject, html = render_new_product_email(product)
+    campaign = NewsletterCampaign(type='nouveau_produit', produit_id=product.id, sujet=subject, contenu_html=html)
+    db.session.add(campaign)
+    db.session.flush()
+    outbox.enqueue('newsletter_campaign', campaign_id=campaign.id)
+    return campaign
+
+
+# --- ENVOI ---
+
+class RateLimiter:
+    """Limite le débit global d'envoi (messages/seconde), partagé entre les threads."""
+
+    def __init__(self, rate_per_second):
+        self.interval = 1.0 / rate_per_second if rate_per_second else 0
+        self._lock = threading.Lock()
+        self._next = time.monotonic()
+
+    def wait(self):
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            slot = max(self._next, now)
+            self._next = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+class PooledSmtpConnection:
+    """
+    Session SMTP (Flask-Mail) réutilisée pour de nombreux messages.
+    Elle est renouvelée tous les `max_messages` envois, et rouverte
+    automatiquement si le serveur coupe la connexion.
+    """
+
+    def __init__(self, max_messages, timeout=None):
+        self.max_messages = max_messages
+        self.timeout = timeout
+        self._conn = None
+        self._count = 0
+
+    def _open(self):
+        self.close()
+        self._conn = mail.connect()
+        self._conn.__enter__()
+        # Flask-Mail n'impose aucun délai : un serveur muet bloquerait le thread
+        if self._conn.host is not None and self.timeout:
+            self._conn.host.sock.settimeout(self.timeout)
+        self._count = 0
+
+    def close(self):
+        if self._conn is not None:
+            try:
+                self._conn.__exit__(None, None, None)
+            except Exception:
+                pass
+        self._conn = None
+
+    def send(self, message):
+        if self._conn is None or self._count >= self.max_messages:
+            self._open()
+        try:
+            self._conn.send(message)
+        except _REFUSED_ERRORS:
+            self._count += 1
+            raise
+        except _CONNECTION_ERRORS:
+            self._open()
+            self._conn.send(message)
+        self._count += 1
+
+
+class CampaignSender:
+    """
+    Envoie une campagne par lots : les abonnés sont lus par fenêtres successives
+    (id > dernier id traité), chaque lot est réparti entre
+    NEWSLETTER_SMTP_CONNECTIONS sessions SMTP parallèles sous un débit maximum,
+    puis la progression est enregistrée. Aucun curseur ne reste ouvert pendant
+    les envois SMTP. Après un crash, seul le lot en cours peut être renvoyé.
+    La campagne est réservée par compare-and-swap avant tout envoi : un
+    worker et la commande `flask newsletter-send` ne l'envoient jamais
+    en même temps.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        config = app.config
+        self.chunk_size = config['NEWSLETTER_CHUNK_SIZE']
+        self.time_budget = config['NEWSLETTER_TIME_BUDGET']
+        self.lease_seconds = config['NEWSLETTER_LEASE_SECONDS']
+        self.owner = f'{socket.gethostname()[:40]}:{os.getpid()}:{uuid.uuid4().hex[:8]}'
+        self.limiter = RateLimiter(config['NEWSLETTER_RATE_PER_SECOND'])
+        self.connections = [PooledSmtpConnection(config['NEWSLETTER_MESSAGES_PER_CONNECTION'],
+                                                 timeout=config['NEWSLETTER_SMTP_TIMEOUT'])
+                            for _ in range(config['NEWSLETTER_SMTP_CONNECTIONS'])]
+
+    def _send_slice(self, connection, campaign, rows):
+        sent, failed = 0, 0
+        with self.app.app_context():
+            for row in rows:
+                self.limiter.wait()
+                message = Message(subject=campaign['sujet'], recipients=[row.email], html=campaign['contenu_html'])
+                try:
+                    connection.send(message)
+                    sent += 1
+                except _REFUSED_ERRORS as e:
+                    failed += 1
+                    current_app.logger.warning(f"Newsletter {campaign['id']}: {row.email} refusé par le serveur: {e}")
+                except Exception as e:
+                    failed += 1
+                    current_app.logger.warning(f"Newsletter {campaign['id']}: échec d'envoi à {row.email}: {e}")
+        return sent, failed
+
+    def _next_chunk(self, after_id):
+        rows = db.session.execute(
+            select(NewsletterSubscription.id, NewsletterSubscription.email).where(
+                NewsletterSubscription.is_active.is_(True),
+                NewsletterSubscription.id > after_id,
+            ).order_by(NewsletterSubscription.id).limit(self.chunk_size)
+        ).all()
+        db.session.commit()
+        return rows
+
+    def _lease_until(self):
+        return datetime.utcnow() + timedelta(seconds=self.lease_seconds)
+
+    def _claim(self, campaign_id):
+        """
+        Réserve la campagne par compare-and-swap : libre, déjà à nous, ou bail
+        expiré (expéditeur mort). Retourne True si la réservation a abouti.
+        """
+        now = datetime.utcnow()
+        claimed = db.session.execute(update(NewsletterCampaign).where(
+            NewsletterCampaign.id == campaign_id,
+            NewsletterCampaign.statut != 'terminee',
+            or_(NewsletterCampaign.verrouille_par.is_(None),
+                NewsletterCampaign.verrouille_par == self.owner,
+                NewsletterCampaign.verrouille_jusqu_a < now),
+        ).values(
+            statut='en_cours',
+            date_debut=func.coalesce(NewsletterCampaign.date_debut, now),
+            verrouille_par=self.owner,
+            verrouille_jusqu_a=self._lease_until(),
+        )).rowcount
+        db.session.commit()
+        return claimed == 1
+
+    def _checkpoint(self, campaign_id, last_id, sent, failed):
+        """Enregistre la progression et renouvelle le bail. Retourne False si le bail a été perdu."""
+        updated = db.session.execute(update(NewsletterCampaign).where(
+            NewsletterCampaign.id == campaign_id,
+            NewsletterCampaign.verrouille_par == self.owner,
+        ).values(
+            dernier_abonne_id=last_id,
+            nb_envoyes=NewsletterCampaign.nb_envoyes + sent,
+            nb_echecs=NewsletterCampaign.nb_echecs + failed,
+            verrouille_jusqu_a=self._lease_until(),
+        )).rowcount
+        db.session.commit()
+        return updated == 1
+
+    def run(self, campaign_id, schedule_next=True):
+        """
+        Envoie la suite de la campagne pendant au plus NEWSLETTER_TIME_BUDGET
+        secondes. Retourne True si la campagne est terminée, False s'il reste
+        des abonnés (la tranche suivante est planifiée dans l'outbox si
+        `schedule_next`), None si un autre expéditeur détient la campagne.
+        """
+        campaign = db.session.get(NewsletterCampaign, campaign_id)
+        if campaign is None or campaign.statut == 'terminee':
+            return True
+        if not self._claim(campaign_id):
+            db.session.expire(campaign)
+            if campaign.statut == 'terminee':
+                return True
+            current_app.logger.info(f"Newsletter {campaign_id} déjà en cours d'envoi par {campaign.verrouille_par}")
+            return None
+        db.session.refresh(campaign)
+        snapshot = {'id': campaign.id, 'sujet': campaign.sujet, 'contenu_html': campaign.contenu_html}
+        last_id = campaign.dernier_abonne_id
+
+        deadline = time.monotonic() + self.time_budget
+        finished = True
+        lease_lost = False
+        pool = ThreadPoolExecutor(max_workers=len(self.connections), thread_name_prefix='newsletter')
+        try:
+            while True:
+                chunk = self._next_chunk(last_id)
+                if not chunk:
+                    break
+                last_id = chunk[-1].id
+                slices = [chunk[i::len(self.connections)] for i in range(len(self.connections))]
+                futures = [pool.submit(self._send_slice, connection, snapshot, rows)
+                           for connection, rows in zip(self.connections, slices) if rows]
+                results = [future.result() for future in futures]
+                if not self._checkpoint(campaign_id, last_id,
+                                        sum(r[0] for r in results), sum(r[1] for r in results)):
+                    # Bail expiré et repris par un autre expéditeur : on s'arrête
+                    lease_lost = True
+                    break
+                if time.monotonic() >= deadline:
+                    finished = False
+                    break
+        finally:
+            pool.shutdown(wait=True)
+            for connection in self.connections:
+                connection.close()
+            db.session.rollback()
+
+        if lease_lost:
+            current_app.logger.warning(f"Newsletter {campaign_id}: bail perdu, envoi interrompu")
+            return None
+        campaign = db.session.get(NewsletterCampaign, campaign_id)
+        if finished:
+            campaign.statut = 'terminee'
+            campaign.date_fin = datetime.utcnow()
+            current_app.logger.info(
+                f"Newsletter {campaign.id} terminée : {campaign.nb_envoyes} envoyés, {campaign.nb_echecs} échecs.")
+        elif schedule_next:
+            # Tranche suivante : jamais plus longue que le bail de l'outbox
+            outbox.enqueue('newsletter_campaign', campaign_id=campaign.id)
+        campaign.verrouille_par = None
+        campaign.verrouille_jusqu_a = None
+        db.session.commit()
+        return finished
+
+
+@outbox.handler('newsletter_campaign')
+def handle_newsletter_campaign(campaign_id):
+    if CampaignSender(current_app._get_current_object()).run(campaign_id) is None:
+        raise CampaignBusy(f"Campagne {campaign_id} déjà en cours d'envoi")
+
+
+@outbox.handler('new_product_email')
+def handle_new_product_email(product_id):
+    # Messages mis en file avant l'introduction des campagnes
+    product = db.session.get(Produit, product_id)
+    if product:
+        create_new_product_campaign(product)
+        db.session.commit()
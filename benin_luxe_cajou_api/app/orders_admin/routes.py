@@ -1,41 +1,194 @@
 # app/orders_admin/routes.py
 
-from flask import Blueprint, request, jsonify
+import csv
+import io
+import json
+from datetime import date, datetime, timedelta
+from decimal import Decimal, InvalidOperation
+
+from flask import Blueprint, request, jsonify, Response, stream_with_context
 from flask_jwt_extended import jwt_required, get_jwt_identity
-from app.models import Commande, Utilisateur, SuiviCommande, DetailsCommande, Produit
+from app.models import Commande, Utilisateur, SuiviCommande, DetailsCommande, Produit, AdresseLivraison, ZoneLivraison
 from app.extensions import db
-from app.schemas import commandes_schema, commande_schema, utilisateur_schema, utilisateurs_schema
+from app.schemas import commande_schema, commandes_summary_schema, utilisateur_schema, utilisateurs_schema
 from app.admin.admin_auth import admin_required
 from app.utils import send_status_update_email
+from app.eager_loading import eager
+from app.statement_budget import statement_budget
+from app import outbox, stock, stats
+from app.pagination import DEFAULT_PAGE_SIZE, KeysetOrder, paginate_keyset, parse_limit
 
 orders_admin_bp = Blueprint('orders_admin', __name__)
 
+
+@outbox.handler('order_status_email')
+def handle_order_status_email(order_id, statut):
+    commande = db.session.get(Commande, order_id)
+    if commande:
+        send_status_update_email(commande, statut)
+
+
 # --- GESTION DES COMMANDES ---
 
+# Liste admin : plus récentes d'abord, l'id départage les égalités
+ADMIN_ORDERS_ORDER = KeysetOrder([Commande.date_commande, Commande.id], [datetime.fromisoformat, int])
+# Lignes lues par lot lors d'un export (mémoire constante quel que soit le volume)
+EXPORT_BATCH_SIZE = 500
+EXPORT_COLUMNS = ('id', 'numero_commande', 'date_commande', 'statut', 'statut_paiement', 'total',
+                  'client_id', 'client_prenom', 'client_nom', 'client_email', 'ville')
+
+
+def _parse_date(value, name):
+    try:
+        return date.fromisoformat(value)
+    except ValueError:
+        raise ValueError(f"Paramètre '{name}' invalide (format AAAA-MM-JJ)")
+
+
+def _parse_amount(value, name):
+    try:
+        return Decimal(value)
+    except InvalidOperation:
+        raise ValueError(f"Paramètre '{name}' invalide")
+
+
+def _parse_choice(value, column, name):
+    if value not in column.type.enums:
+        raise ValueError(f"Paramètre '{name}' invalide. Valeurs possibles : {', '.join(column.type.enums)}")
+    return value
+
+
+def admin_orders_query(args):
+    """
+    Projection des commandes pour la liste admin : colonnes de la commande,
+    du client et de la ville de livraison, en une requête jointe. Filtres :
+    statut, statut_paiement, date_debut / date_fin (AAAA-MM-JJ, inclusives),
+    total_min / total_max, client_id, zone_id (villes de la zone) et ville.
+    Lève ValueError si un filtre est invalide.
+    """
+    query = db.session.query(
+        Commande.id, Commande.numero_commande, Commande.date_commande, Commande.statut,
+        Commande.statut_paiement, Commande.total, Commande.utilisateur_id,
+        Utilisateur.prenom, Utilisateur.nom, Utilisateur.email, AdresseLivraison.ville
+    ).join(Utilisateur, Commande.utilisateur_id == Utilisateur.id
+    ).join(AdresseLivraison, Commande.adresse_livraison_id == AdresseLivraison.id)
+
+    if args.get('statut'):
+        query = query.filter(Commande.statut == _parse_choice(args['statut'], Commande.statut, 'statut'))
+    if args.get('statut_paiement'):
+        query = query.filter(Commande.statut_paiement == _parse_choice(
+            args['statut_paiement'], Commande.statut_paiement, 'statut_paiement'))
+    # Bornes sur la colonne elle-même (et non DATE(date_commande)) : l'index reste utilisable
+    if args.get('date_debut'):
+        query = query.filter(Commande.date_commande >= _parse_date(args['date_debut'], 'date_debut'))
+    if args.get('date_fin'):
+        query = query.filter(Commande.date_commande < _parse_date(args['date_fin'], 'date_fin') + timedelta(days=1))
+    if args.get('total_min'):
+        query = query.filter(Commande.total >= _parse_amount(args['total_min'], 'total_min'))
+    if args.get('total_max'):
+        query = query.filter(Commande.total <= _parse_amount(args['total_max'], 'total_max'))
+    if args.get('client_id'):
+        query = query.filter(Commande.utilisateur_id == args.get('client_id', type=int))
+    if args.get('zone_id'):
+        zone = db.session.get(ZoneLivraison, args.get('zone_id', type=int))
+        if zone is None:
+            raise ValueError("Zone de livraison inconnue")
+        villes = [ville.strip() for ville in (zone.villes or '').split(',') if ville.strip()]
+        query = query.filter(AdresseLivraison.ville.in_(villes))
+    if args.get('ville'):
+        query = query.filter(AdresseLivraison.ville == args['ville'])
+    return query
+
+
+def _order_row(row):
+    """Ligne de la liste admin (même forme que commandes_schema, plus le paiement et la ville)."""
+    return {
+        "id": row.id,
+        "numero_commande": row.numero_commande,
+        "client": {"prenom": row.prenom, "nom": row.nom},
+        "total": str(row.total),
+        "statut": row.statut,
+        "statut_paiement": row.statut_paiement,
+        "date_commande": row.date_commande.isoformat() if row.date_commande else None,
+        "ville": row.ville,
+    }
+
+
+def _export_values(row):
+    return (row.id, row.numero_commande, row.date_commande.isoformat() if row.date_commande else '',
+            row.statut, row.statut_paiement, str(row.total), row.utilisateur_id,
+            row.prenom, row.nom, row.email, row.ville)
+
+
+def _stream_export(query, export_format):
+    """Export en flux : les lignes sont lues par lots de EXPORT_BATCH_SIZE et écrites au fil de l'eau."""
+    rows = query.order_by(*ADMIN_ORDERS_ORDER.order_by()).execution_options(yield_per=EXPORT_BATCH_SIZE)
+
+    def generate():
+        if export_format == 'ndjson':
+            for row in rows:
+                yield json.dumps(dict(zip(EXPORT_COLUMNS, _export_values(row))), ensure_ascii=False) + '\n'
+            return
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(EXPORT_COLUMNS)
+        for row in rows:
+            writer.writerow(_export_values(row))
+            if buffer.tell() > 64 * 1024:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+        yield buffer.getvalue()
+
+    mimetype = 'application/x-ndjson' if export_format == 'ndjson' else 'text/csv'
+    filename = f"commandes-{date.today().isoformat()}.{export_format}"
+    return Response(stream_with_context(generate()), mimetype=mimetype,
+                    headers={'Content-Disposition': f'attachment; filename="{filename}"'})
+
+
 @orders_admin_bp.route('/', methods=['GET'])
+@statement_budget(2)
 @admin_required()
 def get_orders():
     """
-    Récupère la liste de toutes les commandes.
-    Peut être filtrée par statut (ex: /api/admin/orders?statut=confirmee).
+    Récupère la liste des commandes (plus récentes d'abord).
+    - /api/admin/orders?statut=confirmee -> Liste complète filtrée (ancien format)
+    - /api/admin/orders?limit=50&cursor=... -> Page suivante ({"items", "next_cursor"})
+    - Filtres : statut, statut_paiement, date_debut, date_fin, total_min, total_max,
+      client_id, zone_id, ville
+    - /api/admin/orders?format=csv (ou ndjson) -> Export en flux de toutes les commandes filtrées
     """
-    statut_filter = request.args.get('statut')
-    
-    query = Commande.query.order_by(Commande.date_commande.desc())
-    
-    if statut_filter:
-        query = query.filter(Commande.statut == statut_filter)
-        
-    commandes = query.all()
-    return jsonify(commandes_schema.dump(commandes)), 200
+    export_format = request.args.get('format', 'json')
+    if export_format not in ('json', 'csv', 'ndjson'):
+        return jsonify({"msg": "Format invalide. Valeurs possibles : json, csv, ndjson"}), 400
+
+    try:
+        query = admin_orders_query(request.args)
+        if export_format != 'json':
+            return _stream_export(query, export_format)
+
+        # Sans `limit` ni `cursor`, on conserve l'ancien format (liste complète)
+        if 'limit' not in request.args and 'cursor' not in request.args:
+            rows = query.order_by(*ADMIN_ORDERS_ORDER.order_by()).all()
+            return jsonify([_order_row(row) for row in rows]), 200
+
+        rows, next_cursor = paginate_keyset(
+            query, ADMIN_ORDERS_ORDER,
+            limit=parse_limit(request.args.get('limit', type=int)),
+            cursor=request.args.get('cursor')
+        )
+    except ValueError as e:
+        return jsonify({"msg": str(e)}), 400
+    return jsonify({"items": [_order_row(row) for row in rows], "next_cursor": next_cursor}), 200
 
 @orders_admin_bp.route('/<int:order_id>', methods=['GET'])
+@statement_budget(4)
 @admin_required()
 def get_order_details(order_id):
     """
     Récupère les détails complets d'une seule commande.
     """
-    commande = Commande.query.get_or_404(order_id)
+    commande = eager(Commande.query, commande_schema).filter_by(id=order_id).first_or_404()
     return jsonify(commande_schema.dump(commande)), 200
 
 
@@ -55,7 +208,9 @@ def update_order_status(order_id):
     if not new_status or new_status not in valid_statuses:
         return jsonify({"msg": "Statut invalide"}), 400
 
-    # On met à jour le statut
+    # On met à jour le statut (et les statistiques du jour de la commande)
+    stats.record_order_transition(commande, (commande.statut, commande.statut_paiement),
+                                  (new_status, commande.statut_paiement))
     commande.statut = new_status
     
     # On enregistre cette action dans le suivi
@@ -66,12 +221,11 @@ def update_order_status(order_id):
         message=f"Statut mis à jour par l'administrateur."
     )
     db.session.add(suivi)
+    # L'email est placé dans l'outbox, dans la même transaction que le statut :
+    # il part en arrière-plan une fois le commit effectué
+    outbox.enqueue('order_status_email', order_id=order_id, statut=new_status)
     db.session.commit()
     
-    # <<< 2. APPELER LA FONCTION D'ENVOI D'EMAIL ---
-    # On le fait après le commit pour s'assurer que le statut est bien sauvegardé
-    send_status_update_email(commande)
-    
     return jsonify(commande_schema.dump(commande)), 200
 
 @orders_admin_bp.route('/<int:order_id>/cancel', methods=['POST'])
@@ -97,18 +251,12 @@ def cancel_order(order_id):
         }), 400
     
     try:
-        # 2. Restaurer le stock de tous les produits de la commande
-        details = DetailsCommande.query.filter_by(commande_id=order_id).all()
-        
-        for detail in details:
-            produit = Produit.query.get(detail.produit_id)
-            if produit and produit.gestion_stock == 'limite':
-                # Restaurer le stock
-                produit.stock_disponible += detail.quantite
-                print(f"Stock restauré pour produit {produit.nom}: +{detail.quantite} (nouveau stock: {produit.stock_disponible})")
+        # 2. Restaurer le stock retenu par la commande (réservé ou acquis au paiement)
+        stock.restore_order(order_id, paid=commande.statut_paiement == 'paye')
         
         # 3. Marquer la commande comme annulée
         old_status = commande.statut
+        stats.record_order_transition(commande, (old_status, commande.statut_paiement), ('annulee', 'rembourse'))
         commande.statut = 'annulee'
         commande.statut_paiement = 'rembourse'  # Considérer comme remboursé
         
@@ -121,11 +269,11 @@ def cancel_order(order_id):
         )
         db.session.add(suivi)
         
-        # 5. Commit toutes les modifications
-        db.session.commit()
+        # 5. Notification email au client, envoyée en arrière-plan après le commit
+        outbox.enqueue('order_status_email', order_id=order_id, statut='annulee')
         
-        # 6. Envoyer notification email au client
-        send_status_update_email(commande)
+        # 6. Commit toutes les modifications
+        db.session.commit()
         
         return jsonify({
             "msg": f"Commande #{commande.numero_commande} annulée avec succès",
@@ -159,11 +307,19 @@ def get_clients():
 @admin_required()
 def get_client_details(client_id):
     """
-    Récupère les détails d'un client, y compris son historique de commandes.
+    Récupère les détails d'un client : profil, synthèse de ses commandes
+    (une requête d'agrégat) et ses commandes les plus récentes.
     """
     client = Utilisateur.query.filter_by(id=client_id, role='client').first_or_404()
-    # On réutilise le schéma utilisateur standard qui a déjà les champs nécessaires
-    return jsonify(utilisateur_schema.dump(client)), 200
+    details = utilisateur_schema.dump(client)
+    details['statistiques_commandes'] = stats.client_order_summary(client_id)
+    recent_orders = db.session.query(
+        Commande.id, Commande.numero_commande, Commande.statut, Commande.total, Commande.date_commande
+    ).filter_by(utilisateur_id=client_id).order_by(
+        Commande.date_commande.desc(), Commande.id.desc()
+    ).limit(DEFAULT_PAGE_SIZE).all()
+    details['commandes_recentes'] = commandes_summary_schema.dump(recent_orders)
+    return jsonify(details), 200
 
 @orders_admin_bp.route('/clients/<int:client_id>/status', methods=['PUT'])
 @admin_required()
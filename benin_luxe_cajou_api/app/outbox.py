@@ -0,0 +1,213 @@
+# app/outbox.py
+
+import random
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from sqlalchemy import event, or_, and_
+from sqlalchemy.orm import Session
+
+from .extensions import db
+from .models import OutboxMessage
+
+# Registre des fonctions d'envoi : type de message -> fonction(**payload)
+HANDLERS = {}
+
+
+def handler(message_type):
+    """
+    Décorateur enregistrant la fonction qui traite un type de message.
+    La fonction reçoit le payload en arguments nommés et doit lever une
+    exception en cas d'échec pour que le message soit retenté.
+    """
+    def wrapper(fn):
+        HANDLERS[message_type] = fn
+        return fn
+    return wrapper
+
+
+def enqueue(message_type, **payload):
+    """
+    Ajoute un message à l'outbox dans la transaction en cours.
+    Rien n'est envoyé avant le commit ; un rollback annule aussi le message.
+    """
+    message = OutboxMessage(type=message_type, payload=payload, prochaine_tentative=datetime.utcnow())
+    db.session.add(message)
+    db.session.info['outbox_enqueued'] = True
+    return message
+
+
+# --- TRAITEMENT ---
+
+def _claim(message_id, seen_tentatives, lease_seconds):
+    """
+    Réserve un message par compare-and-swap : la mise à jour n'aboutit que si
+    personne (autre thread, autre worker) ne l'a réservé entre-temps.
+    """
+    now = datetime.utcnow()
+    claimed = OutboxMessage.query.filter(
+        OutboxMessage.id == message_id,
+        OutboxMessage.tentatives == seen_tentatives,
+        or_(
+            and_(OutboxMessage.statut == 'en_attente', OutboxMessage.prochaine_tentative <= now),
+            and_(OutboxMessage.statut == 'en_cours', OutboxMessage.verrouille_jusqu_a < now),
+        )
+    ).update({
+        'statut': 'en_cours',
+        'tentatives': seen_tentatives + 1,
+        'verrouille_jusqu_a': now + timedelta(seconds=lease_seconds),
+    }, synchronize_session=False)
+    db.session.commit()
+    return claimed == 1
+
+
+def claim_batch(config, limit):
+    """Retourne les ids des messages dus réservés par cet appel."""
+    now = datetime.utcnow()
+    # Les messages 'en_cours' dont le bail a expiré viennent d'un worker mort
+    candidates = db.session.query(OutboxMessage.id, OutboxMessage.tentatives).filter(
+        or_(
+            and_(OutboxMessage.statut == 'en_attente', OutboxMessage.prochaine_tentative <= now),
+            and_(OutboxMessage.statut == 'en_cours', OutboxMessage.verrouille_jusqu_a < now),
+        )
+    ).order_by(OutboxMessage.prochaine_tentative).limit(limit).all()
+    db.session.commit()
+    return [row.id for row in candidates
+            if _claim(row.id, row.tentatives, config['OUTBOX_LEASE_SECONDS'])]
+
+
+def backoff_delay(config, attempt):
+    """Délai avant la tentative suivante : exponentiel, plafonné, avec gigue."""
+    delay = min(config['OUTBOX_BACKOFF_BASE'] * 2 ** (attempt - 1), config['OUTBOX_BACKOFF_MAX'])
+    return delay * random.uniform(0.8, 1.2)
+
+
+def process_message(app, message_id):
+    """Envoie un message réservé puis enregistre le résultat (succès ou nouvelle échéance)."""
+    with app.app_context():
+        message = db.session.get(OutboxMessage, message_id)
+        if message is None or message.statut != 'en_cours':
+            return False
+        try:
+            fn = HANDLERS.get(message.type)
+            if fn is None:
+                raise LookupError(f"Aucun handler pour le type '{message.type}'")
+            fn(**(message.payload or {}))
+        except Exception as e:
+            db.session.rollback()
+            message = db.session.get(OutboxMessage, message_id)
+            message.derniere_erreur = ''.join(traceback.format_exception_only(type(e), e)).strip()
+            message.verrouille_jusqu_a = None
+            if message.tentatives >= app.config['OUTBOX_MAX_ATTEMPTS']:
+                message.statut = 'echoue'
+                app.logger.error(f"Outbox: message {message.id} ({message.type}) abandonné après {message.tentatives} tentatives: {e}")
+            else:
+                message.statut = 'en_attente'
+                message.prochaine_tentative = datetime.utcnow() + timedelta(
+                    seconds=backoff_delay(app.config, message.tentatives))
+                app.logger.warning(f"Outbox: échec du message {message.id} ({message.type}), nouvel essai prévu: {e}")
+            db.session.commit()
+            return False
+
+        message.statut = 'envoye'
+        message.date_envoi = datetime.utcnow()
+        message.verrouille_jusqu_a = None
+        message.derniere_erreur = None
+        db.session.commit()
+        return True
+
+
+def drain(app, limit=None):
+    """
+    Traite de façon synchrone tous les messages dus (utilisé par la commande
+    `flask outbox-drain`). Retourne (envoyés, échoués). Avec `limit`, on ne
+    réserve jamais plus de messages qu'il n'en reste à traiter : un message
+    réservé mais non traité resterait bloqué jusqu'à l'expiration de son bail.
+    """
+    sent = failed = 0
+    batch_size = app.config['OUTBOX_BATCH_SIZE']
+    while limit is None or sent + failed < limit:
+        remaining = batch_size if limit is None else min(batch_size, limit - sent - failed)
+        with app.app_context():
+            message_ids = claim_batch(app.config, remaining)
+        if not message_ids:
+            break
+        for message_id in message_ids:
+            if process_message(app, message_id):
+                sent += 1
+            else:
+                failed += 1
+    return sent, failed
+
+
+# --- DISPATCHER EN ARRIÈRE-PLAN ---
+
+class OutboxDispatcher:
+    """
+    Thread de scrutation + pool de threads d'envoi, un par worker gunicorn.
+    Il est réveillé immédiatement après chaque commit contenant un message,
+    et scrute la table toutes les OUTBOX_POLL_INTERVAL secondes pour les
+    nouvelles tentatives. Les réservations par CAS évitent qu'un message soit
+    envoyé deux fois par des workers concurrents.
+    """
+
+    def __init__(self):
+        self.app = None
+        self._wake = threading.Event()
+        self._start_lock = threading.Lock()
+        self._thread = None
+        self._executor = None
+
+    def init_app(self, app):
+        self.app = app
+        app.extensions['outbox'] = self
+        # Démarrage à la première requête : pas de threads dans les commandes
+        # CLI (flask db upgrade) ni dans le processus maître de gunicorn
+        app.before_request(self._ensure_started)
+
+    def _ensure_started(self):
+        if self._thread is not None or self.app.testing or self.app.config['OUTBOX_WORKERS'] <= 0:
+            return
+        with self._start_lock:
+            if self._thread is not None:
+                return
+            self._executor = ThreadPoolExecutor(max_workers=self.app.config['OUTBOX_WORKERS'],
+                                                thread_name_prefix='outbox')
+            self._thread = threading.Thread(target=self._run, name='outbox-dispatcher', daemon=True)
+            self._thread.start()
+
+    def wake(self):
+        self._wake.set()
+
+    def _run(self):
+        interval = self.app.config['OUTBOX_POLL_INTERVAL']
+        while True:
+            self._wake.wait(interval)
+            self._wake.clear()
+            try:
+                with self.app.app_context():
+                    message_ids = claim_batch(self.app.config, self.app.config['OUTBOX_BATCH_SIZE'])
+                futures = [self._executor.submit(process_message, self.app, message_id) for message_id in message_ids]
+                for future in futures:
+                    future.result()
+                # Lot complet : il reste probablement des messages dus
+                if len(message_ids) == self.app.config['OUTBOX_BATCH_SIZE']:
+                    self._wake.set()
+            except Exception as e:
+                self.app.logger.error(f"Outbox: erreur du dispatcher: {e}", exc_info=True)
+
+
+dispatcher = OutboxDispatcher()
+
+
+@event.listens_for(Session, 'after_commit')
+def _wake_dispatcher(session):
+    if session.info.pop('outbox_enqueued', False):
+        dispatcher.wake()
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_enqueued(session):
+    session.info.pop('outbox_enqueued', None)
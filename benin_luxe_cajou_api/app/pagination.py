@@ -0,0 +1,89 @@
+# app/pagination.py
+
+import base64
+import binascii
+import json
+from datetime import datetime
+from decimal import Decimal
+
+from sqlalchemy import and_, or_
+
+DEFAULT_PAGE_SIZE = 24
+MAX_PAGE_SIZE = 100
+
+
+class KeysetOrder:
+    """
+    Décrit un ordre de tri paginable par curseur (keyset).
+    `columns` doit se terminer par une colonne unique (ex: id) pour départager
+    les égalités ; `converters` re-typent les valeurs décodées depuis le curseur.
+    """
+    def __init__(self, columns, converters, descending=True):
+        self.columns = columns
+        self.converters = converters
+        self.descending = descending
+
+    def order_by(self):
+        return [col.desc() if self.descending else col.asc() for col in self.columns]
+
+    def after(self, values):
+        """Condition SQL "strictement après `values`" dans cet ordre (compatible index)."""
+        clauses = []
+        for i, col in enumerate(self.columns):
+            equals = [self.columns[j] == values[j] for j in range(i)]
+            beyond = col < values[i] if self.descending else col > values[i]
+            clauses.append(and_(*equals, beyond))
+        return or_(*clauses)
+
+    def values_of(self, item):
+        return [getattr(item, col.key) for col in self.columns]
+
+
+def _to_json(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return str(value)
+    return value
+
+
+def encode_cursor(values):
+    """Encode les valeurs de tri du dernier élément d'une page en curseur opaque."""
+    raw = json.dumps([_to_json(v) for v in values], separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor, converters):
+    """Décode un curseur. Lève ValueError s'il est illisible ou incohérent."""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+        if not isinstance(values, list) or len(values) != len(converters):
+            raise ValueError
+        return [convert(value) for convert, value in zip(converters, values)]
+    except (ValueError, TypeError, binascii.Error):
+        raise ValueError("Curseur de pagination invalide")
+
+
+def parse_limit(raw_limit):
+    """Borne le paramètre `limit` entre 1 et MAX_PAGE_SIZE."""
+    if raw_limit is None:
+        return DEFAULT_PAGE_SIZE
+    return max(1, min(raw_limit, MAX_PAGE_SIZE))
+
+
+def paginate_keyset(query, order, limit, cursor=None):
+    """
+    Retourne (éléments, curseur_suivant) pour une page de `query`.
+    On lit `limit + 1` lignes pour savoir s'il existe une page suivante,
+    sans jamais compter ni charger le reste de la table.
+    """
+    if cursor:
+        query = query.filter(order.after(decode_cursor(cursor, order.converters)))
+    items = query.order_by(*order.order_by()).limit(limit + 1).all()
+
+    next_cursor = None
+    if len(items) > limit:
+        items = items[:limit]
+        next_cursor = encode_cursor(order.values_of(items[-1]))
+    return items, next_cursor
@@ -0,0 +1,264 @@
+# app/payment/fedapay.py
+
+import hashlib
+import hmac
+import random
+import threading
+import time
+from collections import defaultdict, deque
+
+import requests
+from flask import current_app
+from requests.adapters import HTTPAdapter
+
+# Statuts HTTP considérés comme une défaillance temporaire de FedaPay
+RETRYABLE_STATUSES = {429, 502, 503, 504}
+
+
+class FedaPayUnavailable(requests.exceptions.RequestException):
+    """Levée sans appel réseau quand le disjoncteur est ouvert (FedaPay dégradé)."""
+
+
+def verify_webhook_signature(payload, header, secret, tolerance=300):
+    """
+    Vérifie l'en-tête X-FEDAPAY-SIGNATURE ("t=<timestamp>,s=<signature>") :
+    HMAC-SHA256 de "<timestamp>.<corps brut>" avec le secret du webhook,
+    horodatage accepté à `tolerance` secondes près (anti-rejeu).
+    """
+    parts = dict(item.split('=', 1) for item in (header or '').split(',') if '=' in item)
+    try:
+        timestamp = int(parts.get('t', ''))
+    except ValueError:
+        return False
+    if abs(time.time() - timestamp) > tolerance:
+        return False
+    expected = hmac.new(secret.encode('utf-8'), f"{timestamp}.".encode('utf-8') + payload, hashlib.sha256).hexdigest()
+    return hmac.compare_digest(expected, parts.get('s', ''))
+
+
+class CircuitBreaker:
+    """
+    Disjoncteur : après `failure_threshold` échecs consécutifs, les appels
+    échouent immédiatement pendant `reset_timeout` secondes ; un seul appel
+    d'essai est ensuite autorisé (demi-ouvert) pour tester le rétablissement.
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=30):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at = None
+        self._trial_in_flight = False
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._state()
+
+    def _state(self):
+        if self._opened_at is None:
+            return 'closed'
+        if time.monotonic() - self._opened_at >= self.reset_timeout:
+            return 'half_open'
+        return 'open'
+
+    def allow(self):
+        with self._lock:
+            state = self._state()
+            if state == 'closed':
+                return True
+            if state == 'half_open' and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._trial_in_flight = False
+            if self._opened_at is not None or self._failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+
+
+class LatencyMetrics:
+    """Compteurs et latences (ms) par endpoint, sur les N derniers appels."""
+
+    def __init__(self, window=200):
+        self._lock = threading.Lock()
+        self._samples = defaultdict(lambda: deque(maxlen=window))
+        self._counts = defaultdict(lambda: {'calls': 0, 'errors': 0})
+
+    def record(self, endpoint, elapsed_ms, ok):
+        with self._lock:
+            self._samples[endpoint].append(elapsed_ms)
+            self._counts[endpoint]['calls'] += 1
+            if not ok:
+                self._counts[endpoint]['errors'] += 1
+
+    def snapshot(self):
+        with self._lock:
+            result = {}
+            for endpoint, samples in self._samples.items():
+                ordered = sorted(samples)
+                result[endpoint] = {
+                    **self._counts[endpoint],
+                    'p50_ms': round(ordered[len(ordered) // 2], 1),
+                    'p95_ms': round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))], 1),
+                    'max_ms': round(ordered[-1], 1),
+                }
+            return result
+
+
+class FedaPayClient:
+    """Client pour l'API FedaPay"""
+
+    def __init__(self, api_key, environment='sandbox', base_url=None, pool_size=10,
+                 connect_timeout=3.05, read_timeout=20, max_retries=2, backoff_base=0.2,
+                 breaker_threshold=5, breaker_reset_timeout=30):
+        self.api_key = api_key
+        self.environment = environment
+        # URLs correctes pour FedaPay (base_url permet de viser un serveur de test local)
+        if base_url:
+            self.base_url = base_url.rstrip('/')
+        elif environment == 'sandbox':
+            self.base_url = 'https://sandbox-api.fedapay.com'
+        else:
+            self.base_url = 'https://api.fedapay.com'
+
+        # Format d'authentification correct
+        self.headers = {
+            'Authorization': f'Bearer {api_key}',
+            'Content-Type': 'application/json',
+            'User-Agent': 'FedaPay-Python-Client/1.0'
+        }
+
+        # Session keep-alive : les connexions TCP+TLS sont réutilisées entre les appels
+        self.session = requests.Session()
+        self.session.headers.update(self.headers)
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.breaker = CircuitBreaker(breaker_threshold, breaker_reset_timeout)
+        self.metrics = LatencyMetrics()
+
+    def _log_info(self, message):
+        """Log sécurisé qui fonctionne avec ou sans contexte Flask"""
+        try:
+            current_app.logger.info(message)
+        except RuntimeError:
+            print(f"[INFO] {message}")
+
+    def _log_error(self, message):
+        """Log sécurisé qui fonctionne avec ou sans contexte Flask"""
+        try:
+            current_app.logger.error(message)
+        except RuntimeError:
+            print(f"[ERROR] {message}")
+
+    def _request(self, method, path, endpoint, **kwargs):
+        """
+        Exécute un appel via la session partagée. Les GET (idempotents) sont
+        retentés avec un backoff exponentiel à gigue ; les POST jamais, pour ne
+        pas créer deux transactions.
+        """
+        url = f"{self.base_url}{path}"
+        attempts = 1 + (self.max_retries if method == 'GET' else 0)
+        for attempt in range(1, attempts + 1):
+            if not self.breaker.allow():
+                raise FedaPayUnavailable(f"FedaPay indisponible (disjoncteur ouvert), appel {endpoint} refusé")
+
+            started = time.monotonic()
+            try:
+                response = self.session.request(method, url, timeout=self.timeout, **kwargs)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+                self.metrics.record(endpoint, (time.monotonic() - started) * 1000, ok=False)
+                self.breaker.record_failure()
+                if attempt == attempts:
+                    raise
+            except Exception:
+                # Réponse illisible, redirections en boucle, URL invalide... : échec sans
+                # nouvelle tentative, mais toujours enregistré, sinon un appel d'essai
+                # (demi-ouvert) laisserait le disjoncteur bloqué jusqu'au redémarrage
+                self.metrics.record(endpoint, (time.monotonic() - started) * 1000, ok=False)
+                self.breaker.record_failure()
+                raise
+            else:
+                ok = response.status_code < 400
+                self.metrics.record(endpoint, (time.monotonic() - started) * 1000, ok=ok)
+                if response.status_code >= 500 or response.status_code == 429:
+                    self.breaker.record_failure()
+                else:
+                    # Une 4xx est une erreur de la requête, pas une panne de FedaPay
+                    self.breaker.record_success()
+                if response.status_code not in RETRYABLE_STATUSES or attempt == attempts:
+                    return response
+
+            time.sleep(random.uniform(0, self.backoff_base * 2 ** (attempt - 1)))
+
+    def create_transaction(self, data):
+        """Créer une transaction"""
+        url = f"{self.base_url}/v1/transactions"
+
+        self._log_info(f"Tentative de création de transaction sur: {url}")
+
+        try:
+            response = self._request('POST', '/v1/transactions', 'POST /v1/transactions', json=data)
+            self._log_info(f"Réponse FedaPay: Status {response.status_code}")
+
+            if response.status_code != 200:
+                self._log_error(f"Erreur FedaPay - Status: {response.status_code}, Response: {response.text}")
+
+            response.raise_for_status()
+            return response.json()
+
+        except requests.exceptions.RequestException as e:
+            self._log_error(f"Erreur lors de l'appel FedaPay API: {str(e)}")
+            raise
+
+    def get_transaction(self, transaction_id):
+        """Récupérer une transaction"""
+        try:
+            response = self._request('GET', f"/v1/transactions/{transaction_id}", 'GET /v1/transactions/{id}')
+            response.raise_for_status()
+            return response.json()
+        except requests.exceptions.RequestException as e:
+            self._log_error(f"Erreur lors de la récupération de transaction {transaction_id}: {str(e)}")
+            raise
+
+    def get_transaction_by_reference(self, merchant_reference):
+        """Récupérer une transaction par référence marchande (None si elle n'existe pas)"""
+        try:
+            response = self._request('GET', f"/v1/transactions/merchant/{merchant_reference}",
+                                     'GET /v1/transactions/merchant/{reference}')
+            if response.status_code == 404:
+                return None
+            response.raise_for_status()
+            return response.json()
+        except requests.exceptions.RequestException as e:
+            self._log_error(f"Erreur lors de la recherche de la transaction {merchant_reference}: {str(e)}")
+            raise
+
+    def generate_token(self, transaction_id):
+        """Générer le token de paiement"""
+        try:
+            response = self._request('POST', f"/v1/transactions/{transaction_id}/token", 'POST /v1/transactions/{id}/token')
+            response.raise_for_status()
+            return response.json()
+        except requests.exceptions.RequestException as e:
+            self._log_error(f"Erreur lors de la génération du token pour {transaction_id}: {str(e)}")
+            raise
+
+    def stats(self):
+        """Latences par endpoint et état du disjoncteur (pour la supervision)."""
+        return {'circuit_breaker': self.breaker.state, 'endpoints': self.metrics.snapshot()}
@@ -0,0 +1,206 @@
+# app/payment/reconciliation.py
+
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+import requests
+from flask import current_app
+
+from app.background import scheduler
+from app.extensions import db
+from app.models import Commande, Paiement, ParametreSite
+from app.payment.routes import (
+    initialize_services, get_fedapay_client, merchant_reference,
+    record_payment, abandon_order, close_payment, process_payment_confirmation
+)
+
+
+# Statuts FedaPay d'une transaction
+FEDAPAY_APPROVED = {'approved', 'transferred'}
+FEDAPAY_FAILED = {'declined', 'canceled', 'expired'}
+
+# Dernier paiement vérifié par la réconciliation (reprise incrémentale)
+WATERMARK_KEY = 'reconciliation_paiements_dernier_id'
+
+
+def db_now():
+    """L'heure de la base fait foi : les dates de création sont posées par MySQL."""
+    return db.session.query(db.func.current_timestamp()).scalar()
+
+
+# --- COMMANDES SANS PAIEMENT ---
+
+def find_stranded_orders(limit):
+    """
+    Commandes validées (phase 1) mais sans paiement enregistré (phase 3)
+    depuis plus de PAYMENT_STRANDED_AFTER secondes.
+    """
+    cutoff = db_now() - timedelta(seconds=current_app.config['PAYMENT_STRANDED_AFTER'])
+    rows = db.session.query(Commande.id).filter(
+        Commande.statut == 'en_attente',
+        Commande.statut_paiement == 'en_attente',
+        Commande.date_commande < cutoff,
+        ~Commande.paiements.any()
+    ).order_by(Commande.id).limit(limit).all()
+    db.session.commit()
+    return [row.id for row in rows]
+
+
+def reconcile_order(client, order_id):
+    """
+    Recherche la transaction FedaPay de la commande par sa référence marchande :
+    - aucune transaction : la commande est annulée ;
+    - transaction trouvée : le paiement est enregistré, puis confirmé ou
+      annulé selon son statut.
+    Retourne le résultat ('annulee', 'paye', 'pending' ou 'ignoree').
+    """
+    transaction = client.get_transaction_by_reference(merchant_reference(order_id))
+    if transaction is None:
+        abandon_order(order_id, "Paiement non initialisé : aucune transaction FedaPay.")
+        return 'annulee'
+
+    transaction = transaction['v1/transaction']
+    order = db.session.get(Commande, order_id)
+    if order is None or order.statut != 'en_attente':
+        return 'ignoree'
+    if not Paiement.query.filter_by(commande_id=order_id).first():
+        record_payment(order_id, transaction['id'], order.total)
+
+    if transaction['status'] in FEDAPAY_APPROVED:
+        return 'paye' if process_payment_confirmation(order, transaction['id'], 'reconciliation') else 'ignoree'
+    if transaction['status'] in FEDAPAY_FAILED:
+        abandon_order(order_id, f"Transaction FedaPay {transaction['status']}.")
+        return 'annulee'
+    return 'pending'
+
+
+def reconcile_stranded_orders(limit=None):
+    """Réconcilie les commandes bloquées entre les deux phases de l'initialisation du paiement."""
+    initialize_services()
+    client = get_fedapay_client()
+    if not client:
+        current_app.logger.warning("Réconciliation ignorée : client FedaPay indisponible.")
+        return Counter()
+
+    results = Counter()
+    for order_id in find_stranded_orders(limit or current_app.config['PAYMENT_RECONCILE_BATCH_SIZE']):
+        try:
+            results[reconcile_order(client, order_id)] += 1
+        except requests.exceptions.RequestException as e:
+            # FedaPay injoignable : la commande sera reprise au prochain passage
+            db.session.rollback()
+            results['erreur'] += 1
+            current_app.logger.warning(f"Réconciliation de la commande {order_id} reportée: {e}")
+    if results:
+        current_app.logger.info(f"Réconciliation des commandes en attente: {dict(results)}")
+    return results
+
+
+# --- PAIEMENTS EN ATTENTE ---
+
+def _get_watermark():
+    row = ParametreSite.query.filter_by(cle=WATERMARK_KEY).first()
+    return int(row.valeur) if row and row.valeur else 0
+
+
+def _set_watermark(payment_id):
+    row = ParametreSite.query.filter_by(cle=WATERMARK_KEY).first()
+    if row is None:
+        row = ParametreSite(cle=WATERMARK_KEY, type='number',
+                            description="Dernier paiement vérifié par la réconciliation FedaPay")
+        db.session.add(row)
+    row.valeur = str(payment_id)
+    db.session.commit()
+
+
+def fetch_statuses(client, transaction_ids):
+    """
+    Statuts FedaPay des transactions, interrogées en parallèle par au plus
+    PAYMENT_RECONCILE_CONCURRENCY threads (None si FedaPay n'a pas répondu).
+    Les threads ne font que des appels HTTP : aucune session SQL partagée.
+    """
+    def fetch(transaction_id):
+        try:
+            return transaction_id, client.get_transaction(transaction_id)['v1/transaction']['status']
+        except requests.exceptions.RequestException:
+            return transaction_id, None
+
+    if not transaction_ids:
+        return {}
+    workers = min(current_app.config['PAYMENT_RECONCILE_CONCURRENCY'], len(transaction_ids))
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='reconciliation') as pool:
+        return dict(pool.map(fetch, transaction_ids))
+
+
+def reconcile_payment(payment, status, expire_before):
+    """Applique le statut FedaPay d'un paiement en attente. Retourne le résultat."""
+    if status is None:
+        return 'erreur'
+    if status in FEDAPAY_APPROVED:
+        order = db.session.get(Commande, payment.commande_id)
+        confirmed = process_payment_confirmation(order, payment.fedapay_transaction_id, 'reconciliation')
+        return 'paye' if confirmed else 'ignoree'
+    if status in FEDAPAY_FAILED:
+        close_payment(payment.id, payment.commande_id, status, f"Transaction FedaPay {status}.")
+        return 'annulee'
+    if payment.date_creation < expire_before:
+        close_payment(payment.id, payment.commande_id, 'expired', "Paiement expiré : aucune confirmation FedaPay.")
+        return 'expiree'
+    return 'pending'
+
+
+def reconcile_pending_payments(limit=None):
+    """
+    Vérifie auprès de FedaPay les paiements restés 'pending' (webhook manqué,
+    navigateur fermé) : confirmation par le pipeline habituel, annulation des
+    transactions refusées et expiration après PAYMENT_PENDING_EXPIRE_AFTER.
+    Chaque passage traite un lot à partir du dernier paiement vu (watermark) ;
+    arrivé au bout de la table, le passage suivant repart du début.
+    """
+    initialize_services()
+    client = get_fedapay_client()
+    if not client:
+        current_app.logger.warning("Réconciliation ignorée : client FedaPay indisponible.")
+        return Counter()
+
+    config = current_app.config
+    batch_size = limit or config['PAYMENT_RECONCILE_BATCH_SIZE']
+    now = db_now()
+    watermark = _get_watermark()
+    payments = db.session.query(
+        Paiement.id, Paiement.commande_id, Paiement.fedapay_transaction_id, Paiement.date_creation
+    ).filter(
+        Paiement.statut == 'pending',
+        Paiement.id > watermark,
+        # Les paiements récents sont laissés au navigateur et au webhook
+        Paiement.date_creation < now - timedelta(seconds=config['PAYMENT_PENDING_MIN_AGE'])
+    ).order_by(Paiement.id).limit(batch_size).all()
+    # Aucune transaction SQL ouverte pendant les appels FedaPay
+    db.session.commit()
+
+    statuses = fetch_statuses(client, [p.fedapay_transaction_id for p in payments])
+    expire_before = now - timedelta(seconds=config['PAYMENT_PENDING_EXPIRE_AFTER'])
+    results = Counter()
+    for payment in payments:
+        try:
+            results[reconcile_payment(payment, statuses.get(payment.fedapay_transaction_id), expire_before)] += 1
+        except Exception as e:
+            db.session.rollback()
+            results['erreur'] += 1
+            current_app.logger.error(f"Réconciliation du paiement {payment.id} en erreur: {e}", exc_info=True)
+
+    _set_watermark(payments[-1].id if len(payments) == batch_size else 0)
+    if results:
+        current_app.logger.info(f"Réconciliation des paiements en attente: {dict(results)}")
+    return results
+
+
+@scheduler.job('reconcile_stranded_orders', 'PAYMENT_RECONCILE_INTERVAL')
+def _reconcile_stranded_orders_job():
+    reconcile_stranded_orders()
+
+
+@scheduler.job('reconcile_pending_payments', 'PAYMENT_PENDING_RECONCILE_INTERVAL')
+def _reconcile_pending_payments_job():
+    reconcile_pending_payments()
@@ -2,17 +2,26 @@
 
 import requests
 import json
-from flask import Blueprint, request, jsonify, current_app
+import queue
+import time
+from flask import Blueprint, request, jsonify, current_app, Response
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from decimal import Decimal
 import firebase_admin
 from firebase_admin import credentials, messaging
 from flask_mail import Message
-
-from app.extensions import db, mail
+from sqlalchemy.exc import IntegrityError
+
+from app.extensions import db, mail, cache
+from app.cache import invalidate_after_commit, user_orders_namespace
+from app import outbox, stock, stats
+from app.push import push_dispatcher
+from app.admin.admin_auth import admin_required
+from app.payment.fedapay import FedaPayClient, FedaPayUnavailable, verify_webhook_signature
+from app.payment.status_stream import status_hub, sse_event, FINAL_STATUSES
 from app.models import (
     Utilisateur, Panier, Produit, AdresseLivraison, ZoneLivraison, 
-    Coupon, Commande, DetailsCommande, Paiement
+    Coupon, Commande, DetailsCommande, Paiement, SuiviCommande, ConfirmationPaiement, EvenementWebhook
 )
 from config import Config
 
@@ -20,81 +29,6 @@ payment_bp = Blueprint('payment', __name__)
 
 # --- CLASSES ET UTILITAIRES ---
 
-class FedaPayClient:
-    """Client pour l'API FedaPay"""
-    
-    def __init__(self, api_key, environment='sandbox'):
-        self.api_key = api_key
-        self.environment = environment
-        # URLs correctes pour FedaPay
-        if environment == 'sandbox':
-            self.base_url = 'https://sandbox-api.fedapay.com'
-        else:
-            self.base_url = 'https://api.fedapay.com'
-            
-        # Format d'authentification correct
-        self.headers = {
-            'Authorization': f'Bearer {api_key}',
-            'Content-Type': 'application/json',
-            'User-Agent': 'FedaPay-Python-Client/1.0'
-        }
-    
-    def _log_info(self, message):
-        """Log sécurisé qui fonctionne avec ou sans contexte Flask"""
-        try:
-            current_app.logger.info(message)
-        except RuntimeError:
-            print(f"[INFO] {message}")
-    
-    def _log_error(self, message):
-        """Log sécurisé qui fonctionne avec ou sans contexte Flask"""
-        try:
-            current_app.logger.error(message)
-        except RuntimeError:
-            print(f"[ERROR] {message}")
-    
-    def create_transaction(self, data):
-        """Créer une transaction"""
-        url = f"{self.base_url}/v1/transactions"
-        
-        self._log_info(f"Tentative de création de transaction sur: {url}")
-        
-        try:
-            response = requests.post(url, headers=self.headers, json=data, timeout=30)
-            self._log_info(f"Réponse FedaPay: Status {response.status_code}")
-            
-            if response.status_code != 200:
-                self._log_error(f"Erreur FedaPay - Status: {response.status_code}, Response: {response.text}")
-            
-            response.raise_for_status()
-            return response.json()
-            
-        except requests.exceptions.RequestException as e:
-            self._log_error(f"Erreur lors de l'appel FedaPay API: {str(e)}")
-            raise
-    
-    def get_transaction(self, transaction_id):
-        """Récupérer une transaction"""
-        url = f"{self.base_url}/v1/transactions/{transaction_id}"
-        try:
-            response = requests.get(url, headers=self.headers, timeout=30)
-            response.raise_for_status()
-            return response.json()
-        except requests.exceptions.RequestException as e:
-            self._log_error(f"Erreur lors de la récupération de transaction {transaction_id}: {str(e)}")
-            raise
-    
-    def generate_token(self, transaction_id):
-        """Générer le token de paiement"""
-        url = f"{self.base_url}/v1/transactions/{transaction_id}/token"
-        try:
-            response = requests.post(url, headers=self.headers, timeout=30)
-            response.raise_for_status()
-            return response.json()
-        except requests.exceptions.RequestException as e:
-            self._log_error(f"Erreur lors de la génération du token pour {transaction_id}: {str(e)}")
-            raise
-
 # Variables globales
 fedapay_client = None
 firebase_initialized = False
@@ -120,7 +54,14 @@ def initialize_services():
         try:
             fedapay_client = FedaPayClient(
                 api_key=Config.FEDAPAY_API_KEY,
-                environment=Config.FEDAPAY_ENVIRONMENT
+                environment=Config.FEDAPAY_ENVIRONMENT,
+                base_url=Config.FEDAPAY_BASE_URL,
+                pool_size=Config.FEDAPAY_POOL_SIZE,
+                connect_timeout=Config.FEDAPAY_CONNECT_TIMEOUT,
+                read_timeout=Config.FEDAPAY_READ_TIMEOUT,
+                max_retries=Config.FEDAPAY_MAX_RETRIES,
+                breaker_threshold=Config.FEDAPAY_BREAKER_THRESHOLD,
+                breaker_reset_timeout=Config.FEDAPAY_BREAKER_RESET_TIMEOUT
             )
             current_app.logger.info("FedaPay client initialisé avec succès")
         except Exception as e:
@@ -167,158 +108,262 @@ def send_order_confirmation_email(order):
         
     except Exception as e:
         current_app.logger.error(f"Erreur lors de l'envoi de l'email de confirmation pour la commande {order.id}: {e}")
+        raise  # L'outbox retentera l'envoi
 
 def send_new_order_push_notification(order):
     """Envoie une notification push pour une nouvelle commande avec un son spécifique."""
     try:
-        if not firebase_initialized:
-            current_app.logger.warning("Firebase non initialisé, impossible d'envoyer la notification push.")
-            return
-            
-        admins = Utilisateur.query.filter_by(role='admin').all()
-        notifications_sent = 0
-        
-        for admin in admins:
-            if admin.fcm_token:
-                try:
-                    message = messaging.Message(
-                        notification=messaging.Notification(
-                            title='🎉 Nouvelle Commande !',
-                            body=f'Commande #{order.numero_commande} ({order.total} FCFA) a été payée.'
-                        ),
-                        token=admin.fcm_token,
-                        data={
-                            'order_id': str(order.id),
-                            'type': 'new_order' # Étiquette pour que Flutter puisse identifier le type de notification
-                        },
-                        # --- Configuration du son personnalisé pour Android ---
-                        android=messaging.AndroidConfig(
-                            notification=messaging.AndroidNotification(
-                                # Canal spécifique pour les nouvelles commandes
-                                channel_id='new_order_channel',
-                                # Nom du fichier son dans android/app/src/main/res/raw (SANS extension)
-                                sound='new_order_sound' 
-                            )
-                        ),
-                        # --- Configuration du son personnalisé pour iOS ---
-                        apns=messaging.APNSConfig(
-                            payload=messaging.APNSPayload(
-                                aps=messaging.Aps(  # ✅ CORRECTION: Aps au lieu de APS
-                                    # Nom du fichier son ajouté au projet Xcode (AVEC extension)
-                                    sound='new_order_sound.wav' 
-                                )
-                            )
-                        )
+        notifications_sent = push_dispatcher.send_to_admins(
+            notification=messaging.Notification(
+                title='🎉 Nouvelle Commande !',
+                body=f'Commande #{order.numero_commande} ({order.total} FCFA) a été payée.'
+            ),
+            data={
+                'order_id': str(order.id),
+                'type': 'new_order' # Étiquette pour que Flutter puisse identifier le type de notification
+            },
+            # --- Configuration du son personnalisé pour Android ---
+            android=messaging.AndroidConfig(
+                notification=messaging.AndroidNotification(
+                    # Canal spécifique pour les nouvelles commandes
+                    channel_id='new_order_channel',
+                    # Nom du fichier son dans android/app/src/main/res/raw (SANS extension)
+                    sound='new_order_sound' 
+                )
+            ),
+            # --- Configuration du son personnalisé pour iOS ---
+            apns=messaging.APNSConfig(
+                payload=messaging.APNSPayload(
+                    aps=messaging.Aps(  # ✅ CORRECTION: Aps au lieu de APS
+                        # Nom du fichier son ajouté au projet Xcode (AVEC extension)
+                        sound='new_order_sound.wav' 
                     )
-                    
-                    messaging.send(message)
-                    notifications_sent += 1
-                    current_app.logger.info(f"Notification push 'Nouvelle Commande' envoyée à l'admin {admin.id}")
-                    
-                except Exception as token_error:
-                    current_app.logger.error(f"Erreur lors de l'envoi de la notification 'Nouvelle Commande' à l'admin {admin.id}: {token_error}")
-        
+                )
+            )
+        )
         current_app.logger.info(f"{notifications_sent} notifications 'Nouvelle Commande' envoyées pour la commande {order.numero_commande}")
         
     except Exception as e:
         current_app.logger.error(f"Erreur générale lors de l'envoi des notifications push pour la commande {order.id}: {e}")
+        raise
 
 def send_low_stock_notification(product):
     """Envoie une notification push pour un produit en stock faible avec un son différent."""
     try:
-        if not firebase_initialized:
-            current_app.logger.warning("Firebase non initialisé, impossible d'envoyer la notification de stock faible.")
-            return
-            
-        admins = Utilisateur.query.filter_by(role='admin').all()
-        notifications_sent = 0
-        
-        for admin in admins:
-            if admin.fcm_token:
-                try:
-                    message = messaging.Message(
-                        notification=messaging.Notification(
-                            title='⚠️ Alerte Stock Faible !',
-                            body=f"Le stock pour '{product.nom}' est de {product.stock_disponible} (seuil: {product.stock_minimum})."
-                        ),
-                        token=admin.fcm_token,
-                        data={
-                            "product_id": str(product.id),
-                            "type": "low_stock_alert" # Étiquette différente pour Flutter
-                        },
-                        # --- Configuration du son personnalisé pour Android ---
-                        android=messaging.AndroidConfig(
-                            notification=messaging.AndroidNotification(
-                                # Canal spécifique pour les alertes de stock faible
-                                channel_id='low_stock_channel',
-                                # Nom du fichier son dans android/app/src/main/res/raw (SANS extension)
-                                sound='low_stock_sound'
-                            )
-                        ),
-                        # --- Configuration du son personnalisé pour iOS ---
-                        apns=messaging.APNSConfig(
-                            payload=messaging.APNSPayload(
-                                aps=messaging.Aps(  # ✅ CORRECTION: Aps au lieu de APS
-                                    # Nom du fichier son ajouté au projet Xcode (AVEC extension)
-                                    sound='low_stock_sound.wav'
-                                )
-                            )
-                        )
+        notifications_sent = push_dispatcher.send_to_admins(
+            notification=messaging.Notification(
+                title='⚠️ Alerte Stock Faible !',
+                body=f"Le stock pour '{product.nom}' est de {product.stock_disponible} (seuil: {product.stock_minimum})."
+            ),
+            data={
+                "product_id": str(product.id),
+                "type": "low_stock_alert" # Étiquette différente pour Flutter
+            },
+            # --- Configuration du son personnalisé pour Android ---
+            android=messaging.AndroidConfig(
+                notification=messaging.AndroidNotification(
+                    # Canal spécifique pour les alertes de stock faible
+                    channel_id='low_stock_channel',
+                    # Nom du fichier son dans android/app/src/main/res/raw (SANS extension)
+                    sound='low_stock_sound'
+                )
+            ),
+            # --- Configuration du son personnalisé pour iOS ---
+            apns=messaging.APNSConfig(
+                payload=messaging.APNSPayload(
+                    aps=messaging.Aps(  # ✅ CORRECTION: Aps au lieu de APS
+                        # Nom du fichier son ajouté au projet Xcode (AVEC extension)
+                        sound='low_stock_sound.wav'
                     )
-                    
-                    messaging.send(message)
-                    notifications_sent += 1
-                    current_app.logger.info(f"Notification 'Stock Faible' envoyée à l'admin {admin.id} pour le produit {product.nom}")
-                    
-                except Exception as token_error:
-                    current_app.logger.error(f"Erreur lors de l'envoi de la notification 'Stock Faible' à l'admin {admin.id}: {token_error}")
-        
+                )
+            )
+        )
         current_app.logger.info(f"{notifications_sent} notifications 'Stock Faible' envoyées pour le produit {product.nom}")
         
     except Exception as e:
         current_app.logger.error(f"Erreur lors de l'envoi de la notification de stock faible pour le produit {product.id}: {e}")
+        raise
+
+# --- HANDLERS DE L'OUTBOX (exécutés en arrière-plan, hors requête HTTP) ---
 
-def process_payment_confirmation(order):
+@outbox.handler('order_confirmation_email')
+def handle_order_confirmation_email(order_id):
+    order = db.session.get(Commande, order_id)
+    if order:
+        send_order_confirmation_email(order)
+
+@outbox.handler('new_order_push')
+def handle_new_order_push(order_id):
+    initialize_services()
+    order = db.session.get(Commande, order_id)
+    if order:
+        send_new_order_push_notification(order)
+
+@outbox.handler('low_stock_push')
+def handle_low_stock_push(product_id):
+    initialize_services()
+    product = db.session.get(Produit, product_id)
+    if product:
+        send_low_stock_notification(product)
+
+def process_payment_confirmation(order, transaction_id, source):
     """
     Traite la confirmation d'un paiement : met à jour la BDD, le stock,
-    vide le panier et envoie les notifications.
+    vide le panier et place les notifications dans l'outbox (même transaction).
+    Idempotent : la transaction FedaPay n'est enregistrée qu'une fois
+    (contrainte unique) et la commande ne passe à 'paye' que par
+    compare-and-swap. Retourne False si le paiement était déjà traité.
     """
+    order_id = order.id
     try:
-        # 1. Mettre à jour les statuts de la commande et du paiement
-        order.statut_paiement = 'paye'
-        order.statut = 'confirmee'
-        
-        payment = Paiement.query.filter_by(commande_id=order.id).first()
+        # 1. Réserver le traitement de cette transaction (un doublon concurrent échoue ici)
+        db.session.add(ConfirmationPaiement(
+            fedapay_transaction_id=str(transaction_id), commande_id=order_id, source=source
+        ))
+        try:
+            db.session.flush()
+        except IntegrityError:
+            db.session.rollback()
+            current_app.logger.info(f"Transaction {transaction_id} déjà confirmée ({source}), ignorée.")
+            return False
+
+        # 2. Mettre à jour les statuts de la commande (compare-and-swap) et du paiement
+        current = db.session.query(
+            Commande.statut, Commande.statut_paiement, Commande.date_commande, Commande.total, Commande.utilisateur_id
+        ).filter_by(id=order_id).with_for_update().one()
+        confirmed = Commande.query.filter(
+            Commande.id == order_id, Commande.statut_paiement != 'paye'
+        ).update({'statut_paiement': 'paye', 'statut': 'confirmee'})
+        if not confirmed:
+            db.session.rollback()
+            current_app.logger.info(f"Commande {order_id} déjà payée, confirmation {source} ignorée.")
+            return False
+        stats.record_order_transition(current, (current.statut, current.statut_paiement), ('confirmee', 'paye'))
+        invalidate_after_commit(user_orders_namespace(current.utilisateur_id))
+
+        payment = Paiement.query.filter_by(commande_id=order_id, fedapay_transaction_id=str(transaction_id)).first() \
+            or Paiement.query.filter_by(commande_id=order_id).first()
         if payment:
             payment.statut = 'approved'
+
+        # 3. Acquérir le stock réservé à l'initialisation
+        try:
+            with db.session.begin_nested():
+                stock.consume_order(order_id)
+        except stock.InsufficientStock as e:
+            # Le paiement est encaissé : on confirme quand même et on signale la rupture à l'admin
+            current_app.logger.error(f"Commande {order_id} payée mais {e}")
+            order.notes_admin = f"{order.notes_admin or ''}\n[Paiement] {e}".strip()
         
-        # --- NOUVELLE LOGIQUE CRITIQUE AJOUTÉE ICI ---
-        # 2. Décrémenter le stock des produits commandés
-        details = DetailsCommande.query.filter_by(commande_id=order.id).all()
-        for detail in details:
-            product = detail.produit # Utiliser la relation pré-chargée
-            if product and product.gestion_stock == 'limite':
-                product.stock_disponible -= detail.quantite
-                # Envoyer une notification si le stock devient faible après cet achat
-                if product.stock_disponible <= product.stock_minimum:
-                    send_low_stock_notification(product)
-
-        # 3. Vider le panier de l'utilisateur
+        # Envoyer une notification si le stock devient faible après cet achat
+        for product_id in stock.low_stock_product_ids(order.id):
+            outbox.enqueue('low_stock_push', product_id=product_id)
+
+        # 4. Vider le panier de l'utilisateur
         Panier.query.filter_by(utilisateur_id=order.utilisateur_id).delete()
         # --- FIN DE LA NOUVELLE LOGIQUE ---
         
+        # 5. Notifications (email et push) : envoyées en arrière-plan après le commit
+        outbox.enqueue('order_confirmation_email', order_id=order.id)
+        outbox.enqueue('new_order_push', order_id=order.id)
+        
         db.session.commit()
         current_app.logger.info(f"Statut et stock mis à jour pour la commande {order.numero_commande}.")
-        
-        # 4. Envoyer les notifications (email et push)
-        send_order_confirmation_email(order)
-        send_new_order_push_notification(order)
+        status_hub.publish(order_id, 'paye')
         
         return True
         
     except Exception as e:
-        current_app.logger.error(f"Erreur lors du traitement de la confirmation de paiement pour la commande {order.id}: {e}", exc_info=True)
+        current_app.logger.error(f"Erreur lors du traitement de la confirmation de paiement pour la commande {order_id}: {e}", exc_info=True)
+        db.session.rollback()
+        return False
+
+def confirmation_slot(order_id):
+    """
+    Marqueur partagé entre workers "confirmation en cours" pour une commande.
+    Produit False si un autre traitement le détient déjà (sans attendre).
+    """
+    return cache.lock(f'payment-confirmation:{order_id}',
+                      ttl=current_app.config['PAYMENT_CONFIRMATION_LOCK_TTL'], wait=0)
+
+def refresh_payment_status(order):
+    """
+    Interroge FedaPay pour une commande en attente et confirme le paiement s'il
+    est approuvé. Sans appel si une confirmation est déjà en cours ailleurs.
+    """
+    payment = Paiement.query.filter_by(commande_id=order.id).first()
+    if not payment:
+        return
+    with confirmation_slot(order.id) as acquired:
+        # Confirmation déjà en cours (webhook, autre onglet) : pas d'appel FedaPay
+        if not acquired:
+            return
+        try:
+            client = get_fedapay_client()
+            if not client:
+                return
+
+            # La source de vérité : on interroge FedaPay avec l'API REST
+            transaction_response = client.get_transaction(payment.fedapay_transaction_id)
+            transaction_status = transaction_response['v1/transaction']['status']
+
+            # Si le paiement est approuvé ET que nous ne l'avions pas encore enregistré...
+            if transaction_status == 'approved' and order.statut_paiement != 'paye':
+                # Traiter la confirmation de paiement
+                if process_payment_confirmation(order, payment.fedapay_transaction_id, 'statut'):
+                    current_app.logger.info(f"Paiement confirmé et notifications envoyées pour la commande {order.numero_commande}")
+
+        except Exception as e:
+            current_app.logger.error(f"Erreur lors de la vérification du statut FedaPay pour la commande {order.id}: {str(e)}")
+
+MERCHANT_REFERENCE_PREFIX = 'BLC-'
+
+def merchant_reference(order_id):
+    """Référence marchande FedaPay d'une commande (permet de retrouver la transaction)."""
+    return f"{MERCHANT_REFERENCE_PREFIX}{order_id}"
+
+def record_payment(order_id, transaction_id, montant):
+    """Enregistre la transaction FedaPay d'une commande (transaction courte)."""
+    payment = Paiement(
+        commande_id=order_id, fedapay_transaction_id=str(transaction_id),
+        montant=montant, statut='pending'
+    )
+    db.session.add(payment)
+    db.session.commit()
+    return payment
+
+def close_payment(payment_id, order_id, fedapay_status, message):
+    """
+    Clôt un paiement en attente refusé ou expiré chez FedaPay et annule sa
+    commande (stock rendu), en une seule transaction.
+    """
+    statut = 'declined' if fedapay_status == 'declined' else 'canceled'
+    Paiement.query.filter_by(id=payment_id, statut='pending').update({'statut': statut}, synchronize_session=False)
+    return abandon_order(order_id, message)
+
+def abandon_order(order_id, message):
+    """
+    Annule une commande restée sans transaction FedaPay. La mise à jour est
+    conditionnelle : une commande déjà payée ou traitée n'est jamais touchée.
+    """
+    try:
+        abandoned = Commande.query.filter_by(
+            id=order_id, statut='en_attente', statut_paiement='en_attente'
+        ).update({'statut': 'annulee', 'statut_paiement': 'echoue'}, synchronize_session=False)
+        if abandoned:
+            order = db.session.query(
+                Commande.date_commande, Commande.total, Commande.utilisateur_id).filter_by(id=order_id).one()
+            stats.record_order_transition(order, ('en_attente', 'en_attente'), ('annulee', 'echoue'))
+            invalidate_after_commit(user_orders_namespace(order.utilisateur_id))
+            stock.restore_order(order_id)
+            db.session.add(SuiviCommande(commande_id=order_id, statut='annulee', message=message))
+        db.session.commit()
+        if abandoned:
+            status_hub.publish(order_id, 'echoue')
+        return abandoned == 1
+    except Exception as e:
         db.session.rollback()
+        current_app.logger.error(f"Impossible d'annuler la commande {order_id}: {e}", exc_info=True)
         return False
 
 # --- ROUTES DE PAIEMENT ---
@@ -329,6 +374,9 @@ def initialize_payment():
     """
     Orchestre le début du processus de paiement.
     Crée une commande "en attente" SANS modifier le stock ni vider le panier.
+    La commande est validée avant les appels FedaPay, puis le paiement est
+    enregistré dans une seconde transaction courte ; les commandes restées
+    entre les deux sont traitées par `reconcile_stranded_orders`.
     """
     initialize_services()
     client = get_fedapay_client()
@@ -368,8 +416,6 @@ def initialize_payment():
 
         sous_total = Decimal(0)
         for item in cart_items:
-            if item.produit.gestion_stock == 'limite' and item.quantite > item.produit.stock_disponible:
-                raise ValueError(f"Stock insuffisant pour le produit : {item.produit.nom}")
             sous_total += item.produit.prix_unitaire * item.quantite
 
         zone = ZoneLivraison.query.get(data['zone_livraison_id'])
@@ -400,6 +446,7 @@ def initialize_payment():
         )
         db.session.add(new_order)
         db.session.flush()
+        stats.record_order_created(new_order)
 
         for item in cart_items:
             db.session.add(DetailsCommande(
@@ -407,47 +454,65 @@ def initialize_payment():
                 prix_unitaire=item.produit.prix_unitaire,
                 sous_total=item.produit.prix_unitaire * item.quantite
             ))
-            # <<<--- SUPPRESSION DE LA MODIFICATION DU STOCK ICI ---
+        # Stock retenu jusqu'au paiement (rendu à l'expiration ou à l'annulation)
+        stock.reserve_order(new_order.id, [(item.produit_id, item.quantite) for item in cart_items])
 
+        # --- PHASE 1 : la commande en attente est enregistrée avant tout appel à FedaPay ---
+        db.session.commit()
+        order_id, numero_commande = new_order.id, new_order.numero_commande
         transaction_data = {
-            "description": f"Paiement pour commande #{new_order.numero_commande}", "amount": int(total),
+            "description": f"Paiement pour commande #{numero_commande}", "amount": int(total),
             "currency": { "iso": "XOF" },
-            "callback_url": f"https://benin-luxe-cajou-frontend.vercel.app/payment-success?order_id={new_order.id}",
+            "merchant_reference": merchant_reference(order_id),
+            "callback_url": f"https://benin-luxe-cajou-frontend.vercel.app/payment-success?order_id={order_id}",
             "customer": {
                 "firstname": user.prenom, "lastname": user.nom, "email": user.email,
                 "phone_number": { "number": data['telephone_destinataire'], "country": "bj" }
             }
         }
-
-        transaction_response = client.create_transaction(transaction_data)
-        transaction_id = transaction_response['v1/transaction']['id']
-        token_response = client.generate_token(transaction_id)
-        payment_url = token_response['url']
-
-        db.session.add(Paiement(
-            commande_id=new_order.id, fedapay_transaction_id=str(transaction_id),
-            montant=total, statut='pending'
-        ))
-        
-        # <<<--- SUPPRESSION DU VIDAGE DU PANIER ICI ---
-        
-        db.session.commit()
-
-        current_app.logger.info(f"Transaction FedaPay {transaction_id} créée pour la commande {new_order.numero_commande}.")
-        return jsonify({"payment_url": payment_url}), 201
+        # Rend la connexion au pool : aucune transaction MySQL ouverte pendant les appels FedaPay
+        db.session.close()
 
     except ValueError as e:
         db.session.rollback()
         return jsonify({"msg": str(e)}), 400
-    except requests.exceptions.RequestException as e:
+    except Exception as e:
         db.session.rollback()
+        current_app.logger.error(f"Erreur lors de l'initialisation du paiement: {str(e)}", exc_info=True)
+        return jsonify({"msg": "Une erreur interne est survenue"}), 500
+
+    # --- PHASE 2 : appels FedaPay, sans session ouverte ---
+    try:
+        transaction_response = client.create_transaction(transaction_data)
+        transaction_id = transaction_response['v1/transaction']['id']
+    except (requests.exceptions.HTTPError, FedaPayUnavailable) as e:
+        # FedaPay a refusé la requête (ou elle n'est pas partie) : aucune transaction n'existe
         current_app.logger.error(f"Erreur FedaPay API: {str(e)}")
+        abandon_order(order_id, "Paiement non initialisé : transaction FedaPay refusée.")
         return jsonify({"msg": "Erreur de communication avec le service de paiement"}), 500
+    except requests.exceptions.RequestException as e:
+        # Délai dépassé : la transaction a peut-être été créée, la réconciliation tranchera
+        current_app.logger.error(f"Erreur FedaPay API (commande {order_id} à réconcilier): {str(e)}")
+        return jsonify({"msg": "Erreur de communication avec le service de paiement"}), 500
+
+    # --- PHASE 3 : enregistrement du paiement dans une transaction courte ---
+    try:
+        record_payment(order_id, transaction_id, total)
     except Exception as e:
         db.session.rollback()
-        current_app.logger.error(f"Erreur lors de l'initialisation du paiement: {str(e)}", exc_info=True)
+        current_app.logger.error(f"Paiement {transaction_id} non enregistré pour la commande {order_id} (à réconcilier): {e}", exc_info=True)
         return jsonify({"msg": "Une erreur interne est survenue"}), 500
 
+    try:
+        token_response = client.generate_token(transaction_id)
+        payment_url = token_response['url']
+    except requests.exceptions.RequestException as e:
+        current_app.logger.error(f"Erreur FedaPay API: {str(e)}")
+        return jsonify({"msg": "Erreur de communication avec le service de paiement"}), 500
+
+    current_app.logger.info(f"Transaction FedaPay {transaction_id} créée pour la commande {numero_commande}.")
+    return jsonify({"payment_url": payment_url}), 201
+
 @payment_bp.route('/status/<int:order_id>', methods=['GET'])
 @jwt_required()
 def get_payment_status(order_id):
@@ -463,44 +528,119 @@ def get_payment_status(order_id):
     if order.statut_paiement == 'paye':
         return jsonify({"payment_status": "paye"}), 200
 
-    payment = Paiement.query.filter_by(commande_id=order.id).first()
-    if payment:
-        try:
-            client = get_fedapay_client()
-            if not client:
-                return jsonify({"payment_status": order.statut_paiement}), 200
-            
-            # La source de vérité : on interroge FedaPay avec l'API REST
-            transaction_response = client.get_transaction(payment.fedapay_transaction_id)
-            transaction_status = transaction_response['v1/transaction']['status']
-            
-            # Si le paiement est approuvé ET que nous ne l'avions pas encore enregistré...
-            if transaction_status == 'approved' and order.statut_paiement != 'paye':
-                # Traiter la confirmation de paiement
-                if process_payment_confirmation(order):
-                    current_app.logger.info(f"Paiement confirmé et notifications envoyées pour la commande {order.numero_commande}")
-                
-        except Exception as e:
-            current_app.logger.error(f"Erreur lors de la vérification du statut FedaPay pour la commande {order.id}: {str(e)}")
-    
+    refresh_payment_status(order)
     return jsonify({"payment_status": order.statut_paiement}), 200
 
+@payment_bp.route('/status/<int:order_id>/stream', methods=['GET'])
+@jwt_required(locations=['headers', 'query_string'])
+def stream_payment_status(order_id):
+    """
+    Flux SSE du statut de paiement, à la place du polling de /status.
+    EventSource ne pouvant pas envoyer d'en-tête, le token est aussi accepté
+    en paramètre `?jwt=`. Un événement `status` est émis à chaque changement ;
+    le flux se ferme sur un statut final ou après PAYMENT_STREAM_MAX_DURATION
+    (EventSource se reconnecte alors de lui-même).
+    Chaque flux occupe un thread du worker : au-delà de
+    PAYMENT_STREAM_MAX_CONCURRENT flux, on répond 503 et le client se rabat
+    sur le polling de /status.
+    """
+    user_id = int(get_jwt_identity())
+    order = Commande.query.filter_by(id=order_id, utilisateur_id=user_id).first_or_404()
+    statut = order.statut_paiement
+    # Le flux dure plusieurs minutes : aucune connexion MySQL ne doit rester prise
+    db.session.close()
+
+    streaming = statut not in FINAL_STATUSES
+    if streaming and not status_hub.acquire_stream():
+        response = jsonify({"msg": "Trop de suivis en direct, utilisez le polling du statut.",
+                            "payment_status": statut,
+                            "status_url": f"/api/payment/status/{order_id}"})
+        response.status_code = 503
+        response.headers['Retry-After'] = str(int(current_app.config['PAYMENT_STREAM_POLL_INTERVAL']) or 1)
+        return response
+
+    heartbeat = current_app.config['PAYMENT_STREAM_HEARTBEAT']
+    deadline = time.monotonic() + current_app.config['PAYMENT_STREAM_MAX_DURATION']
+
+    def generate():
+        yield "retry: 3000\n\n"
+        yield sse_event('status', statut)
+        if statut in FINAL_STATUSES:
+            return
+        subscriber = status_hub.subscribe(order_id)
+        last, last_write = statut, time.monotonic()
+        try:
+            while time.monotonic() < deadline:
+                try:
+                    new_statut = subscriber.get(timeout=heartbeat)
+                except queue.Empty:
+                    new_statut = last
+                if new_statut != last:
+                    last, last_write = new_statut, time.monotonic()
+                    yield sse_event('status', new_statut)
+                elif time.monotonic() - last_write >= heartbeat:
+                    # Le watcher republie le même statut à chaque passage : commentaire SSE pour garder la connexion
+                    last_write = time.monotonic()
+                    yield ": keep-alive\n\n"
+                if new_statut in FINAL_STATUSES:
+                    return
+            yield sse_event('timeout', last)
+        finally:
+            status_hub.unsubscribe(order_id, subscriber)
+
+    response = Response(generate(), mimetype='text/event-stream',
+                        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+    if streaming:
+        # Libérée à la fermeture de la réponse, même si le générateur n'a jamais démarré
+        response.call_on_close(status_hub.release_stream)
+    return response
+
+@payment_bp.route('/metrics', methods=['GET'])
+@admin_required()
+def get_payment_metrics():
+    """Latences des appels FedaPay par endpoint et état du disjoncteur (admin)."""
+    client = get_fedapay_client()
+    if not client:
+        return jsonify({"msg": "Service de paiement indisponible"}), 503
+    return jsonify(client.stats()), 200
+
 @payment_bp.route('/webhook', methods=['POST'])
 def fedapay_webhook():
-    """Webhook pour recevoir les notifications de FedaPay - Filet de sécurité"""
-    initialize_services()  # S'assurer que les services sont initialisés
-    
-    data = request.get_json()
-    event_type = data.get('name')
-    
-    if event_type == 'transaction.approved':
-        transaction_data = data.get('data')
-        transaction_id = str(transaction_data.get('id'))
-        
-        payment = Paiement.query.filter_by(fedapay_transaction_id=transaction_id).first()
-        if payment and payment.commande.statut_paiement != 'paye':  # On vérifie pour ne pas traiter 2 fois
-            # Traiter la confirmation de paiement
-            if process_payment_confirmation(payment.commande):
-                current_app.logger.info(f"Webhook: Paiement confirmé et notifications envoyées pour la commande {payment.commande.numero_commande}")
-    
+    """
+    Webhook pour recevoir les notifications de FedaPay - Filet de sécurité.
+    L'événement est vérifié, enregistré tel quel puis acquitté immédiatement ;
+    son traitement (confirmation, stock, notifications) se fait en arrière-plan
+    via l'outbox (voir app/payment/webhooks.py), après relecture de la
+    transaction chez FedaPay. Sans FEDAPAY_WEBHOOK_SECRET, les webhooks sont
+    refusés : FedaPay les renverra, et /status et la réconciliation
+    confirment les paiements entre-temps.
+    """
+    raw_body = request.get_data()
+    secret = current_app.config['FEDAPAY_WEBHOOK_SECRET']
+    if not secret:
+        current_app.logger.error("Webhook FedaPay refusé : FEDAPAY_WEBHOOK_SECRET n'est pas configuré.")
+        return jsonify({"msg": "Webhook non configuré"}), 503
+    if not verify_webhook_signature(raw_body, request.headers.get('X-FEDAPAY-SIGNATURE'),
+                                    secret, current_app.config['FEDAPAY_WEBHOOK_TOLERANCE']):
+        current_app.logger.warning("Webhook FedaPay rejeté : signature invalide.")
+        return jsonify({"msg": "Signature invalide"}), 400
+
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict) or not data.get('name'):
+        return jsonify({"msg": "Événement invalide"}), 400
+
+    transaction = data.get('entity') or data.get('data')
+    transaction_id = str(transaction['id']) if isinstance(transaction, dict) and transaction.get('id') else None
+
+    event = EvenementWebhook(nom=data['name'], fedapay_transaction_id=transaction_id, payload=data)
+    # Doublon (FedaPay renvoie les webhooks) : une lecture sur index unique, conservé sans traitement
+    if transaction_id and data['name'] == 'transaction.approved' and \
+            ConfirmationPaiement.query.filter_by(fedapay_transaction_id=transaction_id).first():
+        event.statut = 'ignore'
+    db.session.add(event)
+    db.session.flush()
+    if event.statut != 'ignore':
+        outbox.enqueue('fedapay_webhook', event_id=event.id)
+    db.session.commit()
+
     return jsonify(success=True), 200
@@ -0,0 +1,112 @@
+# app/payment/status_stream.py
+
+import json
+import queue
+import threading
+import time
+from collections import defaultdict
+
+from app.extensions import db, cache
+from app.models import Commande
+
+# Statuts de paiement après lesquels le flux SSE se ferme
+FINAL_STATUSES = {'paye', 'echoue', 'rembourse'}
+
+
+def sse_event(event, statut):
+    """Formate un événement Server-Sent Events."""
+    return f"event: {event}\ndata: {json.dumps({'payment_status': statut})}\n\n"
+
+
+class PaymentStatusHub:
+    """
+    Pub/sub en mémoire des statuts de paiement, par commande. Les abonnés sont
+    les flux SSE de ce worker. Un unique thread de surveillance relit en une
+    requête le statut de toutes les commandes suivies (confirmations faites
+    par un autre worker) et interroge FedaPay pour celles encore en attente,
+    au plus une fois par PAYMENT_STREAM_FEDAPAY_INTERVAL tous workers confondus.
+    Chaque flux immobilise un thread du worker : leur nombre est borné par
+    PAYMENT_STREAM_MAX_CONCURRENT (voir acquire_stream).
+    """
+
+    def __init__(self):
+        self.app = None
+        self._lock = threading.Lock()
+        self._subscribers = defaultdict(set)
+        self._streams = 0
+        self._wake = threading.Event()
+        self._thread = None
+
+    def init_app(self, app):
+        self.app = app
+        app.extensions['payment_status_hub'] = self
+
+    def acquire_stream(self):
+        """Réserve une place de flux dans ce worker. Retourne False si la limite est atteinte."""
+        with self._lock:
+            if self._streams >= self.app.config['PAYMENT_STREAM_MAX_CONCURRENT']:
+                return False
+            self._streams += 1
+            return True
+
+    def release_stream(self):
+        with self._lock:
+            self._streams -= 1
+
+    def subscribe(self, order_id):
+        subscriber = queue.Queue()
+        with self._lock:
+            self._subscribers[order_id].add(subscriber)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='payment-status-watcher', daemon=True)
+                self._thread.start()
+        self._wake.set()
+        return subscriber
+
+    def unsubscribe(self, order_id, subscriber):
+        with self._lock:
+            subscribers = self._subscribers.get(order_id)
+            if subscribers is not None:
+                subscribers.discard(subscriber)
+                if not subscribers:
+                    del self._subscribers[order_id]
+
+    def publish(self, order_id, statut):
+        """Transmet un statut aux flux de ce worker qui suivent la commande."""
+        with self._lock:
+            subscribers = list(self._subscribers.get(order_id, ()))
+        for subscriber in subscribers:
+            subscriber.put_nowait(statut)
+
+    def _watched(self):
+        with self._lock:
+            return list(self._subscribers)
+
+    def _run(self):
+        while True:
+            order_ids = self._watched()
+            if not order_ids:
+                self._wake.wait()
+                self._wake.clear()
+                continue
+            try:
+                with self.app.app_context():
+                    self._poll(order_ids)
+            except Exception as e:
+                self.app.logger.error(f"Surveillance des paiements en erreur: {e}", exc_info=True)
+            time.sleep(self.app.config['PAYMENT_STREAM_POLL_INTERVAL'])
+
+    def _poll(self, order_ids):
+        from app.payment.routes import refresh_payment_status
+
+        interval = self.app.config['PAYMENT_STREAM_FEDAPAY_INTERVAL']
+        try:
+            for order in Commande.query.filter(Commande.id.in_(order_ids)).all():
+                if order.statut_paiement == 'en_attente' and cache.add(f'payment-watch:{order.id}', 1, ttl=interval):
+                    refresh_payment_status(order)
+                self.publish(order.id, order.statut_paiement)
+        finally:
+            db.session.remove()
+
+
+status_hub = PaymentStatusHub()
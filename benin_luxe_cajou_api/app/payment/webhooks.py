@@ -0,0 +1,190 @@
+# app/payment/webhooks.py
+
+import time
+from datetime import datetime
+
+from flask import current_app
+
+from app import outbox
+from app.extensions import db, cache
+from app.models import Commande, Paiement, EvenementWebhook
+from app.payment.reconciliation import FEDAPAY_APPROVED, FEDAPAY_FAILED
+from app.payment.routes import (
+    MERCHANT_REFERENCE_PREFIX, initialize_services, get_fedapay_client, merchant_reference,
+    record_payment, close_payment, confirmation_slot, process_payment_confirmation
+)
+
+
+class WebhookBusy(Exception):
+    """Un autre worker traite déjà les événements de cette transaction (l'outbox retentera)."""
+
+
+def transaction_of(payload):
+    """Objet transaction d'un événement FedaPay (`entity`, ou `data` pour les anciens envois)."""
+    transaction = payload.get('entity') or payload.get('data')
+    return transaction if isinstance(transaction, dict) else {}
+
+
+def fetch_verified_transaction(transaction_id):
+    """
+    Transaction telle que FedaPay la connaît : le contenu d'un webhook n'est
+    jamais cru sur parole (statut, référence marchande). Lève une exception
+    si FedaPay ne répond pas, pour que l'outbox retente.
+    """
+    client = get_fedapay_client()
+    if client is None:
+        raise RuntimeError("Client FedaPay indisponible")
+    transaction = client.get_transaction(transaction_id).get('v1/transaction') or {}
+    if str(transaction.get('id')) != transaction_id:
+        raise RuntimeError(f"Réponse FedaPay inattendue pour la transaction {transaction_id}")
+    return transaction
+
+
+def _find_payment(transaction_id, verified):
+    """
+    Paiement de la transaction ; s'il n'est pas encore enregistré, on le
+    retrouve par la référence marchande vérifiée auprès de FedaPay. None si
+    la transaction ne correspond à aucune de nos commandes.
+    """
+    reference = verified.get('merchant_reference') or ''
+    payment = Paiement.query.filter_by(fedapay_transaction_id=transaction_id).first()
+    if payment is not None:
+        if reference and reference != merchant_reference(payment.commande_id):
+            current_app.logger.warning(
+                f"Transaction {transaction_id} : référence {reference} différente de la commande {payment.commande_id}")
+            return None
+        return payment
+
+    order_id = reference[len(MERCHANT_REFERENCE_PREFIX):]
+    if reference.startswith(MERCHANT_REFERENCE_PREFIX) and order_id.isdigit():
+        order = db.session.get(Commande, int(order_id))
+        if order is not None:
+            return record_payment(order.id, transaction_id, order.total)
+    return None
+
+
+def apply_event(event):
+    """
+    Applique un événement : 'traite' s'il a produit un effet (ou l'avait déjà
+    produit), 'ignore' s'il ne concerne aucun paiement connu. Lève une
+    exception si le traitement doit être retenté. Seuls le statut et la
+    référence renvoyés par FedaPay pour la transaction sont pris en compte.
+    """
+    transaction = transaction_of(event.payload)
+    announced = event.nom.split('.', 1)[-1] if event.nom.startswith('transaction.') else None
+    if announced not in FEDAPAY_APPROVED | FEDAPAY_FAILED or not transaction.get('id'):
+        return 'ignore'
+
+    transaction_id = str(transaction['id'])
+    verified = fetch_verified_transaction(transaction_id)
+    status = verified.get('status')
+    if status != announced:
+        current_app.logger.warning(
+            f"Webhook {event.nom} pour la transaction {transaction_id}, statut FedaPay : {status}")
+    if status not in FEDAPAY_APPROVED | FEDAPAY_FAILED:
+        return 'ignore'
+
+    payment = _find_payment(transaction_id, verified)
+    if payment is None:
+        return 'ignore'
+
+    if status in FEDAPAY_APPROVED:
+        order = payment.commande
+        # Le marqueur évite aux requêtes /status concurrentes d'interroger FedaPay
+        with confirmation_slot(order.id):
+            process_payment_confirmation(order, transaction_id, 'webhook')
+        db.session.refresh(order)
+        if order.statut_paiement != 'paye':
+            raise RuntimeError(f"Confirmation de la commande {order.id} non enregistrée")
+    elif payment.statut == 'pending':
+        close_payment(payment.id, payment.commande_id, status, f"Webhook FedaPay : transaction {status}.")
+    return 'traite'
+
+
+def process_transaction_events(transaction_id, up_to_id):
+    """
+    Traite, dans l'ordre de réception, les événements non traités d'une
+    transaction jusqu'à `up_to_id`. Un verrou partagé par transaction
+    garantit l'ordre même avec plusieurs workers.
+    """
+    lock_ttl = current_app.config['WEBHOOK_LOCK_TTL']
+    with cache.lock(f'webhook:{transaction_id}', ttl=lock_ttl, wait=5) as acquired:
+        if not acquired:
+            raise WebhookBusy(f"Transaction {transaction_id} déjà en cours de traitement")
+        events = EvenementWebhook.query.filter(
+            EvenementWebhook.fedapay_transaction_id == transaction_id,
+            EvenementWebhook.statut == 'recu',
+            EvenementWebhook.id <= up_to_id
+        ).order_by(EvenementWebhook.id).all()
+        for event in events:
+            process_event(event)
+        return len(events)
+
+
+def process_event(event):
+    """Traite un événement et enregistre son état ; l'erreur est conservée puis relevée."""
+    event_id = event.id
+    try:
+        statut = apply_event(event)
+    except Exception as e:
+        db.session.rollback()
+        event = db.session.get(EvenementWebhook, event_id)
+        event.derniere_erreur = str(e)
+        db.session.commit()
+        raise
+    event = db.session.get(EvenementWebhook, event_id)
+    event.statut = statut
+    event.derniere_erreur = None
+    event.date_traitement = datetime.utcnow()
+    db.session.commit()
+    return statut
+
+
+@outbox.handler('fedapay_webhook')
+def handle_fedapay_webhook(event_id):
+    initialize_services()
+    event = db.session.get(EvenementWebhook, event_id)
+    if event is None or event.statut != 'recu':
+        return
+    if event.fedapay_transaction_id:
+        process_transaction_events(event.fedapay_transaction_id, event.id)
+    else:
+        process_event(event)
+
+
+# --- REJEU ---
+
+def replay_events(event_ids=None, transaction_id=None, since_id=None, inline=False):
+    """
+    Remet des événements stockés à l'état 'recu' et les retraite : via l'outbox
+    (reprise après incident) ou immédiatement (`inline`, tests de charge).
+    Le traitement étant idempotent, rejouer un événement déjà appliqué est
+    sans effet. Retourne (nombre d'événements, durée en secondes).
+    """
+    query = EvenementWebhook.query
+    if event_ids:
+        query = query.filter(EvenementWebhook.id.in_(event_ids))
+    if transaction_id:
+        query = query.filter_by(fedapay_transaction_id=str(transaction_id))
+    if since_id:
+        query = query.filter(EvenementWebhook.id >= since_id)
+    events = query.order_by(EvenementWebhook.id).all()
+
+    started = time.monotonic()
+    for event in events:
+        event.statut = 'recu'
+        if not inline:
+            outbox.enqueue('fedapay_webhook', event_id=event.id)
+    db.session.commit()
+
+    if inline:
+        initialize_services()
+        for event_id in [event.id for event in events]:
+            event = db.session.get(EvenementWebhook, event_id)
+            if event.statut != 'recu':
+                continue
+            try:
+                process_event(event)
+            except Exception as e:
+                current_app.logger.error(f"Rejeu de l'événement {event_id} en échec: {e}")
+    return len(events), time.monotonic() - started
@@ -12,6 +12,9 @@ from flask_mail import Message
 from app.extensions import db, mail
 from app.models import Categorie, TypeProduit, Produit, ImageProduit, NewsletterSubscription
 from app.admin.admin_auth import admin_required
+from app.eager_loading import eager
+from app.statement_budget import statement_budget
+from app.newsletter import create_new_product_campaign
 from app.schemas import (
     categorie_schema, categories_schema,
     type_produit_schema, types_produits_schema,
@@ -136,36 +139,6 @@ def log_request_response(f):
     return decorated_function
 
 
-def send_new_product_email(product):
-    subscribers = NewsletterSubscription.query.filter_by(is_active=True).all()
-    if not subscribers:
-        return
-    
-    # On récupère l'image principale du produit
-    main_image = next((img.url_image for img in product.images if img.est_principale), None)
-    
-    with mail.connect() as conn:
-        for subscriber in subscribers:
-            msg = Message(
-                subject=f"Nouveau Produit : Découvrez notre {product.nom} !",
-                recipients=[subscriber.email],
-                html=f"""
-                <div style="font-family: Arial, sans-serif;">
-                    <h3>Un nouveau délice est arrivé !</h3>
-                    <p>Bonjour,</p>
-                    <p>Nous avons le plaisir de vous présenter notre nouveau produit : <strong>{product.nom}</strong>.</p>
-                    
-                    {'<img src="' + main_image + '" alt="' + product.nom + '" style="max-width: 100%; height: auto;"/>' if main_image else ''}
-                    
-                    <p>{product.description or ''}</p>
-                    <p><strong>Prix :</strong> {product.prix_unitaire} FCFA</p>
-                    <a href="https://VOTRE_SITE_WEB_URL/products/{product.id}" style="...">Voir le produit</a>
-                </div>
-                """
-            )
-            conn.send(msg)
-    current_app.logger.info(f"Email de nouveau produit envoyé à {len(subscribers)} abonnés.")
-
 # ===== DÉCORATEUR COMBINÉ =====
 
 def admin_with_logging():
@@ -302,8 +275,10 @@ def create_produit():
         data = request.form.to_dict()
         nouveau_produit = produit_schema.load(data, session=db.session)
         db.session.add(nouveau_produit)
+        db.session.flush()
+        # Annonce aux abonnés : campagne envoyée en arrière-plan, après le commit
+        create_new_product_campaign(nouveau_produit)
         db.session.commit()
-        send_new_product_email(nouveau_produit)
         current_app.logger.info(f"✅ Produit créé avec ID: {nouveau_produit.id}")
         return jsonify(produit_schema.dump(nouveau_produit)), 201
     except ValidationError as err:
@@ -367,18 +342,20 @@ def get_types_produits():
     return jsonify(types_produits_schema.dump(types)), 200
 
 @products_admin_bp.route('/products', methods=['GET'])
+@statement_budget(3)
 @admin_with_logging()
 def get_produits():
     current_app.logger.info("📋 GET /api/admin/products - Récupération des produits")
-    produits = Produit.query.order_by(Produit.id.desc()).all()
+    produits = eager(Produit.query, produits_schema).order_by(Produit.id.desc()).all()
     current_app.logger.info(f"📊 {len(produits)} produits trouvés")
     return jsonify(produits_schema.dump(produits)), 200
 
 @products_admin_bp.route('/products/<int:id>', methods=['GET'])
+@statement_budget(3)
 @admin_with_logging()
 def get_produit_detail(id):
     current_app.logger.info(f"📋 GET /api/admin/products/{id} - Récupération détail produit")
-    produit = Produit.query.get_or_404(id)
+    produit = eager(Produit.query, produit_schema).filter_by(id=id).first_or_404()
     current_app.logger.info(f"📂 Produit trouvé: {produit.nom}")
     return jsonify(produit_schema.dump(produit)), 200
 
@@ -1,35 +1,72 @@
 # app/public_api/routes.py
 
-from flask import Blueprint, jsonify, request
+import hashlib
+import json
+from datetime import datetime
+from decimal import Decimal
+from flask import Blueprint, jsonify, request, current_app
 from flask_mail import Message
 from app.extensions import db, mail
+from app.cache import (
+    get_version, get_versions, get_snapshot, set_snapshot, get_or_build_snapshot,
+    dumps_json, json_bytes_response, conditional_response, product_stock_namespace
+)
+from app.pagination import KeysetOrder, paginate_keyset, parse_limit
+from app.eager_loading import eager
+from app.statement_budget import statement_budget
+from app.search import product_search_index
+from app.facets import product_facet_index, parse_facet_filters
 from app.models import Categorie, Produit, TypeProduit, ZoneLivraison, NewsletterSubscription
 from app.schemas import (
     categories_schema, 
     produits_schema, 
     produit_schema,
     zones_livraison_schema,
-    newsletter_subscription_schema
+    newsletter_subscription_schema,
+    produits_projection_schema
 )
 from config import Config
 
 
 public_api_bp = Blueprint('public_api', __name__)
 
+# Nombre maximum d'ids acceptés par /products/batch
+MAX_BATCH_IDS = 500
+
+# Les réponses qui contiennent le stock dépendent aussi des mouvements de stock
+CATALOGUE_AND_STOCK = ('catalogue', 'stock')
+
+# Tris disponibles pour /products (`?sort=`), chacun paginable par curseur
+PRODUCT_SORTS = {
+    'recent': KeysetOrder([Produit.id], [int]),
+    'price_asc': KeysetOrder([Produit.prix_unitaire, Produit.id], [Decimal, int], descending=False),
+    'price_desc': KeysetOrder([Produit.prix_unitaire, Produit.id], [Decimal, int]),
+    'newest': KeysetOrder([Produit.date_creation, Produit.id], [datetime.fromisoformat, int]),
+    'oldest': KeysetOrder([Produit.date_creation, Produit.id], [datetime.fromisoformat, int], descending=False),
+}
+
 
 @public_api_bp.route('/catalogue-structure', methods=['GET'])
+@conditional_response('catalogue')
 def get_catalogue_structure():
     """
     Retourne en UN SEUL APPEL toute la hiérarchie des catégories
     et de leurs types de produits respectifs (actifs uniquement).
     C'est l'endpoint principal pour construire la navigation du site.
+    Le JSON est servi depuis un instantané invalidé à chaque écriture du catalogue.
     """
-    # La requête est optimisée par la relation 'lazy="joined"' dans le modèle Categorie
-    categories = Categorie.query.filter_by(statut='actif').all()
-    return jsonify(categories_schema.dump(categories)), 200
+    def build():
+        # La requête est optimisée par la relation 'lazy="joined"' dans le modèle Categorie
+        categories = Categorie.query.filter_by(statut='actif').all()
+        return categories_schema.dump(categories)
+
+    payload = get_or_build_snapshot('catalogue-structure', 'catalogue', build)
+    return json_bytes_response(payload)
 
 
 @public_api_bp.route('/products', methods=['GET'])
+@statement_budget(4)
+@conditional_response(CATALOGUE_AND_STOCK)
 def get_public_products():
     """
     Retourne une liste de produits actifs.
@@ -37,36 +74,205 @@ def get_public_products():
     Exemples:
     - /api/products -> Tous les produits populaires
     - /api/products?type_id=2 -> Produits du type 2
+    - /api/products?type_id=2,3 -> Produits des types 2 ou 3
     - /api/products?category_id=1 -> Tous les produits de la catégorie 1
+    - /api/products?limit=20&cursor=... -> Page suivante ({"items", "next_cursor"})
+    - /api/products?sort=price_asc -> Tri (recent, price_asc, price_desc, newest, oldest)
+    - /api/products?fields=id,nom,prix_unitaire,images -> Projection des champs
+    - /api/products?prix_min=1000&prix_max=5000&type_contenant=sachet&quantite=250-499&en_stock=1
+      -> Filtres à facettes ; ajouter `facets=1` pour recevoir les compteurs par facette
+    Chaque combinaison de filtres est servie depuis un instantané du catalogue
+    (sauf les pages suivantes et les fourchettes de prix, calculées à chaque appel).
     """
-    query = Produit.query.filter_by(statut='actif')
-    
-    # Récupérer les paramètres de l'URL
-    type_id = request.args.get('type_id', type=int)
-    category_id = request.args.get('category_id', type=int)
-
-    if type_id:
-        # Filtrer par le type de produit exact
-        query = query.filter(Produit.type_produit_id == type_id)
-    elif category_id:
-        # Filtrer par la catégorie parente (nécessite une jointure)
-        query = query.join(TypeProduit).filter(TypeProduit.category_id == category_id)
-    
-    # Si aucun filtre, on peut retourner les plus récents ou les plus populaires
-    produits = query.order_by(Produit.id.desc()).all()
-    return jsonify(produits_schema.dump(produits)), 200
+    # Récupérer les paramètres de l'URL (type_id et category_id acceptent une liste : 1,2)
+    try:
+        facet_filters, price_range = parse_facet_filters(request.args)
+    except ValueError as e:
+        return jsonify({"msg": str(e)}), 400
+    type_ids = facet_filters.get('type_id')
+    category_ids = facet_filters.get('category_id')
+    with_facets = request.args.get('facets', '').lower() in ('1', 'true', 'oui')
+
+    sort = request.args.get('sort', 'recent')
+    order = PRODUCT_SORTS.get(sort)
+    if order is None:
+        return jsonify({"msg": f"Tri invalide. Valeurs possibles : {', '.join(PRODUCT_SORTS)}"}), 400
+
+    schema = produits_schema
+    fields = {f.strip() for f in request.args.get('fields', '').split(',') if f.strip()}
+    if fields:
+        try:
+            schema = produits_projection_schema(tuple(sorted(fields)))
+        except ValueError:
+            return jsonify({"msg": "Champs demandés invalides"}), 400
+
+    def build():
+        query = Produit.query.filter_by(statut='actif')
+        if type_ids:
+            # Filtrer par le(s) type(s) de produit exact(s)
+            query = query.filter(Produit.type_produit_id.in_(type_ids))
+        elif category_ids:
+            # Filtrer par la ou les catégories parentes (nécessite une jointure)
+            query = query.join(TypeProduit).filter(TypeProduit.category_id.in_(category_ids))
+
+        # Les filtres à facettes sont résolus par l'index précalculé, pas par des GROUP BY
+        facets = None
+        if with_facets or set(facet_filters) - {'type_id', 'category_id'} or price_range != (None, None):
+            product_ids, facets = product_facet_index.query(facet_filters, price_range, with_counts=with_facets)
+            query = query.filter(Produit.id.in_(product_ids))
+        query = eager(query, schema)
+
+        # Sans `limit` ni `cursor`, on conserve l'ancien format (liste complète)
+        if 'limit' not in request.args and 'cursor' not in request.args:
+            produits = query.order_by(*order.order_by()).all()
+            if with_facets:
+                return {"items": schema.dump(produits), "facets": facets}
+            return schema.dump(produits)
+
+        produits, next_cursor = paginate_keyset(
+            query, order,
+            limit=parse_limit(request.args.get('limit', type=int)),
+            cursor=request.args.get('cursor')
+        )
+        response = {"items": schema.dump(produits), "next_cursor": next_cursor}
+        if with_facets:
+            response["facets"] = facets
+        return response
+
+    # Les curseurs et les prix ont un nombre de valeurs non borné : pas d'instantané
+    cacheable = not request.args.get('cursor') and price_range == (None, None)
+    try:
+        if cacheable:
+            key = 'products:' + _products_snapshot_key(facet_filters, sort, fields, with_facets)
+            payload = get_or_build_snapshot(key, CATALOGUE_AND_STOCK, build)
+        else:
+            payload = dumps_json(build())
+    except ValueError as e:
+        # Curseur de pagination invalide
+        return jsonify({"msg": str(e)}), 400
+    return json_bytes_response(payload)
+
+
+def _products_snapshot_key(facet_filters, sort, fields, with_facets):
+    """
+    Empreinte des paramètres reconnus par /products, normalisés (valeurs
+    triées, limite bornée) : les paramètres inconnus ou l'ordre de l'URL ne
+    créent pas de nouvel instantané.
+    """
+    paginated = 'limit' in request.args or 'cursor' in request.args
+    params = {
+        'filters': {dimension: sorted(map(str, values)) for dimension, values in facet_filters.items()},
+        'sort': sort,
+        'fields': sorted(fields),
+        'facets': with_facets,
+        'limit': parse_limit(request.args.get('limit', type=int)) if paginated else None,
+    }
+    return hashlib.sha1(json.dumps(params, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+@public_api_bp.route('/products/search', methods=['GET'])
+@statement_budget(3)
+@conditional_response(CATALOGUE_AND_STOCK)
+def search_public_products():
+    """
+    Recherche plein texte dans les produits actifs (nom, description, type, catégorie).
+    Insensible aux accents et à la casse, avec correspondance par préfixe.
+    Exemple: /api/products/search?q=cajou grill&limit=10
+    """
+    q = request.args.get('q', '').strip()
+    if not q:
+        return jsonify({"msg": "Paramètre de recherche 'q' requis"}), 400
+
+    limit = parse_limit(request.args.get('limit', type=int))
+    product_ids = product_search_index.search(q, limit=limit)
+    if not product_ids:
+        return jsonify({"items": []}), 200
+
+    # On recharge les produits en une requête puis on rétablit l'ordre de pertinence
+    produits = eager(Produit.query, produits_schema).filter(
+        Produit.id.in_(product_ids), Produit.statut == 'actif'
+    ).all()
+    rank = {product_id: position for position, product_id in enumerate(product_ids)}
+    produits.sort(key=lambda p: rank[p.id])
+    return jsonify({"items": produits_schema.dump(produits)}), 200
 
 
 @public_api_bp.route('/products/<int:id>', methods=['GET'])
+@statement_budget(2)
+@conditional_response(CATALOGUE_AND_STOCK)
 def get_public_product_detail(id):
     """
     Retourne les détails d'un seul produit ACTIF.
+    Le JSON est servi depuis le cache par produit, partagé avec /products/batch,
+    invalidé par le catalogue ou par le stock de CE produit seulement.
+    """
+    def build():
+        produit = eager(Produit.query, produit_schema).filter_by(id=id, statut='actif').first_or_404()
+        return produit_schema.dump(produit)
+
+    return json_bytes_response(get_or_build_snapshot(f'produit:{id}', ('catalogue', product_stock_namespace(id)), build))
+
+
+@public_api_bp.route('/products/batch', methods=['GET', 'POST'])
+@statement_budget(2)
+@conditional_response(CATALOGUE_AND_STOCK)
+def get_public_products_batch():
+    """
+    Retourne plusieurs produits ACTIFS en un seul appel, dans l'ordre demandé.
+    Exemples:
+    - GET /api/products/batch?ids=3,1,2
+    - POST /api/products/batch {"ids": [3, 1, 2]} (pour les longues listes)
+    Réponse: {"items": [...], "missing": [ids inconnus ou inactifs]}
     """
-    produit = Produit.query.filter_by(id=id, statut='actif').first_or_404()
-    return jsonify(produit_schema.dump(produit)), 200
+    if request.method == 'POST':
+        raw_ids = (request.get_json(silent=True) or {}).get('ids')
+    else:
+        raw_ids = request.args.get('ids', '').split(',')
+
+    try:
+        # Dédoublonnage en conservant l'ordre demandé
+        product_ids = list(dict.fromkeys(int(i) for i in raw_ids if str(i).strip()))
+    except (TypeError, ValueError):
+        return jsonify({"msg": "Liste d'ids invalide"}), 400
+    if not product_ids:
+        return jsonify({"msg": "Paramètre 'ids' requis"}), 400
+    if len(product_ids) > MAX_BATCH_IDS:
+        return jsonify({"msg": f"Maximum {MAX_BATCH_IDS} produits par appel"}), 400
+
+    # 1. On réutilise les produits déjà sérialisés dans le cache par produit
+    # (même version que /products/<id> : catalogue + stock du produit)
+    catalogue_version = get_version('catalogue')
+    stock_versions = catalogue_version and get_versions([product_stock_namespace(i) for i in product_ids])
+    versions = {
+        product_id: f'{catalogue_version}.{stock_versions[product_stock_namespace(product_id)]}'
+        if stock_versions else None
+        for product_id in product_ids
+    }
+    fragments = {}
+    for product_id in product_ids:
+        payload = get_snapshot(f'produit:{product_id}', versions[product_id])
+        if payload is not None:
+            fragments[product_id] = payload
+
+    # 2. Les autres sont chargés en une seule requête IN et mis en cache
+    to_fetch = [product_id for product_id in product_ids if product_id not in fragments]
+    if to_fetch:
+        produits = eager(Produit.query, produits_schema).filter(
+            Produit.id.in_(to_fetch), Produit.statut == 'actif'
+        ).all()
+        for produit in produits:
+            payload = dumps_json(produit_schema.dump(produit))
+            set_snapshot(f'produit:{produit.id}', versions[produit.id], payload)
+            fragments[produit.id] = payload
+
+    # 3. On assemble directement les fragments JSON, sans re-sérialiser
+    missing = [product_id for product_id in product_ids if product_id not in fragments]
+    items = b','.join(fragments[product_id] for product_id in product_ids if product_id in fragments)
+    return json_bytes_response(b'{"items":[' + items + b'],"missing":' + dumps_json(missing) + b'}')
 
 
 @public_api_bp.route('/delivery-zones', methods=['GET'])
+@conditional_response('delivery_zones')
 def get_public_delivery_zones():
     """
     Retourne la liste des zones de livraison ACTIVES pour la page de checkout.
@@ -78,6 +284,7 @@ def get_public_delivery_zones():
 # NOTE: L'ancienne route '/categories' n'est plus nécessaire pour la page d'accueil,
 # mais on la garde car elle peut être utile ailleurs et ne coûte rien.
 @public_api_bp.route('/categories', methods=['GET'])
+@conditional_response('catalogue')
 def get_public_categories():
     """
     Retourne la liste simple de toutes les catégories ACTIVES.
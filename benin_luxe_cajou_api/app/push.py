@@ -0,0 +1,123 @@
+# app/push.py
+
+import itertools
+
+import firebase_admin
+from firebase_admin import messaging
+from flask import current_app
+
+from .extensions import db
+from .models import Utilisateur
+
+# Limite imposée par FCM pour un MulticastMessage
+FCM_MAX_TOKENS_PER_BATCH = 500
+
+
+class PushDeliveryError(Exception):
+    """Aucun appareil n'a pu être notifié à cause d'erreurs temporaires (à retenter)."""
+
+
+# --- TRANSPORTS ---
+
+class FirebaseTransport:
+    """Envoi réel via firebase_admin (une requête HTTP par lot de 500 tokens)."""
+
+    def is_available(self):
+        return bool(firebase_admin._apps)
+
+    def send_each_for_multicast(self, message):
+        return messaging.send_each_for_multicast(message)
+
+
+class FakeFirebaseTransport:
+    """
+    Transport local qui imite FCM sans réseau : les messages sont conservés
+    dans `sent`, et les tokens listés dans `unregistered` sont rejetés comme
+    le ferait Firebase pour un appareil désinstallé.
+    """
+
+    def __init__(self, unregistered=()):
+        self.sent = []
+        self.unregistered = set(unregistered)
+        self._ids = itertools.count(1)
+
+    def is_available(self):
+        return True
+
+    def send_each_for_multicast(self, message):
+        self.sent.append(message)
+        responses = []
+        for token in message.tokens:
+            if token in self.unregistered:
+                error = messaging.UnregisteredError("Requested entity was not found.")
+                responses.append(messaging.SendResponse(None, error))
+            else:
+                responses.append(messaging.SendResponse({'name': f'projects/fake/messages/{next(self._ids)}'}, None))
+        return messaging.BatchResponse(responses)
+
+
+# --- SERVICE D'ENVOI ---
+
+class PushDispatcher:
+    """
+    Envoie une même notification à tous les admins ayant un token FCM,
+    par lots de FCM_MAX_TOKENS_PER_BATCH tokens (send_each_for_multicast),
+    puis efface les tokens que Firebase signale comme désinscrits.
+    """
+
+    def __init__(self, transport=None):
+        self.transport = transport
+
+    def init_app(self, app):
+        if app.config['PUSH_TRANSPORT'] == 'fake':
+            self.transport = FakeFirebaseTransport()
+        else:
+            self.transport = FirebaseTransport()
+        app.extensions['push'] = self
+
+    def send_to_admins(self, notification, data=None, android=None, apns=None):
+        """
+        Retourne le nombre d'appareils notifiés. Lève PushDeliveryError si tous
+        les envois ont échoué pour une raison temporaire (l'outbox retentera).
+        """
+        if not self.transport.is_available():
+            current_app.logger.warning("Firebase non initialisé, impossible d'envoyer la notification push.")
+            return 0
+
+        rows = db.session.query(Utilisateur.fcm_token).filter(
+            Utilisateur.role == 'admin', Utilisateur.fcm_token.isnot(None), Utilisateur.fcm_token != ''
+        ).distinct().all()
+        tokens = [row.fcm_token for row in rows]
+
+        sent = 0
+        unregistered = set()
+        errors = []
+        for start in range(0, len(tokens), FCM_MAX_TOKENS_PER_BATCH):
+            batch = tokens[start:start + FCM_MAX_TOKENS_PER_BATCH]
+            message = messaging.MulticastMessage(
+                tokens=batch, notification=notification, data=data, android=android, apns=apns
+            )
+            response = self.transport.send_each_for_multicast(message)
+            for token, result in zip(batch, response.responses):
+                if result.success:
+                    sent += 1
+                elif isinstance(result.exception, (messaging.UnregisteredError, messaging.SenderIdMismatchError)):
+                    unregistered.add(token)
+                else:
+                    errors.append(result.exception)
+
+        if unregistered:
+            Utilisateur.query.filter(Utilisateur.fcm_token.in_(unregistered)).update(
+                {'fcm_token': None}, synchronize_session=False
+            )
+            db.session.commit()
+            current_app.logger.info(f"{len(unregistered)} token(s) FCM désinscrit(s) supprimé(s)")
+
+        if errors:
+            current_app.logger.error(f"{len(errors)} notification(s) push en échec: {errors[0]}")
+            if not sent:
+                raise PushDeliveryError(str(errors[0]))
+        return sent
+
+
+push_dispatcher = PushDispatcher()
@@ -0,0 +1,155 @@
+# app/query_plans.py
+
+import random
+import uuid
+from datetime import datetime, timedelta
+
+from sqlalchemy import insert, select
+
+from .extensions import db
+from .models import (
+    Panier, Commande, Paiement, Produit, Utilisateur, DetailsCommande,
+    Categorie, TypeProduit, AdresseLivraison
+)
+
+# Répartition des statuts du jeu de données (proche de la production)
+SEED_STATUTS_COMMANDE = [('livree', 'paye')] * 6 + [('confirmee', 'paye')] + [('en_attente', 'en_attente')] * 2 \
+    + [('annulee', 'echoue')]
+SEED_STATUTS_PAIEMENT = {'paye': 'approved', 'en_attente': 'pending', 'echoue': 'declined'}
+
+
+def _hot_queries():
+    """
+    Requêtes fréquentes de l'API, avec des valeurs représentatives. Chacune
+    doit être servie par un index (voir la migration 0008).
+    """
+    since = datetime.utcnow() - timedelta(days=30)
+    return {
+        'panier_client_produit': select(Panier.id).where(Panier.utilisateur_id == 1, Panier.produit_id == 1),
+        'panier_invite': select(Panier.id).where(Panier.session_id == 'session'),
+        'historique_client': select(Commande.id).where(
+            Commande.utilisateur_id == 1, Commande.statut != 'en_attente'
+        ).order_by(Commande.date_commande.desc()),
+        'commandes_payees_periode': select(Commande.id).where(
+            Commande.statut_paiement == 'paye', Commande.date_commande >= since),
+        'commandes_periode': select(Commande.id).where(Commande.date_commande >= since),
+        'paiement_transaction': select(Paiement.id).where(Paiement.fedapay_transaction_id == 'transaction'),
+        'paiements_commande': select(Paiement.id).where(Paiement.commande_id == 1),
+        'paiements_en_attente': select(Paiement.id).where(Paiement.statut == 'pending', Paiement.id > 0),
+        'catalogue_type': select(Produit.id).where(Produit.statut == 'actif', Produit.type_produit_id == 1),
+        'nouveaux_clients': select(Utilisateur.id).where(
+            Utilisateur.role == 'client', Utilisateur.date_creation >= since),
+        'lignes_commande': select(DetailsCommande.id).where(DetailsCommande.commande_id == 1),
+    }
+
+
+def _insert(model, rows, marker_column, marker):
+    """Insère les lignes en une seule requête et retourne leurs ids (retrouvés par le marqueur)."""
+    db.session.execute(insert(model), rows)
+    return list(db.session.scalars(
+        select(model.id).where(marker_column.startswith(marker)).order_by(model.id)))
+
+
+def seed_representative_data(rows=2000):
+    """
+    Insère dans la transaction courante un jeu de données représentatif :
+    `rows` clients, commandes et paiements, deux lignes par commande, des
+    paniers clients et invités, un catalogue de 200 produits ; dates sur un
+    an. L'appelant annule la transaction. InnoDB compte déjà les lignes non
+    validées de la transaction dans ses estimations : EXPLAIN choisit ses
+    plans comme sur une base peuplée.
+    """
+    rng = random.Random(0)
+    marker = f"explain-{uuid.uuid4().hex[:8]}"
+    now = datetime.utcnow()
+
+    def some_date():
+        return now - timedelta(days=rng.uniform(0, 365))
+
+    categorie_ids = _insert(Categorie, [{'nom': f"{marker}-{i}"} for i in range(5)], Categorie.nom, marker)
+    type_ids = _insert(TypeProduit, [
+        {'category_id': categorie_ids[i % 5], 'nom': f"{marker}-{i}"} for i in range(20)
+    ], TypeProduit.nom, marker)
+    produit_ids = _insert(Produit, [
+        {'type_produit_id': type_ids[i % 20], 'nom': f"{marker}-{i}", 'quantite_contenant': 250,
+         'prix_unitaire': rng.randint(5, 200) * 100, 'stock_disponible': rng.randint(0, 100),
+         'statut': 'actif' if i % 10 else 'inactif'}
+        for i in range(200)
+    ], Produit.nom, marker)
+    user_ids = _insert(Utilisateur, [
+        {'nom': 'Client', 'prenom': str(i), 'email': f"{marker}-{i}@example.com", 'mot_de_passe': '-',
+         'role': 'admin' if i < 5 else 'client', 'date_creation': some_date()}
+        for i in range(rows)
+    ], Utilisateur.email, marker)
+    adresse_ids = _insert(AdresseLivraison, [
+        {'utilisateur_id': user_id, 'telephone_destinataire': '+22900000000', 'ville': 'Cotonou',
+         'description_adresse': marker, 'type_adresse': 'manuelle'}
+        for user_id in user_ids
+    ], AdresseLivraison.description_adresse, marker)
+
+    commandes = []
+    for i in range(rows):
+        client = rng.randrange(rows)
+        statut, statut_paiement = rng.choice(SEED_STATUTS_COMMANDE)
+        commandes.append({'numero_commande': f"{marker}-{i}", 'utilisateur_id': user_ids[client],
+                          'adresse_livraison_id': adresse_ids[client], 'statut': statut,
+                          'statut_paiement': statut_paiement, 'sous_total': 5000, 'total': 5000,
+                          'date_commande': some_date(), 'notes_admin': marker})
+    # Marqueur dans notes_admin : le numéro peut être réécrit par le trigger MySQL
+    commande_ids = _insert(Commande, commandes, Commande.notes_admin, marker)
+
+    db.session.execute(insert(DetailsCommande), [
+        {'commande_id': commande_id, 'produit_id': rng.choice(produit_ids), 'quantite': 1,
+         'prix_unitaire': 2500, 'sous_total': 2500}
+        for commande_id in commande_ids for _ in range(2)
+    ])
+    db.session.execute(insert(Paiement), [
+        {'commande_id': commande_id, 'fedapay_transaction_id': f"{marker}-{i}", 'montant': 5000,
+         'statut': SEED_STATUTS_PAIEMENT[commande['statut_paiement']]}
+        for i, (commande_id, commande) in enumerate(zip(commande_ids, commandes))
+    ])
+    # Un panier sur deux appartient à un invité ; (client, produit) reste unique
+    db.session.execute(insert(Panier), [
+        {'utilisateur_id': None if i % 2 else user_ids[i], 'session_id': f"{marker}-{i}" if i % 2 else None,
+         'produit_id': produit_ids[i % len(produit_ids)], 'quantite': 1}
+        for i in range(rows)
+    ])
+
+
+def explain(statement):
+    """
+    Plan d'exécution d'une requête sur la base courante : liste de couples
+    (description, parcours_complet). MySQL et SQLite uniquement.
+    """
+    connection = db.session.connection()
+    dialect = connection.dialect.name
+    sql = str(statement.compile(dialect=connection.dialect, compile_kwargs={'literal_binds': True}))
+
+    if dialect == 'mysql':
+        plan = []
+        for row in connection.exec_driver_sql(f'EXPLAIN {sql}').mappings():
+            # ALL : lecture de toute la table ; index : lecture de tout un index
+            description = f"{row['table']}: type={row['type']} key={row['key']} rows={row['rows']}"
+            plan.append((description, row['type'] in ('ALL', 'index')))
+        return plan
+    if dialect == 'sqlite':
+        plan = []
+        for row in connection.exec_driver_sql(f'EXPLAIN QUERY PLAN {sql}'):
+            detail = row[3]
+            plan.append((detail, detail.startswith('SCAN ') and not detail.startswith('SCAN CONSTANT')))
+        return plan
+    raise NotImplementedError(f"EXPLAIN non pris en charge pour {dialect}")
+
+
+def check_hot_queries(seed_rows=None):
+    """
+    Retourne {nom: plan} pour chaque requête fréquente. Avec `seed_rows`, un
+    jeu de données représentatif est inséré avant les EXPLAIN ; tout est
+    annulé à la fin, la base n'est jamais modifiée.
+    """
+    try:
+        if seed_rows:
+            seed_representative_data(seed_rows)
+        return {name: explain(statement) for name, statement in _hot_queries().items()}
+    finally:
+        db.session.rollback()
@@ -1,5 +1,6 @@
 # app/schemas.py
 
+from functools import lru_cache
 from .extensions import ma
 from .models import (
     Categorie, TypeProduit, Produit, ImageProduit, Panier, NewsletterSubscription,
@@ -68,7 +69,7 @@ class PanierSchema(ma.SQLAlchemyAutoSchema):
 class UtilisateurSchema(ma.SQLAlchemyAutoSchema):
     derniere_connexion = ma.auto_field()
     date_creation = ma.auto_field()
-    commandes = ma.Nested('CommandeSummarySchema', many=True, dump_only=True)
+    # Pas d'historique imbriqué : voir /api/profile/orders et stats.client_order_summary()
     class Meta:
         model = Utilisateur
         exclude = ("mot_de_passe", "token_verification", "role")
@@ -184,3 +185,12 @@ commandes_schema = CommandeSchema(many=True, only=("id", "numero_commande", "cli
 commande_detail_schema = CommandeDetailSchema()
 newsletter_subscription_schema = NewsletterSubscriptionSchema()
 
+
+@lru_cache(maxsize=64)
+def produits_projection_schema(fields):
+    """
+    Schéma produit (many=True) réduit aux champs demandés via `?fields=`.
+    `fields` est un tuple trié pour que le cache réutilise les instances.
+    Lève ValueError si un champ est inconnu.
+    """
+    return ProduitSchema(many=True, only=fields)
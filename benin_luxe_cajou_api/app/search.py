@@ -0,0 +1,247 @@
+# app/search.py
+
+import bisect
+import itertools
+import math
+import re
+import threading
+import unicodedata
+from collections import Counter, defaultdict
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from .cache import get_version, bumped_locally
+from .extensions import db
+from .models import Categorie, TypeProduit, Produit
+
+# Mots vides français ignorés à l'indexation comme à la recherche
+STOPWORDS = {
+    'a', 'au', 'aux', 'avec', 'd', 'de', 'des', 'du', 'en', 'et', 'l', 'la', 'le', 'les',
+    'ou', 'par', 'pour', 'sur', 'un', 'une',
+}
+
+# Poids de chaque champ dans le score (un terme du nom compte plus que la description)
+FIELD_WEIGHTS = {'nom': 3.0, 'type': 2.0, 'categorie': 1.5, 'description': 1.0}
+
+# Paramètres BM25 classiques
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# Un terme trouvé par préfixe ("grill" -> "grillee") pèse moins qu'un terme exact
+PREFIX_PENALTY = 0.8
+MAX_PREFIX_EXPANSIONS = 50
+
+_TOKEN_RE = re.compile(r'[a-z0-9]+')
+
+
+def normalize(text):
+    """Minuscules et suppression des accents : "Grillée" -> "grillee"."""
+    decomposed = unicodedata.normalize('NFKD', text or '')
+    return ''.join(c for c in decomposed if not unicodedata.combining(c)).lower()
+
+
+def tokenize(text):
+    return [token for token in _TOKEN_RE.findall(normalize(text)) if token not in STOPWORDS]
+
+
+class ProductSearchIndex:
+    """
+    Index inversé en mémoire sur les produits actifs (nom, description,
+    type et catégorie), avec classement BM25 pondéré par champ.
+    Les modifications du catalogue sont appliquées à la prochaine recherche :
+    seuls les produits modifiés sont ré-indexés, sauf si un type ou une
+    catégorie a changé, ou si la version du catalogue a été incrémentée par
+    un autre worker (reconstruction complète).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._built = False
+        self._version = None
+        self._pending_ids = set()
+        self._needs_rebuild = False
+        self._postings = defaultdict(dict)   # terme -> {produit_id: tf pondérée}
+        self._doc_terms = {}                 # produit_id -> termes indexés
+        self._doc_lengths = {}               # produit_id -> longueur pondérée
+        self._total_length = 0.0
+        self._sorted_terms = []
+        self._terms_dirty = False
+
+    # --- SIGNALEMENT DES CHANGEMENTS (appelé après commit) ---
+
+    def mark_changed(self, product_ids=(), rebuild=False):
+        with self._lock:
+            self._pending_ids.update(product_ids)
+            self._needs_rebuild = self._needs_rebuild or rebuild
+
+    # --- CONSTRUCTION ---
+
+    def _fetch_rows(self, product_ids=None):
+        query = db.session.query(
+            Produit.id,
+            Produit.nom,
+            Produit.description,
+            TypeProduit.nom.label('type_nom'),
+            Categorie.nom.label('categorie_nom'),
+        ).join(TypeProduit, Produit.type_produit_id == TypeProduit.id
+        ).join(Categorie, TypeProduit.category_id == Categorie.id
+        ).filter(Produit.statut == 'actif')
+        if product_ids is not None:
+            query = query.filter(Produit.id.in_(product_ids))
+        return query.all()
+
+    def _remove(self, product_id):
+        for term in self._doc_terms.pop(product_id, ()):
+            postings = self._postings[term]
+            postings.pop(product_id, None)
+            if not postings:
+                del self._postings[term]
+                self._terms_dirty = True
+        self._total_length -= self._doc_lengths.pop(product_id, 0.0)
+
+    def _add(self, row):
+        frequencies = Counter()
+        for field, text in (('nom', row.nom), ('description', row.description),
+                            ('type', row.type_nom), ('categorie', row.categorie_nom)):
+            for token in tokenize(text):
+                frequencies[token] += FIELD_WEIGHTS[field]
+
+        for term, tf in frequencies.items():
+            if term not in self._postings:
+                self._terms_dirty = True
+            self._postings[term][row.id] = tf
+        self._doc_terms[row.id] = set(frequencies)
+        length = sum(frequencies.values())
+        self._doc_lengths[row.id] = length
+        self._total_length += length
+
+    def _rebuild(self):
+        self._postings.clear()
+        self._doc_terms.clear()
+        self._doc_lengths.clear()
+        self._total_length = 0.0
+        for row in self._fetch_rows():
+            self._add(row)
+        self._terms_dirty = True
+        self._built = True
+
+    def _sync(self):
+        """Applique les changements en attente. Doit être appelé sous verrou."""
+        version = get_version('catalogue')
+        # Cache indisponible (version None) : les changements des autres workers
+        # ne sont plus visibles, l'index est reconstruit à chaque recherche
+        foreign_change = version is None or self._version is not None and version != self._version \
+            and not bumped_locally('catalogue', self._version, version)
+        self._version = version
+
+        if not self._built or self._needs_rebuild or foreign_change:
+            self._needs_rebuild = False
+            self._pending_ids.clear()
+            self._rebuild()
+        elif self._pending_ids:
+            product_ids, self._pending_ids = self._pending_ids, set()
+            for product_id in product_ids:
+                self._remove(product_id)
+            # Les produits supprimés ou devenus inactifs ne reviennent pas
+            for row in self._fetch_rows(product_ids):
+                self._add(row)
+
+        if self._terms_dirty:
+            self._sorted_terms = sorted(self._postings)
+            self._terms_dirty = False
+
+    # --- RECHERCHE ---
+
+    def _expand(self, token):
+        """Retourne [(terme, poids)] : le terme exact et ceux qui le prolongent."""
+        matches = []
+        start = bisect.bisect_left(self._sorted_terms, token)
+        for term in itertools.islice(self._sorted_terms, start, start + MAX_PREFIX_EXPANSIONS):
+            if not term.startswith(token):
+                break
+            matches.append((term, 1.0 if term == token else PREFIX_PENALTY))
+        return matches
+
+    def search(self, query, limit=20):
+        """
+        Retourne la liste des ids de produits correspondant à `query`, du plus
+        pertinent au moins pertinent. Chaque mot doit correspondre (exactement
+        ou par préfixe) à au moins un terme du produit.
+        """
+        tokens = tokenize(query)
+        if not tokens:
+            return []
+
+        with self._lock:
+            self._sync()
+            doc_count = len(self._doc_lengths)
+            if not doc_count:
+                return []
+            avg_length = self._total_length / doc_count
+
+            scores = None
+            for token in dict.fromkeys(tokens):
+                token_scores = defaultdict(float)
+                for term, weight in self._expand(token):
+                    postings = self._postings[term]
+                    idf = math.log(1 + (doc_count - len(postings) + 0.5) / (len(postings) + 0.5))
+                    for product_id, tf in postings.items():
+                        norm = BM25_K1 * (1 - BM25_B + BM25_B * self._doc_lengths[product_id] / avg_length)
+                        score = weight * idf * tf * (BM25_K1 + 1) / (tf + norm)
+                        token_scores[product_id] = max(token_scores[product_id], score)
+
+                if scores is None:
+                    scores = token_scores
+                else:
+                    scores = {pid: s + token_scores[pid] for pid, s in scores.items() if pid in token_scores}
+                if not scores:
+                    return []
+
+        ranked = sorted(scores.items(), key=lambda item: (-item[1], -item[0]))
+        return [product_id for product_id, _ in ranked[:limit]]
+
+
+product_search_index = ProductSearchIndex()
+
+
+# --- SUIVI DES MODIFICATIONS DU CATALOGUE ---
+
+def _search_changes(session):
+    return session.info.setdefault('search_changes', {'ids': set(), 'rebuild': False})
+
+
+@event.listens_for(Session, 'after_flush')
+def _collect_product_changes(session, flush_context):
+    changes = None
+    for obj in itertools.chain(session.new, session.dirty, session.deleted):
+        if isinstance(obj, Produit):
+            changes = changes or _search_changes(session)
+            changes['ids'].add(obj.id)
+        elif isinstance(obj, (TypeProduit, Categorie)):
+            changes = changes or _search_changes(session)
+            changes['rebuild'] = True
+
+
+@event.listens_for(Session, 'do_orm_execute')
+def _collect_bulk_product_changes(orm_execute_state):
+    if not (orm_execute_state.is_update or orm_execute_state.is_delete):
+        return
+    if orm_execute_state.execution_options.get('stock_only'):
+        # Le stock n'est pas indexé
+        return
+    mapper = orm_execute_state.bind_mapper
+    if mapper is not None and mapper.class_ in (Produit, TypeProduit, Categorie):
+        _search_changes(orm_execute_state.session)['rebuild'] = True
+
+
+@event.listens_for(Session, 'after_commit')
+def _apply_product_changes(session):
+    changes = session.info.pop('search_changes', None)
+    if changes:
+        product_search_index.mark_changed(changes['ids'], rebuild=changes['rebuild'])
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_product_changes(session):
+    session.info.pop('search_changes', None)
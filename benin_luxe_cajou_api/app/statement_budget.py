@@ -0,0 +1,45 @@
+# app/statement_budget.py
+
+from flask import g, request, current_app, has_app_context
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+
+def statement_budget(limit):
+    """
+    Décorateur de route : fixe le nombre maximum de requêtes SQL autorisées
+    pour cet endpoint (prioritaire sur SQL_STATEMENT_BUDGET).
+    """
+    def wrapper(fn):
+        fn._statement_budget = limit
+        return fn
+    return wrapper
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _count_statement(conn, cursor, statement, parameters, context, executemany):
+    if has_app_context() and 'sql_statement_count' in g:
+        g.sql_statement_count += 1
+
+
+def _start_counting():
+    g.sql_statement_count = 0
+
+
+def _check_budget(response):
+    view = current_app.view_functions.get(request.endpoint)
+    limit = getattr(view, '_statement_budget', current_app.config.get('SQL_STATEMENT_BUDGET'))
+    count = g.pop('sql_statement_count', 0)
+    if limit is not None and count > limit:
+        message = f"{request.method} {request.path} a exécuté {count} requêtes SQL (budget: {limit})"
+        # En test, on échoue franchement pour détecter les régressions N+1
+        if current_app.testing:
+            raise AssertionError(message)
+        current_app.logger.warning(message)
+    return response
+
+
+def init_app(app):
+    """Active le comptage des requêtes SQL par appel HTTP."""
+    app.before_request(_start_counting)
+    app.after_request(_check_budget)
@@ -0,0 +1,174 @@
+# app/stats.py
+
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+
+from sqlalchemy import case, func, update
+
+from .extensions import db
+from .models import Commande, Utilisateur, StatistiqueJournaliere
+from .upsert import additive_upsert
+
+# Compteurs de StatistiqueJournaliere (hors chiffre d'affaires)
+ORDER_STATUSES = ('en_attente', 'confirmee', 'en_preparation', 'expedie', 'livree', 'annulee')
+COUNTERS = ('commandes_payees', *(f'commandes_{statut}' for statut in ORDER_STATUSES), 'nouveaux_clients')
+
+
+def _as_date(value):
+    """Jour d'un horodatage (func.date() renvoie une chaîne sous SQLite)."""
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    return date.fromisoformat(str(value)[:10])
+
+
+# --- MISE À JOUR INCRÉMENTALE ---
+
+def _increment(jour, deltas):
+    """
+    Ajoute les deltas aux compteurs du jour, dans la transaction en cours, en
+    une requête : INSERT ... ON DUPLICATE KEY UPDATE col = col + delta (ou
+    ON CONFLICT). La ligne du jour est créée par le premier événement.
+    """
+    deltas = {column: value for column, value in deltas.items() if value}
+    if not deltas:
+        return
+    table = StatistiqueJournaliere.__table__
+    stmt = additive_upsert(table, ['jour'], deltas, values={'jour': jour, **deltas})
+
+    if stmt is None:
+        # Autres bases : mise à jour, puis création si la ligne n'existe pas encore
+        result = db.session.execute(update(table).where(table.c.jour == jour).values(
+            {column: table.c[column] + value for column, value in deltas.items()}))
+        if result.rowcount == 0:
+            db.session.execute(table.insert().values(jour=jour, **deltas))
+        return
+    db.session.execute(stmt)
+
+
+def _order_deltas(state, total, sign):
+    statut, statut_paiement = state
+    deltas = {f'commandes_{statut}': sign}
+    if statut_paiement == 'paye':
+        deltas['commandes_payees'] = sign
+        deltas['chiffre_affaires'] = sign * Decimal(total or 0)
+    return deltas
+
+
+def record_order_transition(order, before, after):
+    """
+    Répercute un changement d'état de commande sur le jour de la commande.
+    `before` / `after` sont des couples (statut, statut_paiement) ; `before`
+    vaut None à la création. `order` fournit date_commande et total (objet
+    Commande ou ligne de requête).
+    """
+    if before == after:
+        return
+    deltas = defaultdict(int)
+    for state, sign in ((before, -1), (after, 1)):
+        if state is not None:
+            for column, value in _order_deltas(state, order.total, sign).items():
+                deltas[column] += value
+    _increment(_as_date(order.date_commande), deltas)
+
+
+def record_order_created(order):
+    """Compte une nouvelle commande (après le flush : date_commande est posée par la base)."""
+    record_order_transition(order, None, (order.statut, order.statut_paiement))
+
+
+def record_new_client(user, count=1):
+    """Compte (ou décompte, `count=-1`) un client inscrit le jour de sa création."""
+    if user.role == 'client':
+        _increment(_as_date(user.date_creation), {'nouveaux_clients': count})
+
+
+# --- LECTURE ---
+
+def dashboard_totals(today):
+    """
+    Chiffres du tableau de bord à partir des agrégats : CA du jour, de la
+    semaine et du mois, commandes payées à préparer, nouveaux clients des
+    7 derniers jours. Une requête sur une table d'une ligne par jour.
+    """
+    start_of_week = today - timedelta(days=today.weekday())
+    start_of_month = today.replace(day=1)
+    seven_days_ago = today - timedelta(days=7)
+    row = db.session.query(
+        func.sum(case((StatistiqueJournaliere.jour == today, StatistiqueJournaliere.chiffre_affaires), else_=0)),
+        func.sum(case((StatistiqueJournaliere.jour >= start_of_week, StatistiqueJournaliere.chiffre_affaires), else_=0)),
+        func.sum(case((StatistiqueJournaliere.jour >= start_of_month, StatistiqueJournaliere.chiffre_affaires), else_=0)),
+        func.sum(StatistiqueJournaliere.commandes_confirmee),
+        func.sum(case((StatistiqueJournaliere.jour >= seven_days_ago, StatistiqueJournaliere.nouveaux_clients), else_=0)),
+    ).one()
+    return {
+        'ca_today': row[0] or 0,
+        'ca_week': row[1] or 0,
+        'ca_month': row[2] or 0,
+        'pending_orders_count': int(row[3] or 0),
+        'new_clients_last_7_days': int(row[4] or 0),
+    }
+
+
+def client_order_summary(user_id):
+    """
+    Synthèse des commandes d'un client en une requête d'agrégat : nombre de
+    commandes (hors attente de paiement), total payé et date de la dernière.
+    """
+    count, spent, last = db.session.query(
+        func.count(Commande.id),
+        func.sum(case((Commande.statut_paiement == 'paye', Commande.total), else_=0)),
+        func.max(Commande.date_commande),
+    ).filter(Commande.utilisateur_id == user_id, Commande.statut != 'en_attente').one()
+    return {
+        'nombre_commandes': count,
+        'total_depense': str(spent or 0),
+        'derniere_commande': last.isoformat() if last else None,
+    }
+
+
+# --- RECALCUL ---
+
+def backfill(since=None):
+    """
+    Recalcule les agrégats depuis les commandes et les utilisateurs, à partir
+    du jour `since` (tout l'historique par défaut), en une transaction :
+    les lignes concernées sont remplacées. Retourne le nombre de jours écrits.
+    """
+    rows = defaultdict(lambda: defaultdict(int))
+
+    order_day = func.date(Commande.date_commande)
+    orders = db.session.query(
+        order_day, Commande.statut, Commande.statut_paiement, func.count(Commande.id), func.sum(Commande.total)
+    ).group_by(order_day, Commande.statut, Commande.statut_paiement)
+    if since:
+        orders = orders.filter(Commande.date_commande >= since)
+    for jour, statut, statut_paiement, count, total in orders:
+        counters = rows[_as_date(jour)]
+        counters[f'commandes_{statut}'] += count
+        if statut_paiement == 'paye':
+            counters['commandes_payees'] += count
+            counters['chiffre_affaires'] += Decimal(total or 0)
+
+    client_day = func.date(Utilisateur.date_creation)
+    clients = db.session.query(client_day, func.count(Utilisateur.id)).filter(
+        Utilisateur.role == 'client').group_by(client_day)
+    if since:
+        clients = clients.filter(Utilisateur.date_creation >= since)
+    for jour, count in clients:
+        rows[_as_date(jour)]['nouveaux_clients'] += count
+
+    deleted = StatistiqueJournaliere.query
+    if since:
+        deleted = deleted.filter(StatistiqueJournaliere.jour >= since)
+    deleted.delete(synchronize_session=False)
+    if rows:
+        db.session.execute(StatistiqueJournaliere.__table__.insert(), [
+            {'jour': jour, 'chiffre_affaires': counters.get('chiffre_affaires', 0),
+             **{column: counters.get(column, 0) for column in COUNTERS}}
+            for jour, counters in sorted(rows.items())
+        ])
+    db.session.commit()
+    return len(rows)
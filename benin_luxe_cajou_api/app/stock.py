@@ -0,0 +1,184 @@
+# app/stock.py
+
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import case, update
+
+from .background import scheduler
+from .cache import invalidate_stock_after_commit
+from .extensions import db
+from .models import Produit, DetailsCommande, StockReservation
+
+
+class InsufficientStock(ValueError):
+    """Un ou plusieurs produits n'ont plus assez de stock (la transaction doit être annulée)."""
+
+    def __init__(self, noms):
+        self.noms = noms
+        super().__init__(f"Stock insuffisant pour le produit : {', '.join(noms)}")
+
+
+# --- MOUVEMENTS DE STOCK ATOMIQUES ---
+
+def merge_quantities(items):
+    """{produit_id: quantité} à partir de couples (produit_id, quantité), doublons additionnés."""
+    quantities = defaultdict(int)
+    for produit_id, quantite in items:
+        if quantite > 0:
+            quantities[produit_id] += quantite
+    return dict(quantities)
+
+
+def decrement(quantities):
+    """
+    Retire les quantités du stock des produits à stock limité, en une seule
+    requête conditionnelle pour toute la commande :
+        UPDATE produits SET stock = stock - q WHERE id IN (...) AND stock >= q
+    Les lignes sont verrouillées dans l'ordre des ids (pas d'interblocage
+    entre deux commandes). Lève InsufficientStock ; l'appelant doit alors
+    annuler sa transaction.
+    """
+    if not quantities:
+        return
+    rows = db.session.query(Produit.id, Produit.nom, Produit.stock_disponible).filter(
+        Produit.id.in_(quantities), Produit.gestion_stock == 'limite'
+    ).order_by(Produit.id).with_for_update().all()
+    short = [row.nom for row in rows if (row.stock_disponible or 0) < quantities[row.id]]
+    if short:
+        raise InsufficientStock(short)
+
+    wanted = {row.id: quantities[row.id] for row in rows}
+    if not wanted:
+        return
+    quantite = case(wanted, value=Produit.id)
+    result = db.session.execute(
+        update(Produit)
+        .where(Produit.id.in_(wanted), Produit.stock_disponible >= quantite)
+        .values(stock_disponible=Produit.stock_disponible - quantite)
+        .execution_options(synchronize_session='fetch', stock_only=True)
+    )
+    if result.rowcount != len(wanted):
+        # Base sans verrou de ligne (SQLite) : une commande concurrente est passée avant
+        raise InsufficientStock([row.nom for row in rows])
+    invalidate_stock_after_commit(wanted)
+
+
+def increment(quantities):
+    """Rend les quantités au stock des produits à stock limité (une seule requête)."""
+    if not quantities:
+        return
+    quantite = case(quantities, value=Produit.id)
+    db.session.execute(
+        update(Produit)
+        .where(Produit.id.in_(quantities), Produit.gestion_stock == 'limite')
+        .values(stock_disponible=Produit.stock_disponible + quantite)
+        .execution_options(synchronize_session='fetch', stock_only=True)
+    )
+    invalidate_stock_after_commit(quantities)
+
+
+def _order_quantities(order_id):
+    return merge_quantities(db.session.query(DetailsCommande.produit_id, DetailsCommande.quantite)
+                            .filter_by(commande_id=order_id).all())
+
+
+def _transition(reservation_id, from_statut, to_statut):
+    """Change le statut d'une réservation par compare-and-swap ; True si cet appel l'a fait."""
+    return StockReservation.query.filter_by(id=reservation_id, statut=from_statut).update(
+        {'statut': to_statut}, synchronize_session=False
+    ) == 1
+
+
+# --- RÉSERVATIONS ---
+
+def reserve_order(order_id, items):
+    """
+    Réserve le stock d'une commande en attente de paiement, dans la
+    transaction en cours : décrément atomique puis une réservation par
+    produit, valable STOCK_RESERVATION_TTL secondes.
+    """
+    quantities = merge_quantities(items)
+    decrement(quantities)
+    limited = {row.id for row in db.session.query(Produit.id).filter(
+        Produit.id.in_(quantities), Produit.gestion_stock == 'limite')}
+    expire_le = datetime.utcnow() + timedelta(seconds=current_app.config['STOCK_RESERVATION_TTL'])
+    for produit_id, quantite in quantities.items():
+        if produit_id in limited:
+            db.session.add(StockReservation(commande_id=order_id, produit_id=produit_id,
+                                            quantite=quantite, expire_le=expire_le))
+
+
+def consume_order(order_id):
+    """
+    Acquiert définitivement le stock d'une commande payée. Chaque réservation
+    n'est consommée qu'une fois (compare-and-swap), même si le webhook et le
+    suivi de statut confirment en même temps. Une réservation expirée ou
+    libérée entre-temps est re-décrémentée atomiquement (InsufficientStock
+    si le stock est parti). Les commandes sans réservation (antérieures aux
+    réservations) sont décrémentées directement.
+    """
+    reservations = StockReservation.query.filter_by(commande_id=order_id).all()
+    if not reservations:
+        decrement(_order_quantities(order_id))
+        return
+
+    to_take = []
+    for reservation in reservations:
+        if reservation.statut == 'consommee':
+            continue
+        if _transition(reservation.id, reservation.statut, 'consommee') and reservation.statut != 'active':
+            to_take.append((reservation.produit_id, reservation.quantite))
+    decrement(merge_quantities(to_take))
+
+
+def restore_order(order_id, paid=False):
+    """
+    Rend au stock ce que retient une commande annulée : réservations actives
+    ou déjà consommées. Pour une commande payée sans réservation (antérieure
+    aux réservations), `paid=True` rend les quantités de ses lignes.
+    """
+    reservations = StockReservation.query.filter_by(commande_id=order_id).all()
+    if not reservations:
+        if paid:
+            increment(_order_quantities(order_id))
+        return
+
+    to_return = []
+    for reservation in reservations:
+        if reservation.statut in ('active', 'consommee') and \
+                _transition(reservation.id, reservation.statut, 'liberee'):
+            to_return.append((reservation.produit_id, reservation.quantite))
+    increment(merge_quantities(to_return))
+
+
+def expire_reservations(limit=None):
+    """Rend au stock les réservations actives échues (commandes jamais payées). Retourne leur nombre."""
+    limit = limit or current_app.config['STOCK_RESERVATION_BATCH_SIZE']
+    due = db.session.query(StockReservation.id, StockReservation.produit_id, StockReservation.quantite).filter(
+        StockReservation.statut == 'active', StockReservation.expire_le < datetime.utcnow()
+    ).order_by(StockReservation.expire_le).limit(limit).all()
+
+    to_return = [(row.produit_id, row.quantite) for row in due if _transition(row.id, 'active', 'expiree')]
+    increment(merge_quantities(to_return))
+    db.session.commit()
+    if to_return:
+        current_app.logger.info(f"{len(to_return)} réservation(s) de stock expirée(s) rendue(s) au stock.")
+    return len(to_return)
+
+
+def low_stock_product_ids(order_id):
+    """Produits de la commande dont le stock est passé sous le seuil d'alerte."""
+    rows = db.session.query(Produit.id).join(DetailsCommande, DetailsCommande.produit_id == Produit.id).filter(
+        DetailsCommande.commande_id == order_id,
+        Produit.gestion_stock == 'limite',
+        Produit.stock_disponible <= Produit.stock_minimum
+    ).distinct().all()
+    return [row.id for row in rows]
+
+
+@scheduler.job('expire_stock_reservations', 'STOCK_RESERVATION_SWEEP_INTERVAL')
+def _expire_reservations_job():
+    while expire_reservations() == current_app.config['STOCK_RESERVATION_BATCH_SIZE']:
+        pass
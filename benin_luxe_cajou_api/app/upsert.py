@@ -0,0 +1,33 @@
+# app/upsert.py
+
+from sqlalchemy.dialects import mysql, postgresql, sqlite
+
+from .extensions import db
+
+# Bases qui savent faire un upsert en une requête
+_UPSERT_INSERTS = {'mysql': mysql.insert, 'postgresql': postgresql.insert, 'sqlite': sqlite.insert}
+
+
+def additive_upsert(table, index_elements, added_columns, values=None, from_select=None):
+    """
+    INSERT qui, si la ligne existe déjà (clé unique `index_elements`), ajoute
+    les valeurs insérées aux colonnes `added_columns` de la ligne existante :
+        ON DUPLICATE KEY UPDATE col = col + VALUES(col)     (MySQL)
+        ON CONFLICT (...) DO UPDATE SET col = col + excluded.col
+    Les lignes viennent de `values` (dict) ou de `from_select` (noms de
+    colonnes, select). Retourne None si la base n'a pas d'upsert : l'appelant
+    garde alors sa propre logique.
+    """
+    dialect = db.session.get_bind().dialect.name
+    insert = _UPSERT_INSERTS.get(dialect)
+    if insert is None:
+        return None
+
+    stmt = insert(table)
+    stmt = stmt.from_select(*from_select) if from_select is not None else stmt.values(values)
+    if dialect == 'mysql':
+        # MySQL se base sur n'importe quelle clé unique : index_elements est implicite
+        return stmt.on_duplicate_key_update({column: table.c[column] + stmt.inserted[column]
+                                             for column in added_columns})
+    return stmt.on_conflict_do_update(index_elements=index_elements, set_={
+        column: table.c[column] + stmt.excluded[column] for column in added_columns})
@@ -1,9 +1,16 @@
 # app/user_profile/routes.py
 
+from datetime import datetime
+
 from flask import Blueprint, request, jsonify
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from app.models import Utilisateur, AdresseLivraison, Commande
 from app.extensions import db
+from app.eager_loading import eager
+from app.statement_budget import statement_budget
+from app.cache import get_or_build_snapshot, json_bytes_response, user_orders_namespace
+from app.pagination import KeysetOrder, paginate_keyset, parse_limit
+from app.stats import client_order_summary
 from app.schemas import (
     utilisateur_schema, 
     adresses_livraison_schema,
@@ -13,18 +20,24 @@ from app.schemas import (
 
 user_profile_bp = Blueprint('user_profile', __name__)
 
+# Historique de commandes : plus récentes d'abord, l'id départage les égalités
+ORDER_HISTORY_ORDER = KeysetOrder([Commande.date_commande, Commande.id], [datetime.fromisoformat, int])
+
 # --- GESTION DU PROFIL PRINCIPAL ---
 
 @user_profile_bp.route('/', methods=['GET'])
 @jwt_required()
 def get_profile():
     """
-    Récupère les informations de base de l'utilisateur connecté.
+    Récupère les informations de base de l'utilisateur connecté, avec la
+    synthèse de ses commandes (l'historique est servi par /orders).
     """
     # On s'attend à recevoir l'ID sous forme de string, on le convertit en entier
     user_id = int(get_jwt_identity())
     user = Utilisateur.query.get_or_404(user_id)
-    return jsonify(utilisateur_schema.dump(user)), 200
+    profile = utilisateur_schema.dump(user)
+    profile['statistiques_commandes'] = client_order_summary(user_id)
+    return jsonify(profile), 200
 
 @user_profile_bp.route('/', methods=['PUT'])
 @jwt_required()
@@ -88,17 +101,42 @@ def get_user_addresses():
 def get_user_orders():
     """
     Récupère l'historique des commandes de l'utilisateur connecté.
+    - /api/profile/orders -> Liste complète (ancien format)
+    - /api/profile/orders?limit=20&cursor=... -> Page suivante ({"items", "next_cursor"})
+    Seules les colonnes affichées sont lues (pas d'objets Commande). La
+    première page est mise en cache par client et invalidée dès qu'une de
+    ses commandes change.
     """
     # On s'attend à recevoir l'ID sous forme de string, on le convertit en entier
     user_id = int(get_jwt_identity())
-    # Récupérer seulement les commandes confirmées (masquer celles en attente de paiement)
-    orders = Commande.query.filter(
-        Commande.utilisateur_id == user_id,
-        Commande.statut != 'en_attente'
-    ).order_by(Commande.date_commande.desc()).all()
-    return jsonify(commandes_summary_schema.dump(orders)), 200
+    cursor = request.args.get('cursor')
+    paginated = 'limit' in request.args or cursor is not None
+    limit = parse_limit(request.args.get('limit', type=int))
+
+    def build():
+        # Récupérer seulement les commandes confirmées (masquer celles en attente de paiement)
+        query = db.session.query(
+            Commande.id, Commande.numero_commande, Commande.statut, Commande.total, Commande.date_commande
+        ).filter(
+            Commande.utilisateur_id == user_id,
+            Commande.statut != 'en_attente'
+        )
+        if not paginated:
+            return commandes_summary_schema.dump(query.order_by(*ORDER_HISTORY_ORDER.order_by()).all())
+        orders, next_cursor = paginate_keyset(query, ORDER_HISTORY_ORDER, limit=limit, cursor=cursor)
+        return {"items": commandes_summary_schema.dump(orders), "next_cursor": next_cursor}
+
+    try:
+        if cursor:
+            return jsonify(build()), 200
+        key = f'user_orders:{user_id}:' + (f'first:{limit}' if paginated else 'all')
+        return json_bytes_response(get_or_build_snapshot(key, user_orders_namespace(user_id), build))
+    except ValueError as e:
+        # Curseur de pagination invalide
+        return jsonify({"msg": str(e)}), 400
 
 @user_profile_bp.route('/orders/<int:order_id>', methods=['GET'])
+@statement_budget(5)
 @jwt_required()
 def get_order_details(order_id):
     """
@@ -108,6 +146,6 @@ def get_order_details(order_id):
     user_id = int(get_jwt_identity())
     
     # Requête sécurisée : on vérifie que la commande existe ET qu'elle appartient bien à l'utilisateur connecté.
-    order = Commande.query.filter_by(id=order_id, utilisateur_id=user_id).first_or_404()
+    order = eager(Commande.query, commande_detail_schema).filter_by(id=order_id, utilisateur_id=user_id).first_or_404()
     
     return jsonify(commande_detail_schema.dump(order)), 200
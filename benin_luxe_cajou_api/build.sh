@@ -5,4 +5,7 @@ set -o errexit
 pip install -r requirements.txt
 
 # Cette commande est juste pour synchroniser l'état de la migration, elle ne modifiera pas votre base.
-# flask db stamp head 
\ No newline at end of file
+# flask db stamp head
+
+# Applique les migrations (la révision initiale ne touche pas aux tables existantes)
+flask --app run db upgrade 
\ No newline at end of file
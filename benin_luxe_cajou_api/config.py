@@ -27,8 +27,101 @@ class Config:
 
     FEDAPAY_API_KEY = os.environ.get('FEDAPAY_API_KEY')
     FEDAPAY_ENVIRONMENT = os.environ.get('FEDAPAY_ENVIRONMENT')
+    # Surcharge de l'URL de l'API (ex: serveur FedaPay factice en local)
+    FEDAPAY_BASE_URL = os.environ.get('FEDAPAY_BASE_URL')
+    FEDAPAY_POOL_SIZE = int(os.environ.get('FEDAPAY_POOL_SIZE') or 10)
+    FEDAPAY_CONNECT_TIMEOUT = float(os.environ.get('FEDAPAY_CONNECT_TIMEOUT') or 3.05)
+    FEDAPAY_READ_TIMEOUT = float(os.environ.get('FEDAPAY_READ_TIMEOUT') or 20)
+    FEDAPAY_MAX_RETRIES = int(os.environ.get('FEDAPAY_MAX_RETRIES') or 2)   # GET uniquement
+    FEDAPAY_BREAKER_THRESHOLD = int(os.environ.get('FEDAPAY_BREAKER_THRESHOLD') or 5)
+    FEDAPAY_BREAKER_RESET_TIMEOUT = int(os.environ.get('FEDAPAY_BREAKER_RESET_TIMEOUT') or 30)
+    # Secret du webhook (tableau de bord FedaPay) : si défini, la signature est exigée
+    FEDAPAY_WEBHOOK_SECRET = os.environ.get('FEDAPAY_WEBHOOK_SECRET')
+    FEDAPAY_WEBHOOK_TOLERANCE = int(os.environ.get('FEDAPAY_WEBHOOK_TOLERANCE') or 300)   # secondes
     FIREBASE_SERVICE_ACCOUNT_JSON = os.environ.get('FIREBASE_SERVICE_ACCOUNT_JSON')
 
+    # Cache HTTP des endpoints publics du catalogue (en secondes)
+    PUBLIC_CACHE_MAX_AGE = int(os.environ.get('PUBLIC_CACHE_MAX_AGE') or 60)
+    PUBLIC_CACHE_STALE_WHILE_REVALIDATE = int(os.environ.get('PUBLIC_CACHE_STALE_WHILE_REVALIDATE') or 300)
+
+    # Nombre maximum de requêtes SQL par appel HTTP (None = pas de limite).
+    # En mode TESTING, un dépassement fait échouer la requête (détection des N+1).
+    SQL_STATEMENT_BUDGET = int(os.environ['SQL_STATEMENT_BUDGET']) if os.environ.get('SQL_STATEMENT_BUDGET') else None
+
+    # Cache applicatif partagé : 'redis' dès que REDIS_URL est défini (partagé entre
+    # les workers gunicorn), sinon 'memory' (LRU local au processus).
+    # 'fakeredis' simule un serveur Redis en mémoire (tests hors-ligne).
+    CACHE_REDIS_URL = os.environ.get('REDIS_URL')
+    CACHE_BACKEND = os.environ.get('CACHE_BACKEND') or ('redis' if CACHE_REDIS_URL else 'memory')
+    # Nombre de workers gunicorn (WEB_CONCURRENCY, lu aussi par gunicorn) : le
+    # backend 'memory' n'est pas partagé entre processus et est refusé au-delà d'un
+    CACHE_WORKERS = int(os.environ.get('WEB_CONCURRENCY') or 1)
+    CACHE_KEY_PREFIX = os.environ.get('CACHE_KEY_PREFIX', 'blc:')
+    CACHE_DEFAULT_TTL = int(os.environ.get('CACHE_DEFAULT_TTL') or 3600)
+    CACHE_MAX_ENTRIES = int(os.environ.get('CACHE_MAX_ENTRIES') or 2048)
+    # Copie de secours des instantanés, servie si leur reconstruction tarde (en secondes)
+    CACHE_STALE_TTL = int(os.environ.get('CACHE_STALE_TTL') or 86400)
+    # Cache injoignable : fonctionnement sans cache, nouvel essai après ce délai (en secondes)
+    CACHE_RETRY_INTERVAL = float(os.environ.get('CACHE_RETRY_INTERVAL') or 5)
+
+    # Single-flight : attente maximale d'une construction d'instantané en cours
+    # et durée de vie du verrou partagé (libéré même si le worker meurt)
+    SINGLE_FLIGHT_WAIT = float(os.environ.get('SINGLE_FLIGHT_WAIT') or 5)
+    SINGLE_FLIGHT_LOCK_TTL = int(os.environ.get('SINGLE_FLIGHT_LOCK_TTL') or 30)
+
+    # Outbox des notifications (emails, push) envoyées en arrière-plan.
+    # OUTBOX_WORKERS = 0 désactive le dispatcher intégré (utiliser `flask outbox-drain`).
+    OUTBOX_WORKERS = int(os.environ.get('OUTBOX_WORKERS') or 2)
+    OUTBOX_POLL_INTERVAL = float(os.environ.get('OUTBOX_POLL_INTERVAL') or 5)
+    OUTBOX_BATCH_SIZE = int(os.environ.get('OUTBOX_BATCH_SIZE') or 20)
+    OUTBOX_MAX_ATTEMPTS = int(os.environ.get('OUTBOX_MAX_ATTEMPTS') or 8)
+    OUTBOX_BACKOFF_BASE = int(os.environ.get('OUTBOX_BACKOFF_BASE') or 30)    # secondes
+    OUTBOX_BACKOFF_MAX = int(os.environ.get('OUTBOX_BACKOFF_MAX') or 3600)
+    OUTBOX_LEASE_SECONDS = int(os.environ.get('OUTBOX_LEASE_SECONDS') or 300)
+
+    # Transport des notifications push : 'firebase' (réel) ou 'fake' (local, sans réseau)
+    PUSH_TRANSPORT = os.environ.get('PUSH_TRANSPORT', 'firebase')
+
+    # Campagnes newsletter : abonnés lus par lots, sessions SMTP parallèles et débit limité
+    NEWSLETTER_CHUNK_SIZE = int(os.environ.get('NEWSLETTER_CHUNK_SIZE') or 100)
+    NEWSLETTER_SMTP_CONNECTIONS = int(os.environ.get('NEWSLETTER_SMTP_CONNECTIONS') or 2)
+    NEWSLETTER_MESSAGES_PER_CONNECTION = int(os.environ.get('NEWSLETTER_MESSAGES_PER_CONNECTION') or 100)
+    NEWSLETTER_RATE_PER_SECOND = float(os.environ.get('NEWSLETTER_RATE_PER_SECOND') or 10)
+    NEWSLETTER_SMTP_TIMEOUT = int(os.environ.get('NEWSLETTER_SMTP_TIMEOUT') or 30)
+    # Durée maximale d'une tranche d'envoi (doit rester < OUTBOX_LEASE_SECONDS)
+    NEWSLETTER_TIME_BUDGET = int(os.environ.get('NEWSLETTER_TIME_BUDGET') or 120)
+    # Bail d'un expéditeur sur une campagne (renouvelé à chaque lot) : au-delà, il est présumé mort
+    NEWSLETTER_LEASE_SECONDS = int(os.environ.get('NEWSLETTER_LEASE_SECONDS') or 300)
+
+    # Tâches périodiques (une seule exécution par intervalle, tous workers confondus)
+    BACKGROUND_JOBS_ENABLED = os.environ.get('BACKGROUND_JOBS_ENABLED', 'true').lower() in ['true', 'on', '1']
+    # Commandes validées sans transaction FedaPay enregistrée : réconciliées après ce délai
+    PAYMENT_STRANDED_AFTER = int(os.environ.get('PAYMENT_STRANDED_AFTER') or 900)   # secondes
+    PAYMENT_RECONCILE_INTERVAL = int(os.environ.get('PAYMENT_RECONCILE_INTERVAL') or 300)
+    PAYMENT_RECONCILE_BATCH_SIZE = int(os.environ.get('PAYMENT_RECONCILE_BATCH_SIZE') or 50)
+    # Paiements restés 'pending' (webhook manqué) : vérifiés auprès de FedaPay en parallèle
+    PAYMENT_PENDING_RECONCILE_INTERVAL = int(os.environ.get('PAYMENT_PENDING_RECONCILE_INTERVAL') or 120)
+    PAYMENT_PENDING_MIN_AGE = int(os.environ.get('PAYMENT_PENDING_MIN_AGE') or 300)
+    PAYMENT_PENDING_EXPIRE_AFTER = int(os.environ.get('PAYMENT_PENDING_EXPIRE_AFTER') or 86400)
+    PAYMENT_RECONCILE_CONCURRENCY = int(os.environ.get('PAYMENT_RECONCILE_CONCURRENCY') or 4)
+    # Durée maximale du marqueur "confirmation en cours" d'une commande
+    PAYMENT_CONFIRMATION_LOCK_TTL = int(os.environ.get('PAYMENT_CONFIRMATION_LOCK_TTL') or 30)
+    # Verrou par transaction pendant le traitement des webhooks reçus (ordre garanti)
+    WEBHOOK_LOCK_TTL = int(os.environ.get('WEBHOOK_LOCK_TTL') or 60)
+
+    # Flux SSE du statut de paiement (/api/payment/status/<id>/stream), en secondes
+    PAYMENT_STREAM_POLL_INTERVAL = float(os.environ.get('PAYMENT_STREAM_POLL_INTERVAL') or 2)
+    PAYMENT_STREAM_FEDAPAY_INTERVAL = int(os.environ.get('PAYMENT_STREAM_FEDAPAY_INTERVAL') or 10)
+    PAYMENT_STREAM_HEARTBEAT = int(os.environ.get('PAYMENT_STREAM_HEARTBEAT') or 15)
+    PAYMENT_STREAM_MAX_DURATION = int(os.environ.get('PAYMENT_STREAM_MAX_DURATION') or 120)
+    # Flux simultanés par worker : chacun immobilise un thread gthread (8 par worker)
+    PAYMENT_STREAM_MAX_CONCURRENT = int(os.environ.get('PAYMENT_STREAM_MAX_CONCURRENT') or 4)
+
+    # Réservations de stock des commandes en attente de paiement
+    STOCK_RESERVATION_TTL = int(os.environ.get('STOCK_RESERVATION_TTL') or 1800)   # secondes
+    STOCK_RESERVATION_SWEEP_INTERVAL = int(os.environ.get('STOCK_RESERVATION_SWEEP_INTERVAL') or 60)
+    STOCK_RESERVATION_BATCH_SIZE = int(os.environ.get('STOCK_RESERVATION_BATCH_SIZE') or 200)
+
 
 
 
@@ -0,0 +1,26 @@
+"""Schéma initial (tables existantes, créées hors migrations)
+
+Revision ID: 0001_schema_initial
+Revises: 
+Create Date: 2026-10-17 09:00:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0001_schema_initial'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Les tables historiques existent déjà en production : cette révision sert
+    # uniquement de point de départ aux migrations suivantes.
+    pass
+
+
+def downgrade():
+    pass
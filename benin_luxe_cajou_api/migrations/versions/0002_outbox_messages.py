@@ -0,0 +1,40 @@
+"""Table outbox_messages (notifications envoyées en arrière-plan)
+
+Revision ID: 0002_outbox_messages
+Revises: 0001_schema_initial
+Create Date: 2026-10-17 09:30:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0002_outbox_messages'
+down_revision = '0001_schema_initial'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'outbox_messages',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('type', sa.String(length=50), nullable=False),
+        sa.Column('payload', sa.JSON(), nullable=False),
+        sa.Column('statut', sa.Enum('en_attente', 'en_cours', 'envoye', 'echoue'), nullable=False),
+        sa.Column('tentatives', sa.Integer(), nullable=False),
+        sa.Column('prochaine_tentative', sa.DateTime(), nullable=False),
+        sa.Column('verrouille_jusqu_a', sa.DateTime(), nullable=True),
+        sa.Column('derniere_erreur', sa.Text(), nullable=True),
+        sa.Column('date_creation', sa.TIMESTAMP(), server_default=sa.text('CURRENT_TIMESTAMP'), nullable=True),
+        sa.Column('date_envoi', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_outbox_statut_prochaine_tentative', 'outbox_messages',
+                    ['statut', 'prochaine_tentative'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_outbox_statut_prochaine_tentative', table_name='outbox_messages')
+    op.drop_table('outbox_messages')
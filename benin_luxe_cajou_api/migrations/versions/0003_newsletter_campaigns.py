@@ -0,0 +1,40 @@
+"""Table newsletter_campaigns (envois groupés avec reprise)
+
+Revision ID: 0003_newsletter_campaigns
+Revises: 0002_outbox_messages
+Create Date: 2026-10-17 10:30:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0003_newsletter_campaigns'
+down_revision = '0002_outbox_messages'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'newsletter_campaigns',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('type', sa.String(length=50), nullable=False),
+        sa.Column('produit_id', sa.Integer(), nullable=True),
+        sa.Column('sujet', sa.String(length=255), nullable=False),
+        sa.Column('contenu_html', sa.Text(), nullable=False),
+        sa.Column('statut', sa.Enum('en_attente', 'en_cours', 'terminee'), nullable=False),
+        sa.Column('dernier_abonne_id', sa.Integer(), nullable=False),
+        sa.Column('nb_envoyes', sa.Integer(), nullable=False),
+        sa.Column('nb_echecs', sa.Integer(), nullable=False),
+        sa.Column('date_creation', sa.TIMESTAMP(), server_default=sa.text('CURRENT_TIMESTAMP'), nullable=True),
+        sa.Column('date_debut', sa.DateTime(), nullable=True),
+        sa.Column('date_fin', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['produit_id'], ['produits.id'], ondelete='SET NULL'),
+        sa.PrimaryKeyConstraint('id')
+    )
+
+
+def downgrade():
+    op.drop_table('newsletter_campaigns')
@@ -0,0 +1,40 @@
+"""Table reservations_stock (réservations de stock des commandes en attente)
+
+Revision ID: 0004_reservations_stock
+Revises: 0003_newsletter_campaigns
+Create Date: 2026-10-17 12:00:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0004_reservations_stock'
+down_revision = '0003_newsletter_campaigns'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'reservations_stock',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('commande_id', sa.Integer(), nullable=False),
+        sa.Column('produit_id', sa.Integer(), nullable=False),
+        sa.Column('quantite', sa.Integer(), nullable=False),
+        sa.Column('statut', sa.Enum('active', 'consommee', 'liberee', 'expiree'), nullable=False),
+        sa.Column('expire_le', sa.DateTime(), nullable=False),
+        sa.Column('date_creation', sa.TIMESTAMP(), server_default=sa.text('CURRENT_TIMESTAMP'), nullable=True),
+        sa.ForeignKeyConstraint(['commande_id'], ['commandes.id'], ondelete='CASCADE'),
+        sa.ForeignKeyConstraint(['produit_id'], ['produits.id']),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_reservations_stock_statut_expire_le', 'reservations_stock', ['statut', 'expire_le'])
+    op.create_index('ix_reservations_stock_commande_id', 'reservations_stock', ['commande_id'])
+
+
+def downgrade():
+    op.drop_index('ix_reservations_stock_commande_id', table_name='reservations_stock')
+    op.drop_index('ix_reservations_stock_statut_expire_le', table_name='reservations_stock')
+    op.drop_table('reservations_stock')
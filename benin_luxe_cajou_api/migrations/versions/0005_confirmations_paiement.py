@@ -0,0 +1,34 @@
+"""Table confirmations_paiement (traitement unique des paiements confirmés)
+
+Revision ID: 0005_confirmations_paiement
+Revises: 0004_reservations_stock
+Create Date: 2026-10-17 13:30:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0005_confirmations_paiement'
+down_revision = '0004_reservations_stock'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'confirmations_paiement',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('fedapay_transaction_id', sa.String(length=100), nullable=False),
+        sa.Column('commande_id', sa.Integer(), nullable=False),
+        sa.Column('source', sa.Enum('webhook', 'statut', 'reconciliation'), nullable=False),
+        sa.Column('date_creation', sa.TIMESTAMP(), server_default=sa.text('CURRENT_TIMESTAMP'), nullable=True),
+        sa.ForeignKeyConstraint(['commande_id'], ['commandes.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('fedapay_transaction_id')
+    )
+
+
+def downgrade():
+    op.drop_table('confirmations_paiement')
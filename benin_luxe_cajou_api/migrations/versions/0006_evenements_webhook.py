@@ -0,0 +1,37 @@
+"""Table evenements_webhook (journal des webhooks FedaPay reçus)
+
+Revision ID: 0006_evenements_webhook
+Revises: 0005_confirmations_paiement
+Create Date: 2026-10-17 15:00:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0006_evenements_webhook'
+down_revision = '0005_confirmations_paiement'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'evenements_webhook',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('nom', sa.String(length=100), nullable=False),
+        sa.Column('fedapay_transaction_id', sa.String(length=100), nullable=True),
+        sa.Column('payload', sa.JSON(), nullable=False),
+        sa.Column('statut', sa.Enum('recu', 'traite', 'ignore'), nullable=False),
+        sa.Column('derniere_erreur', sa.Text(), nullable=True),
+        sa.Column('date_reception', sa.TIMESTAMP(), server_default=sa.text('CURRENT_TIMESTAMP'), nullable=True),
+        sa.Column('date_traitement', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_evenements_webhook_fedapay_transaction_id', 'evenements_webhook', ['fedapay_transaction_id'])
+
+
+def downgrade():
+    op.drop_index('ix_evenements_webhook_fedapay_transaction_id', table_name='evenements_webhook')
+    op.drop_table('evenements_webhook')
@@ -0,0 +1,38 @@
+"""Table statistiques_journalieres (agrégats quotidiens du tableau de bord)
+
+Revision ID: 0007_statistiques_journalieres
+Revises: 0006_evenements_webhook
+Create Date: 2026-10-17 16:00:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0007_statistiques_journalieres'
+down_revision = '0006_evenements_webhook'
+branch_labels = None
+depends_on = None
+
+
+COUNTERS = (
+    'commandes_payees', 'commandes_en_attente', 'commandes_confirmee', 'commandes_en_preparation',
+    'commandes_expedie', 'commandes_livree', 'commandes_annulee', 'nouveaux_clients',
+)
+
+
+def upgrade():
+    op.create_table(
+        'statistiques_journalieres',
+        sa.Column('jour', sa.Date(), nullable=False),
+        sa.Column('chiffre_affaires', sa.Numeric(precision=12, scale=2), server_default='0', nullable=False),
+        *[sa.Column(name, sa.Integer(), server_default='0', nullable=False) for name in COUNTERS],
+        sa.Column('date_modification', sa.TIMESTAMP(), server_default=sa.text('CURRENT_TIMESTAMP'), nullable=True),
+        sa.PrimaryKeyConstraint('jour')
+    )
+    # Remplir la table avec l'historique : `flask stats-backfill`
+
+
+def downgrade():
+    op.drop_table('statistiques_journalieres')
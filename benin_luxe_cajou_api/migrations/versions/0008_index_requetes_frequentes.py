@@ -0,0 +1,41 @@
+"""Index composites des requêtes fréquentes (panier, commandes, paiements, catalogue)
+
+Revision ID: 0008_index_requetes_frequentes
+Revises: 0007_statistiques_journalieres
+Create Date: 2026-10-17 17:00:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0008_index_requetes_frequentes'
+down_revision = '0007_statistiques_journalieres'
+branch_labels = None
+depends_on = None
+
+
+INDEXES = (
+    ('ix_paniers_utilisateur_id_produit_id', 'paniers', ['utilisateur_id', 'produit_id']),
+    ('ix_paniers_session_id', 'paniers', ['session_id']),
+    ('ix_commandes_utilisateur_id_statut_date_commande', 'commandes', ['utilisateur_id', 'statut', 'date_commande']),
+    ('ix_commandes_statut_paiement_date_commande', 'commandes', ['statut_paiement', 'date_commande']),
+    ('ix_commandes_date_commande', 'commandes', ['date_commande']),
+    ('ix_paiements_fedapay_transaction_id', 'paiements', ['fedapay_transaction_id']),
+    ('ix_paiements_commande_id', 'paiements', ['commande_id']),
+    ('ix_paiements_statut_id', 'paiements', ['statut', 'id']),
+    ('ix_produits_statut_type_produit_id', 'produits', ['statut', 'type_produit_id']),
+    ('ix_utilisateurs_role_date_creation', 'utilisateurs', ['role', 'date_creation']),
+    ('ix_details_commande_commande_id', 'details_commande', ['commande_id']),
+)
+
+
+def upgrade():
+    for name, table, columns in INDEXES:
+        op.create_index(name, table, columns)
+
+
+def downgrade():
+    for name, table, columns in reversed(INDEXES):
+        op.drop_index(name, table_name=table)
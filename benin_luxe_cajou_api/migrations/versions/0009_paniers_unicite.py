@@ -0,0 +1,53 @@
+"""Unicité (utilisateur_id, produit_id) des paniers, après fusion des doublons
+
+Revision ID: 0009_paniers_unicite
+Revises: 0008_index_requetes_frequentes
+Create Date: 2026-10-17 18:00:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0009_paniers_unicite'
+down_revision = '0008_index_requetes_frequentes'
+branch_labels = None
+depends_on = None
+
+
+paniers = sa.table(
+    'paniers',
+    sa.column('id', sa.Integer),
+    sa.column('utilisateur_id', sa.Integer),
+    sa.column('produit_id', sa.Integer),
+    sa.column('quantite', sa.Integer),
+)
+
+
+def upgrade():
+    # Fusion des doublons existants : la ligne la plus ancienne reçoit la somme des quantités
+    bind = op.get_bind()
+    duplicates = bind.execute(
+        sa.select(paniers.c.utilisateur_id, paniers.c.produit_id,
+                  sa.func.min(paniers.c.id), sa.func.sum(paniers.c.quantite))
+        .where(paniers.c.utilisateur_id.isnot(None))
+        .group_by(paniers.c.utilisateur_id, paniers.c.produit_id)
+        .having(sa.func.count() > 1)
+    ).all()
+    for utilisateur_id, produit_id, keep_id, quantite in duplicates:
+        bind.execute(paniers.update().where(paniers.c.id == keep_id).values(quantite=quantite))
+        bind.execute(paniers.delete().where(
+            paniers.c.utilisateur_id == utilisateur_id,
+            paniers.c.produit_id == produit_id,
+            paniers.c.id != keep_id
+        ))
+
+    # La contrainte unique (utilisateur_id en tête) remplace l'index simple de la révision 0008
+    op.create_unique_constraint('uq_paniers_utilisateur_id_produit_id', 'paniers', ['utilisateur_id', 'produit_id'])
+    op.drop_index('ix_paniers_utilisateur_id_produit_id', table_name='paniers')
+
+
+def downgrade():
+    op.create_index('ix_paniers_utilisateur_id_produit_id', 'paniers', ['utilisateur_id', 'produit_id'])
+    op.drop_constraint('uq_paniers_utilisateur_id_produit_id', 'paniers', type_='unique')
@@ -0,0 +1,26 @@
+"""Réservation des campagnes newsletter (un seul expéditeur à la fois)
+
+Revision ID: 0010_campagnes_reservation
+Revises: 0009_paniers_unicite
+Create Date: 2026-10-17 20:00:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0010_campagnes_reservation'
+down_revision = '0009_paniers_unicite'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('newsletter_campaigns', sa.Column('verrouille_par', sa.String(length=64), nullable=True))
+    op.add_column('newsletter_campaigns', sa.Column('verrouille_jusqu_a', sa.DateTime(), nullable=True))
+
+
+def downgrade():
+    op.drop_column('newsletter_campaigns', 'verrouille_jusqu_a')
+    op.drop_column('newsletter_campaigns', 'verrouille_par')
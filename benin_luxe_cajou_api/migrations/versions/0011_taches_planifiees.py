@@ -0,0 +1,29 @@
+"""Table taches_planifiees (réservation des tâches périodiques sans cache partagé)
+
+Revision ID: 0011_taches_planifiees
+Revises: 0010_campagnes_reservation
+Create Date: 2026-10-18 10:00:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0011_taches_planifiees'
+down_revision = '0010_campagnes_reservation'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'taches_planifiees',
+        sa.Column('nom', sa.String(length=100), nullable=False),
+        sa.Column('verrouille_jusqu_a', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('nom')
+    )
+
+
+def downgrade():
+    op.drop_table('taches_planifiees')
@@ -0,0 +1,245 @@
+# tests/conftest.py
+
+import hashlib
+import hmac
+import json
+import os
+import socket
+import threading
+import time
+import uuid
+from decimal import Decimal
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+from flask_jwt_extended import create_access_token
+from sqlalchemy import event
+
+from app import create_app, stats
+from app.cache_backends import RedisBackend, RedisConnection
+from app.extensions import cache, db
+from app.models import (
+    Categorie, TypeProduit, Produit, Utilisateur, Commande, AdresseLivraison, DetailsCommande, Paiement
+)
+from app.payment import routes as payment_routes
+from config import Config
+
+APPROVED = {'v1/transaction': {'id': 42, 'status': 'approved', 'merchant_reference': 'BLC-1'}}
+
+
+class TestConfig(Config):
+    """
+    Configuration des tests : SQLite en mémoire par défaut (TEST_DATABASE_URL
+    pour viser une vraie base MySQL), cache fake-Redis, push sans réseau,
+    aucun thread d'arrière-plan.
+    """
+    TESTING = True
+    SQLALCHEMY_DATABASE_URI = os.environ.get('TEST_DATABASE_URL', 'sqlite://')
+    SECRET_KEY = JWT_SECRET_KEY = 'cle-de-test-suffisamment-longue-pour-hs256'
+    CACHE_BACKEND = 'fakeredis'
+    CACHE_REDIS_URL = None
+    PUSH_TRANSPORT = 'fake'
+    FEDAPAY_API_KEY = 'sk_test'
+    FEDAPAY_ENVIRONMENT = 'sandbox'
+    FEDAPAY_BASE_URL = None
+    FEDAPAY_WEBHOOK_SECRET = 'whsec_test'
+    OUTBOX_WORKERS = 0
+    BACKGROUND_JOBS_ENABLED = False
+    MAIL_SUPPRESS_SEND = True
+    MAIL_DEFAULT_SENDER = 'boutique@example.com'
+    SQL_STATEMENT_BUDGET = None
+
+
+@event.listens_for(Commande, 'before_insert')
+def _numero_commande(mapper, connection, target):
+    # En production, le numéro est attribué par un trigger MySQL
+    if not target.numero_commande:
+        target.numero_commande = f'CMD-{uuid.uuid4().hex[:10].upper()}'
+
+
+def using_mysql():
+    return os.environ.get('TEST_DATABASE_URL', '').startswith('mysql')
+
+
+@pytest.fixture
+def app():
+    app = create_app(TestConfig)
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.session.remove()
+        db.drop_all()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def catalogue(app):
+    """Une catégorie, un type et trois produits actifs à stock limité (10 unités)."""
+    categorie = Categorie(nom='Noix')
+    db.session.add(categorie)
+    db.session.flush()
+    type_produit = TypeProduit(category_id=categorie.id, nom='Grillée')
+    db.session.add(type_produit)
+    db.session.flush()
+    produits = [Produit(type_produit_id=type_produit.id, nom=f'Noix de cajou grillée {i}',
+                        description='Délicieuse', quantite_contenant=250,
+                        prix_unitaire=1000 + i, stock_disponible=10)
+                for i in range(3)]
+    db.session.add_all(produits)
+    db.session.commit()
+    return produits
+
+
+@pytest.fixture
+def client_user(app):
+    user = Utilisateur(nom='Doe', prenom='Jo', email='jo@example.com', mot_de_passe='x', email_verifie=True)
+    db.session.add(user)
+    db.session.commit()
+    return user
+
+
+@pytest.fixture
+def admin_user(app):
+    admin = Utilisateur(nom='Admin', prenom='Ad', email='admin@example.com', mot_de_passe='x',
+                        role='admin', email_verifie=True, fcm_token='token-admin')
+    db.session.add(admin)
+    db.session.commit()
+    return admin
+
+
+@pytest.fixture
+def user_headers(client_user):
+    return {'Authorization': 'Bearer ' + create_access_token(identity=str(client_user.id))}
+
+
+@pytest.fixture
+def admin_headers(admin_user):
+    token = create_access_token(identity=str(admin_user.id), additional_claims={'role': 'admin'})
+    return {'Authorization': 'Bearer ' + token}
+
+
+def create_order(user, produit, quantite=2, transaction_id='42'):
+    """Commande en attente de paiement (et son paiement FedaPay si `transaction_id`)."""
+    adresse = AdresseLivraison(utilisateur_id=user.id, telephone_destinataire='+22990000000',
+                               ville='Cotonou', description_adresse='Rue 1', type_adresse='manuelle')
+    db.session.add(adresse)
+    db.session.flush()
+    total = quantite * produit.prix_unitaire
+    commande = Commande(utilisateur_id=user.id, adresse_livraison_id=adresse.id, sous_total=total, total=total)
+    db.session.add(commande)
+    db.session.flush()
+    stats.record_order_created(commande)
+    db.session.add(DetailsCommande(commande_id=commande.id, produit_id=produit.id, quantite=quantite,
+                                   prix_unitaire=produit.prix_unitaire, sous_total=total))
+    if transaction_id:
+        db.session.add(Paiement(commande_id=commande.id, fedapay_transaction_id=transaction_id,
+                                montant=total, statut='pending'))
+    db.session.commit()
+    return commande
+
+
+@pytest.fixture
+def pending_order(catalogue, client_user):
+    """Commande n°1 : 2 unités du premier produit, transaction FedaPay 42 en attente."""
+    return create_order(client_user, catalogue[0])
+
+
+def post_webhook(client, name, entity, secret='whsec_test'):
+    """Envoie un webhook FedaPay signé (secret de TestConfig par défaut)."""
+    body = json.dumps({'name': name, 'entity': entity}).encode('utf-8')
+    timestamp = int(time.time())
+    signature = hmac.new(secret.encode('utf-8'), f"{timestamp}.".encode('utf-8') + body, hashlib.sha256).hexdigest()
+    return client.post('/api/payment/webhook', data=body, content_type='application/json',
+                       headers={'X-FEDAPAY-SIGNATURE': f't={timestamp},s={signature}'})
+
+
+# --- CACHE INDISPONIBLE ---
+
+def closed_port():
+    sock = socket.socket()
+    sock.bind(('127.0.0.1', 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    return port
+
+
+@pytest.fixture
+def redis_down(app):
+    healthy = cache.backend
+    cache.backend = RedisBackend(RedisConnection(f'redis://127.0.0.1:{closed_port()}/0', timeout=0.5))
+    cache._down_until = 0
+    yield
+    cache.backend = healthy
+    cache._down_until = 0
+
+
+# --- FAUX SERVEUR FEDAPAY ---
+
+class StubFedaPayHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'   # keep-alive, comme l'API réelle
+
+    def do_GET(self):
+        self._reply()
+
+    def do_POST(self):
+        self._reply()
+
+    def _reply(self):
+        self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        self.server.requests.append((self.command, self.path, self.client_address[1]))
+        status, body, *headers = self.server.responses.pop(0) if self.server.responses else self.server.default
+        payload = body if isinstance(body, bytes) else json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        for name, value in (headers[0] if headers else {}).items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, *args):
+        pass
+
+
+class StubFedaPay(ThreadingHTTPServer):
+    """
+    Serveur HTTP local qui joue FedaPay : les réponses de `responses`
+    ((statut, corps[, en-têtes])) sont servies dans l'ordre, puis `default`
+    (transaction 42 approuvée) ; chaque
+    requête est notée avec le port client pour vérifier la réutilisation des
+    connexions.
+    """
+    daemon_threads = True
+
+    def __init__(self):
+        self.requests = []
+        self.responses = []
+        self.default = (200, APPROVED)
+        super().__init__(('127.0.0.1', 0), StubFedaPayHandler)
+
+    @property
+    def url(self):
+        return f'http://127.0.0.1:{self.server_address[1]}'
+
+
+@pytest.fixture
+def fedapay_server():
+    server = StubFedaPay()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def fedapay_stub_config(fedapay_server, monkeypatch):
+    """L'application parle au faux serveur FedaPay."""
+    # initialize_services lit la classe Config et garde le client en global
+    monkeypatch.setattr(Config, 'FEDAPAY_BASE_URL', fedapay_server.url)
+    monkeypatch.setattr(Config, 'FEDAPAY_API_KEY', 'sk_test')
+    monkeypatch.setattr(payment_routes, 'fedapay_client', None)
+    return fedapay_server
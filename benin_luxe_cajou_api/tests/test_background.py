@@ -0,0 +1,29 @@
+# tests/test_background.py
+
+from datetime import datetime, timedelta
+
+from app.background import scheduler
+from app.extensions import cache, db
+from app.models import TachePlanifiee
+
+
+def test_job_is_claimed_once_per_interval_in_cache(app):
+    assert scheduler._claim('expire_stock_reservations', 60)
+    assert not scheduler._claim('expire_stock_reservations', 60)
+    # Cache disponible : la base n'est pas sollicitée
+    assert db.session.get(TachePlanifiee, 'expire_stock_reservations') is None
+
+
+def test_job_is_claimed_in_database_when_cache_is_down(app, redis_down):
+    assert scheduler._claim('expire_stock_reservations', 60)
+    assert not cache.available
+    assert not scheduler._claim('expire_stock_reservations', 60)
+    # Les autres tâches ont leur propre échéance
+    assert scheduler._claim('reconcile_pending_payments', 60)
+
+    # Échéance suivante : la réservation expirée est reprise
+    db.session.get(TachePlanifiee, 'expire_stock_reservations').verrouille_jusqu_a = \
+        datetime.utcnow() - timedelta(seconds=1)
+    db.session.commit()
+    assert scheduler._claim('expire_stock_reservations', 60)
+    assert not scheduler._claim('expire_stock_reservations', 60)
@@ -0,0 +1,210 @@
+# tests/test_cache.py
+
+import socketserver
+import threading
+import time
+
+import pytest
+
+from app import create_app
+from app.cache import get_version, _deferred_bumps
+from app.cache_backends import Cache, RedisBackend, RedisConnection, COMPARE_AND_DELETE_SCRIPT
+from app.extensions import db, cache
+from app.models import Categorie, Produit
+from tests.conftest import TestConfig, closed_port
+
+
+# --- FAÇADE ET BACKEND FAKE-REDIS ---
+
+def test_get_set_add_incr_and_ttl(app):
+    cache.set('cle', 'valeur')
+    assert cache.get('cle') == b'valeur'
+    assert cache.add('cle', 'autre') is False
+    assert cache.add('nouvelle', 1, ttl=0.05) is True
+    assert cache.incr('compteur') == 1
+    assert cache.incr('compteur') == 2
+
+    time.sleep(0.1)
+    assert cache.get('nouvelle') is None
+
+
+def test_invalidate_tag_removes_tagged_keys_only(app):
+    cache.set('a', 1, tags=['produits'])
+    cache.set('b', 2, tags=['produits'])
+    cache.set('c', 3)
+    cache.invalidate_tag('produits')
+    assert (cache.get('a'), cache.get('b'), cache.get('c')) == (None, None, b'3')
+
+
+def test_lock_is_exclusive_until_released(app):
+    with cache.lock('tache', wait=0) as first:
+        with cache.lock('tache', wait=0) as second:
+            assert (first, second) == (True, False)
+    with cache.lock('tache', wait=0) as again:
+        assert again is True
+
+
+def test_expired_lock_is_not_released_by_its_previous_owner(app):
+    first = cache.lock('tache', ttl=0.05, wait=0)
+    assert first.__enter__() is True
+    time.sleep(0.1)
+    second = cache.lock('tache', ttl=30, wait=0)
+    assert second.__enter__() is True
+
+    first.__exit__(None, None, None)   # l'ancien détenteur libère après expiration
+    with cache.lock('tache', wait=0) as third:
+        assert third is False
+    second.__exit__(None, None, None)
+
+
+def test_memory_backend_refused_with_several_workers():
+    class MultiWorkerConfig(TestConfig):
+        CACHE_BACKEND = 'memory'
+        CACHE_WORKERS = 3
+
+    with pytest.raises(ValueError, match='plusieurs workers'):
+        create_app(MultiWorkerConfig)
+
+
+# --- INVALIDATION PAR VERSION ---
+
+def test_commit_invalidates_catalogue_snapshot(client, catalogue):
+    first = client.get('/api/catalogue-structure')
+    assert first.get_json()[0]['nom'] == 'Noix'
+    etag = first.headers['ETag']
+    assert client.get('/api/catalogue-structure', headers={'If-None-Match': etag}).status_code == 304
+
+    db.session.get(Categorie, 1).nom = 'Noix de cajou'
+    db.session.commit()
+
+    response = client.get('/api/catalogue-structure', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.get_json()[0]['nom'] == 'Noix de cajou'
+
+
+def test_bulk_update_bumps_catalogue_version(app, catalogue):
+    before = get_version('catalogue')
+    Produit.query.filter_by(id=1).update({'nom': 'Renommé'})
+    db.session.commit()
+    assert get_version('catalogue') != before
+
+
+def test_rollback_does_not_bump(app, catalogue):
+    before = get_version('catalogue')
+    db.session.get(Produit, 1).nom = 'Annulé'
+    db.session.flush()
+    db.session.rollback()
+    assert get_version('catalogue') == before
+
+
+# --- CACHE INDISPONIBLE ---
+
+def test_requests_and_commits_survive_cache_outage(client, catalogue, redis_down):
+    response = client.get('/api/products')
+    assert response.status_code == 200
+    assert len(response.get_json()) == 3
+    assert 'ETag' not in response.headers
+
+    db.session.get(Produit, 1).nom = 'Renommé pendant la panne'
+    db.session.commit()   # after_commit ne doit pas lever
+    assert 'catalogue' in _deferred_bumps
+
+    assert client.get('/api/products/1').get_json()['nom'] == 'Renommé pendant la panne'
+    assert client.get('/api/products/search?q=renomme').status_code == 200
+
+
+def test_deferred_bump_replayed_when_cache_returns(app, catalogue):
+    before = get_version('catalogue')
+    healthy = cache.backend
+    cache.backend = RedisBackend(RedisConnection(f'redis://127.0.0.1:{closed_port()}/0', timeout=0.5))
+    cache._down_until = 0
+    db.session.get(Produit, 1).nom = 'Modifié'
+    db.session.commit()
+
+    cache.backend = healthy
+    cache._down_until = 0
+    assert get_version('catalogue') != before
+    assert not _deferred_bumps
+
+
+def test_lock_fails_fast_when_cache_is_down(app, redis_down):
+    started = time.monotonic()
+    with cache.lock('webhook:1', wait=5) as acquired:
+        assert acquired is False
+    assert time.monotonic() - started < 2
+
+
+# --- CLIENT REDIS : PAS DE RENVOI DES COMMANDES NON IDEMPOTENTES ---
+
+def _read_command(rfile):
+    header = rfile.readline()
+    if not header:
+        return None
+    args = []
+    for _ in range(int(header[1:])):
+        length = int(rfile.readline()[1:])
+        args.append(rfile.read(length + 2)[:-2].decode())
+    return args
+
+
+class FlakyRedisServer(socketserver.ThreadingTCPServer):
+    """Serveur RESP qui coupe la première connexion après avoir lu (et "exécuté") une commande."""
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self):
+        self.commands = []
+        self.drop_next = True
+        super().__init__(('127.0.0.1', 0), FlakyRedisHandler)
+
+
+class FlakyRedisHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        while True:
+            command = _read_command(self.rfile)
+            if command is None:
+                return
+            self.server.commands.append(command)
+            if self.server.drop_next:
+                self.server.drop_next = False
+                return
+            self.wfile.write(b':7\r\n' if command[0] == 'INCR' else b'$-1\r\n')
+
+
+@pytest.fixture
+def flaky_redis():
+    server = FlakyRedisServer()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server, RedisConnection(f'redis://127.0.0.1:{server.server_address[1]}/0', timeout=2)
+    server.shutdown()
+    server.server_close()
+
+
+def test_idempotent_command_is_retried_after_disconnect(flaky_redis):
+    server, connection = flaky_redis
+    assert connection.execute('GET', 'cle') is None
+    assert [c[0] for c in server.commands] == ['GET', 'GET']
+
+
+def test_incr_is_not_resent_after_disconnect(flaky_redis):
+    server, connection = flaky_redis
+    with pytest.raises(ConnectionError):
+        connection.execute('INCR', 'version:catalogue')
+    assert [c[0] for c in server.commands] == ['INCR']
+    # La connexion suivante fonctionne normalement
+    assert connection.execute('INCR', 'version:catalogue') == 7
+
+
+def test_lock_release_is_a_single_compare_and_delete(flaky_redis):
+    server, connection = flaky_redis
+    server.drop_next = False
+    RedisBackend(connection).delete_if_equals('lock:x', b'token')
+    assert server.commands == [['EVAL', COMPARE_AND_DELETE_SCRIPT, '1', 'lock:x', 'token']]
+
+
+def test_set_nx_is_not_resent_after_disconnect(flaky_redis):
+    server, connection = flaky_redis
+    facade = Cache()
+    facade.backend = RedisBackend(connection)
+    assert facade.add('lock:x', 'token', ttl=5) is False   # échec dégradé, pas de second SET NX
+    assert [c[:1] + c[3:] for c in server.commands] == [['SET', 'NX', 'PX', '5000']]
@@ -0,0 +1,42 @@
+# tests/test_cart_merge.py
+
+import pytest
+
+from app.client_auth.routes import merge_guest_cart_to_user
+from app.extensions import db
+from app.models import Panier
+
+
+def test_guest_cart_is_merged_into_user_cart(app, catalogue, client_user):
+    first, second, _ = catalogue
+    db.session.add_all([
+        Panier(utilisateur_id=client_user.id, produit_id=first.id, quantite=1),
+        Panier(session_id='invite', produit_id=first.id, quantite=2),
+        Panier(session_id='invite', produit_id=second.id, quantite=3),
+    ])
+    db.session.commit()
+
+    merge_guest_cart_to_user(client_user.id, 'invite')
+
+    rows = Panier.query.order_by(Panier.produit_id).all()
+    assert [(row.utilisateur_id, row.session_id, row.produit_id, row.quantite) for row in rows] == [
+        (client_user.id, None, first.id, 3),
+        (client_user.id, None, second.id, 3),
+    ]
+
+
+def test_bench_refuses_outside_testing(app, catalogue, monkeypatch):
+    monkeypatch.setattr(app, 'testing', False)
+    result = app.test_cli_runner().invoke(args=['cart-merge-bench', '--sizes', '2', '--repeat', '1'])
+
+    assert result.exit_code != 0
+    assert '--yes-this-is-a-test-db' in result.output
+
+
+@pytest.mark.parametrize('testing, args', [(True, []), (False, ['--yes-this-is-a-test-db'])])
+def test_bench_runs_on_test_database(app, catalogue, monkeypatch, testing, args):
+    monkeypatch.setattr(app, 'testing', testing)
+    result = app.test_cli_runner().invoke(args=['cart-merge-bench', '--sizes', '2', '--repeat', '1', *args])
+
+    assert result.exit_code == 0, result.output
+    assert 'médiane' in result.output
@@ -0,0 +1,124 @@
+# tests/test_fedapay.py
+
+import time
+
+import pytest
+import requests
+
+from app import outbox
+from app.extensions import db
+from app.models import Paiement, Produit
+from app.payment.fedapay import FedaPayClient, FedaPayUnavailable
+from app.push import push_dispatcher
+from tests.conftest import APPROVED
+
+
+@pytest.fixture
+def fedapay(fedapay_server):
+    client = FedaPayClient('sk_test', base_url=fedapay_server.url, max_retries=2, backoff_base=0,
+                           breaker_threshold=3, breaker_reset_timeout=60)
+    yield client
+    client.session.close()
+
+
+# --- CLIENT HTTP ---
+
+def test_connections_are_reused(fedapay, fedapay_server):
+    for _ in range(3):
+        assert fedapay.get_transaction(42) == APPROVED
+    ports = {port for _, _, port in fedapay_server.requests}
+    assert len(fedapay_server.requests) == 3 and len(ports) == 1
+
+
+def test_get_is_retried_after_503(fedapay, fedapay_server):
+    fedapay_server.responses = [(503, {}), (502, {})]
+
+    assert fedapay.get_transaction(42) == APPROVED
+    assert [path for _, path, _ in fedapay_server.requests] == ['/v1/transactions/42'] * 3
+
+
+def test_post_is_never_retried(fedapay, fedapay_server):
+    fedapay_server.responses = [(503, {})]
+
+    with pytest.raises(requests.exceptions.HTTPError):
+        fedapay.create_transaction({'amount': 1000})
+    assert [(method, path) for method, path, _ in fedapay_server.requests] == [('POST', '/v1/transactions')]
+
+
+def test_breaker_opens_after_consecutive_failures(fedapay, fedapay_server):
+    fedapay_server.responses = [(503, {})] * 3
+
+    with pytest.raises(requests.exceptions.HTTPError):
+        fedapay.get_transaction(42)   # 1 appel + 2 nouvelles tentatives
+    with pytest.raises(FedaPayUnavailable):
+        fedapay.get_transaction(42)
+    # Le disjoncteur ouvert n'a pas touché le serveur
+    assert len(fedapay_server.requests) == 3
+    assert fedapay.stats()['circuit_breaker'] == 'open'
+
+
+def test_unreadable_response_during_trial_call_does_not_wedge_the_breaker(fedapay_server):
+    fedapay = FedaPayClient('sk_test', base_url=fedapay_server.url, max_retries=0,
+                            breaker_threshold=1, breaker_reset_timeout=0.05)
+    fedapay_server.responses = [(503, {}), (200, b'pas du gzip', {'Content-Encoding': 'gzip'})]
+
+    with pytest.raises(requests.exceptions.HTTPError):
+        fedapay.get_transaction(42)
+    time.sleep(0.1)
+    with pytest.raises(requests.exceptions.ContentDecodingError):
+        fedapay.get_transaction(42)   # appel d'essai (demi-ouvert)
+    assert fedapay.stats()['circuit_breaker'] == 'open'
+
+    time.sleep(0.1)
+    assert fedapay.get_transaction(42) == APPROVED
+    assert fedapay.stats()['circuit_breaker'] == 'closed'
+
+
+def test_client_errors_do_not_open_the_breaker(fedapay, fedapay_server):
+    fedapay_server.responses = [(404, {})] * 5
+
+    for _ in range(5):
+        assert fedapay.get_transaction_by_reference('BLC-1') is None
+    assert fedapay.stats()['circuit_breaker'] == 'closed'
+
+
+def test_metrics_per_endpoint(fedapay, fedapay_server):
+    fedapay_server.responses = [(503, {})]
+    fedapay.get_transaction(1)
+    fedapay.get_transaction(2)
+
+    metrics = fedapay.stats()['endpoints']['GET /v1/transactions/{id}']
+    assert (metrics['calls'], metrics['errors']) == (3, 1)
+    assert 0 <= metrics['p50_ms'] <= metrics['p95_ms'] <= metrics['max_ms']
+
+
+# --- SUIVI DU STATUT DE PAIEMENT DE BOUT EN BOUT ---
+
+def test_status_check_confirms_approved_payment(app, client, pending_order, admin_user, user_headers,
+                                                fedapay_stub_config):
+    response = client.get(f'/api/payment/status/{pending_order.id}', headers=user_headers)
+
+    assert response.status_code == 200
+    assert response.get_json() == {'payment_status': 'paye'}
+    assert [(method, path) for method, path, _ in fedapay_stub_config.requests] == [('GET', '/v1/transactions/42')]
+    db.session.expire_all()
+    assert db.session.get(Produit, pending_order.details[0].produit_id).stock_disponible == 8
+    assert Paiement.query.filter_by(commande_id=pending_order.id).one().statut == 'approved'
+
+    # Notifications envoyées par l'outbox, hors requête
+    assert outbox.drain(app) == (2, 0)
+    message, = push_dispatcher.transport.sent
+    assert message.data == {'order_id': str(pending_order.id), 'type': 'new_order'}
+
+    # Une fois payée, la commande n'interroge plus FedaPay
+    client.get(f'/api/payment/status/{pending_order.id}', headers=user_headers)
+    assert len(fedapay_stub_config.requests) == 1
+
+
+def test_status_check_survives_fedapay_outage(app, client, pending_order, user_headers, fedapay_stub_config):
+    fedapay_stub_config.responses = [(503, {})] * 3
+
+    response = client.get(f'/api/payment/status/{pending_order.id}', headers=user_headers)
+
+    assert response.status_code == 200
+    assert response.get_json() == {'payment_status': 'en_attente'}
@@ -0,0 +1,198 @@
+# tests/test_newsletter.py
+
+import socketserver
+import threading
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.extensions import db
+from app.models import NewsletterCampaign, NewsletterSubscription
+from app.newsletter import CampaignBusy, CampaignSender, handle_newsletter_campaign
+
+
+# --- SERVEUR SMTP LOCAL ---
+
+class SmtpSink(socketserver.ThreadingTCPServer):
+    """
+    Serveur SMTP minimal qui accepte et conserve les messages (destinataires).
+    Les adresses commençant par 'refuse' sont rejetées (550) ; `drop_after`
+    coupe la première connexion après ce nombre de messages.
+    """
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self):
+        self.recipients = []
+        self.connections = 0
+        self.drop_after = None
+        self.lock = threading.Lock()
+        super().__init__(('127.0.0.1', 0), SmtpSinkHandler)
+
+
+class SmtpSinkHandler(socketserver.StreamRequestHandler):
+    def reply(self, line):
+        self.wfile.write(line.encode('ascii') + b'\r\n')
+
+    def handle(self):
+        server = self.server
+        with server.lock:
+            server.connections += 1
+            drop_after, server.drop_after = server.drop_after, None
+        delivered = 0
+        recipients = []
+        self.reply('220 sink ESMTP')
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.decode('utf-8').strip()
+            verb = command[:4].upper()
+            if verb in ('EHLO', 'HELO'):
+                self.reply('250 sink')
+            elif verb == 'MAIL':
+                recipients = []
+                self.reply('250 OK')
+            elif verb == 'RCPT':
+                address = command.split(':', 1)[1].strip(' <>')
+                if address.startswith('refuse'):
+                    self.reply('550 Adresse inconnue')
+                else:
+                    recipients.append(address)
+                    self.reply('250 OK')
+            elif verb == 'DATA':
+                self.reply('354 Terminer par <CRLF>.<CRLF>')
+                while self.rfile.readline() not in (b'.\r\n', b''):
+                    pass
+                with server.lock:
+                    server.recipients.extend(recipients)
+                self.reply('250 OK')
+                delivered += 1
+                if drop_after and delivered >= drop_after:
+                    return   # coupure sans QUIT
+            elif verb in ('RSET', 'NOOP'):
+                self.reply('250 OK')
+            elif verb == 'QUIT':
+                self.reply('221 Au revoir')
+                return
+            else:
+                self.reply('502 Commande inconnue')
+
+
+@pytest.fixture
+def smtp_sink(app, monkeypatch):
+    server = SmtpSink()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    state = app.extensions['mail']
+    for name, value in {'server': '127.0.0.1', 'port': server.server_address[1], 'use_tls': False,
+                        'use_ssl': False, 'username': None, 'suppress': False}.items():
+        monkeypatch.setattr(state, name, value)
+    for name, value in {'NEWSLETTER_CHUNK_SIZE': 10, 'NEWSLETTER_SMTP_CONNECTIONS': 2,
+                        'NEWSLETTER_RATE_PER_SECOND': 0, 'NEWSLETTER_SMTP_TIMEOUT': 5}.items():
+        monkeypatch.setitem(app.config, name, value)
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def subscribers(app):
+    rows = [NewsletterSubscription(email=f'abonne{i:02d}@example.com', is_active=True) for i in range(25)]
+    db.session.add_all(rows)
+    db.session.commit()
+    return [(row.id, row.email) for row in rows]
+
+
+def new_campaign(**values):
+    campaign = NewsletterCampaign(type='nouveau_produit', sujet='Nouveau produit', contenu_html='<p>Cajou</p>',
+                                  **values)
+    db.session.add(campaign)
+    db.session.commit()
+    return campaign.id
+
+
+def campaign_state(campaign_id):
+    db.session.expire_all()
+    campaign = db.session.get(NewsletterCampaign, campaign_id)
+    return campaign.statut, campaign.nb_envoyes, campaign.nb_echecs
+
+
+# --- ENVOI PAR LOTS ---
+
+def test_campaign_is_sent_in_chunks(app, smtp_sink, subscribers, monkeypatch):
+    checkpoints = []
+    checkpoint = CampaignSender._checkpoint
+
+    def recording_checkpoint(self, campaign_id, last_id, sent, failed):
+        checkpoints.append((last_id, sent, failed))
+        return checkpoint(self, campaign_id, last_id, sent, failed)
+
+    monkeypatch.setattr(CampaignSender, '_checkpoint', recording_checkpoint)
+    campaign_id = new_campaign()
+
+    assert CampaignSender(app).run(campaign_id) is True
+    ids = [subscriber_id for subscriber_id, _ in subscribers]
+    assert checkpoints == [(ids[9], 10, 0), (ids[19], 10, 0), (ids[24], 5, 0)]
+    assert sorted(smtp_sink.recipients) == [email for _, email in subscribers]
+    assert smtp_sink.connections == 2   # une session par connexion parallèle, réutilisée
+    assert campaign_state(campaign_id) == ('terminee', 25, 0)
+
+
+def test_time_budget_splits_campaign_without_resending(app, smtp_sink, subscribers, monkeypatch):
+    monkeypatch.setitem(app.config, 'NEWSLETTER_TIME_BUDGET', 0)
+    campaign_id = new_campaign()
+
+    assert CampaignSender(app).run(campaign_id, schedule_next=False) is False
+    assert len(smtp_sink.recipients) == 10
+    while CampaignSender(app).run(campaign_id, schedule_next=False) is False:
+        pass
+
+    assert sorted(smtp_sink.recipients) == [email for _, email in subscribers]
+    assert campaign_state(campaign_id) == ('terminee', 25, 0)
+
+
+def test_crashed_campaign_resumes_after_checkpoint(app, smtp_sink, subscribers):
+    # Expéditeur mort après le premier lot : bail expiré, progression enregistrée
+    campaign_id = new_campaign(statut='en_cours', dernier_abonne_id=subscribers[9][0], nb_envoyes=10,
+                               verrouille_par='mort:1', verrouille_jusqu_a=datetime.utcnow() - timedelta(minutes=1))
+
+    assert CampaignSender(app).run(campaign_id) is True
+    assert sorted(smtp_sink.recipients) == [email for _, email in subscribers[10:]]
+    assert campaign_state(campaign_id) == ('terminee', 25, 0)
+
+
+# --- ERREURS SMTP ---
+
+def test_dropped_connection_is_reopened(app, smtp_sink, subscribers, monkeypatch):
+    monkeypatch.setitem(app.config, 'NEWSLETTER_SMTP_CONNECTIONS', 1)
+    smtp_sink.drop_after = 3
+    campaign_id = new_campaign()
+
+    assert CampaignSender(app).run(campaign_id) is True
+    assert smtp_sink.connections == 2
+    assert sorted(smtp_sink.recipients) == [email for _, email in subscribers]
+    assert campaign_state(campaign_id) == ('terminee', 25, 0)
+
+
+def test_refused_recipient_is_a_failure_not_a_reconnect(app, smtp_sink, subscribers, monkeypatch):
+    monkeypatch.setitem(app.config, 'NEWSLETTER_SMTP_CONNECTIONS', 1)
+    db.session.add(NewsletterSubscription(email='refuse@example.com', is_active=True))
+    db.session.commit()
+    campaign_id = new_campaign()
+
+    assert CampaignSender(app).run(campaign_id) is True
+    assert smtp_sink.connections == 1
+    assert sorted(smtp_sink.recipients) == [email for _, email in subscribers]
+    assert campaign_state(campaign_id) == ('terminee', 25, 1)
+
+
+# --- RÉSERVATION ---
+
+def test_campaign_leased_by_another_sender_is_busy(app, smtp_sink, subscribers):
+    campaign_id = new_campaign(statut='en_cours', verrouille_par='autre:1',
+                               verrouille_jusqu_a=datetime.utcnow() + timedelta(minutes=5))
+
+    with pytest.raises(CampaignBusy):
+        handle_newsletter_campaign(campaign_id)
+    assert smtp_sink.recipients == []
+    assert campaign_state(campaign_id) == ('en_cours', 0, 0)
@@ -0,0 +1,90 @@
+# tests/test_orders_admin.py
+
+import csv
+import io
+import json
+from datetime import datetime
+
+import pytest
+
+from app.extensions import db
+from app.models import ZoneLivraison
+from tests.conftest import create_order
+
+
+@pytest.fixture
+def orders(catalogue, client_user):
+    """Trois commandes (totaux 2000, 2002, 2004) sur trois jours, la plus récente à Porto-Novo."""
+    commandes = [create_order(client_user, produit, transaction_id=None) for produit in catalogue]
+    for day, commande in zip((1, 2, 3), commandes):
+        commande.date_commande = datetime(2026, 10, day, 12, 0)
+    commandes[0].statut, commandes[0].statut_paiement = 'livree', 'paye'
+    commandes[1].statut, commandes[1].statut_paiement = 'confirmee', 'paye'
+    commandes[2].adresse_livraison.ville = 'Porto-Novo'
+    db.session.add(ZoneLivraison(nom_zone='Ouémé', villes='Porto-Novo, Sèmè', tarif_livraison=1500))
+    db.session.commit()
+    return commandes
+
+
+def order_ids(client, headers, query=''):
+    response = client.get('/api/admin/orders/' + query, headers=headers)
+    assert response.status_code == 200
+    return [order['id'] for order in response.get_json()]
+
+
+@pytest.mark.parametrize('query, expected', [
+    ('', [3, 2, 1]),
+    ('?statut=confirmee', [2]),
+    ('?statut_paiement=paye', [2, 1]),
+    ('?date_debut=2026-10-02&date_fin=2026-10-02', [2]),
+    ('?total_min=2001&total_max=2003', [2]),
+    ('?ville=Porto-Novo', [3]),
+    ('?zone_id=1', [3]),
+    ('?client_id=1&statut_paiement=en_attente', [3]),
+    ('?client_id=999', []),
+])
+def test_filters(client, orders, admin_headers, query, expected):
+    assert order_ids(client, admin_headers, query) == expected
+
+
+@pytest.mark.parametrize('query', ['?statut=perdue', '?date_debut=02/10/2026', '?total_min=abc',
+                                   '?zone_id=99', '?format=xml'])
+def test_invalid_filters_are_rejected(client, orders, admin_headers, query):
+    response = client.get('/api/admin/orders/' + query, headers=admin_headers)
+    assert response.status_code == 400
+    assert 'msg' in response.get_json()
+
+
+def test_keyset_pages_follow_the_full_list(client, orders, admin_headers):
+    page = client.get('/api/admin/orders/?limit=2', headers=admin_headers).get_json()
+    assert [order['id'] for order in page['items']] == [3, 2]
+
+    page = client.get(f"/api/admin/orders/?limit=2&cursor={page['next_cursor']}", headers=admin_headers).get_json()
+    assert [order['id'] for order in page['items']] == [1]
+    assert page['next_cursor'] is None
+
+
+def test_csv_export_streams_filtered_orders(client, orders, admin_headers):
+    response = client.get('/api/admin/orders/?format=csv&statut_paiement=paye', headers=admin_headers)
+
+    assert response.status_code == 200
+    assert response.mimetype == 'text/csv'
+    assert response.is_streamed
+    assert response.headers['Content-Disposition'].endswith('.csv"')
+    rows = list(csv.DictReader(io.StringIO(response.get_data(as_text=True))))
+    assert [(row['id'], row['statut'], row['total'], row['ville']) for row in rows] == [
+        ('2', 'confirmee', '2002.00', 'Cotonou'), ('1', 'livree', '2000.00', 'Cotonou')]
+
+
+def test_ndjson_export_has_one_order_per_line(client, orders, client_user, admin_headers):
+    response = client.get('/api/admin/orders/?format=ndjson', headers=admin_headers)
+
+    assert response.mimetype == 'application/x-ndjson'
+    lines = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    assert [line['id'] for line in lines] == [3, 2, 1]
+    assert lines[0] == {
+        'id': 3, 'numero_commande': orders[2].numero_commande, 'date_commande': '2026-10-03T12:00:00',
+        'statut': 'en_attente', 'statut_paiement': 'en_attente', 'total': '2004.00',
+        'client_id': client_user.id, 'client_prenom': client_user.prenom, 'client_nom': client_user.nom,
+        'client_email': client_user.email, 'ville': 'Porto-Novo',
+    }
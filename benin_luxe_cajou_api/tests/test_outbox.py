@@ -0,0 +1,36 @@
+# tests/test_outbox.py
+
+from app import outbox
+from app.extensions import db
+from app.models import OutboxMessage
+
+
+def enqueue_messages(count):
+    for i in range(count):
+        outbox.enqueue('test_message', numero=i)
+    db.session.commit()
+
+
+def test_drain_limit_claims_only_what_it_processes(app, monkeypatch):
+    handled = []
+    monkeypatch.setitem(outbox.HANDLERS, 'test_message', lambda numero: handled.append(numero))
+    enqueue_messages(5)
+
+    assert outbox.drain(app, limit=3) == (3, 0)
+    assert len(handled) == 3
+    # Les messages restants ne sont pas réservés : un autre worker peut les prendre
+    db.session.expire_all()
+    assert OutboxMessage.query.filter_by(statut='en_attente').count() == 2
+    assert OutboxMessage.query.filter_by(statut='en_cours').count() == 0
+
+    assert outbox.drain(app) == (2, 0)
+
+
+def test_drain_limit_smaller_than_batches(app, monkeypatch):
+    monkeypatch.setitem(outbox.HANDLERS, 'test_message', lambda numero: None)
+    monkeypatch.setitem(app.config, 'OUTBOX_BATCH_SIZE', 2)
+    enqueue_messages(5)
+
+    assert outbox.drain(app, limit=3) == (3, 0)
+    db.session.expire_all()
+    assert OutboxMessage.query.filter_by(statut='en_cours').count() == 0
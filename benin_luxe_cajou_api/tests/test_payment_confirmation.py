@@ -0,0 +1,83 @@
+# tests/test_payment_confirmation.py
+
+import threading
+
+import pytest
+
+from app import outbox
+from app.extensions import db
+from app.models import Commande, ConfirmationPaiement, OutboxMessage, Produit, StatistiqueJournaliere
+from app.payment.routes import process_payment_confirmation
+from tests.conftest import post_webhook, using_mysql
+
+
+def confirm(order_id, source):
+    return process_payment_confirmation(db.session.get(Commande, order_id), '42', source)
+
+
+def assert_confirmed_once(order_id, total):
+    db.session.expire_all()
+    order = db.session.get(Commande, order_id)
+    assert (order.statut, order.statut_paiement) == ('confirmee', 'paye')
+    assert ConfirmationPaiement.query.filter_by(fedapay_transaction_id='42').count() == 1
+    messages = sorted(message.type for message in OutboxMessage.query.all()
+                      if message.type in ('order_confirmation_email', 'new_order_push'))
+    assert messages == ['new_order_push', 'order_confirmation_email']
+    stock = db.session.get(Produit, order.details[0].produit_id).stock_disponible
+    assert stock == 8
+    row = StatistiqueJournaliere.query.one()
+    assert (row.commandes_payees, row.commandes_confirmee, row.commandes_en_attente) == (1, 1, 0)
+    assert row.chiffre_affaires == total
+
+
+def test_second_confirmation_is_a_no_op(app, pending_order):
+    assert confirm(pending_order.id, 'webhook') is True
+    assert confirm(pending_order.id, 'statut') is False
+
+    assert_confirmed_once(pending_order.id, pending_order.total)
+
+
+def test_webhook_then_status_poll_confirm_once(app, client, pending_order, user_headers, fedapay_stub_config):
+    post_webhook(client, 'transaction.approved', {'id': 42})
+    post_webhook(client, 'transaction.approved', {'id': 42})   # renvoi FedaPay
+    outbox.drain(app)
+
+    response = client.get(f'/api/payment/status/{pending_order.id}', headers=user_headers)
+    assert response.get_json() == {'payment_status': 'paye'}
+    assert_confirmed_once(pending_order.id, pending_order.total)
+
+
+def test_status_poll_then_webhook_confirm_once(app, client, pending_order, user_headers, fedapay_stub_config):
+    client.get(f'/api/payment/status/{pending_order.id}', headers=user_headers)
+    post_webhook(client, 'transaction.approved', {'id': 42})
+    outbox.drain(app)
+
+    assert confirm(pending_order.id, 'reconciliation') is False
+    assert_confirmed_once(pending_order.id, pending_order.total)
+
+
+@pytest.mark.skipif(not using_mysql(), reason="Nécessite MySQL (TEST_DATABASE_URL=mysql+pymysql://...)")
+def test_racing_confirmations_confirm_once(app, pending_order):
+    order_id = pending_order.id
+    barrier = threading.Barrier(8)
+    results, errors = [], []
+
+    def worker(source):
+        with app.app_context():
+            try:
+                barrier.wait()
+                results.append(confirm(order_id, source))
+            except Exception as e:
+                errors.append(e)
+            finally:
+                db.session.remove()
+
+    threads = [threading.Thread(target=worker, args=(source,)) for source in ['webhook', 'statut'] * 4]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=60)
+
+    assert not errors, errors
+    assert results.count(True) == 1
+    assert_confirmed_once(order_id, pending_order.total)
@@ -0,0 +1,71 @@
+# tests/test_payment_stream.py
+
+import threading
+
+import pytest
+
+from app.extensions import db
+from app.payment.status_stream import status_hub, sse_event
+
+
+@pytest.fixture
+def hub(app, monkeypatch):
+    """Hub sans thread de surveillance : les statuts sont publiés par le test."""
+    monkeypatch.setattr(status_hub, '_thread', object())
+    monkeypatch.setattr(status_hub, '_streams', 0)
+    return status_hub
+
+
+def open_stream(client, order_id, headers):
+    return client.get(f'/api/payment/status/{order_id}/stream', headers=headers, buffered=False)
+
+
+def test_stream_ends_on_final_status_and_releases_its_slot(client, pending_order, user_headers, hub):
+    response = open_stream(client, pending_order.id, user_headers)
+    assert response.status_code == 200
+    assert response.mimetype == 'text/event-stream'
+    events = iter(response.response)
+    assert next(events) == b'retry: 3000\n\n'
+    assert next(events) == sse_event('status', 'en_attente').encode()
+    assert hub._streams == 1
+
+    # Le générateur s'abonne à la lecture suivante : publication juste après
+    threading.Timer(0.1, hub.publish, (pending_order.id, 'paye')).start()
+    assert next(events) == sse_event('status', 'paye').encode()
+    with pytest.raises(StopIteration):
+        next(events)
+    assert not hub._subscribers
+
+    response.close()
+    assert hub._streams == 0
+
+
+def test_final_status_is_sent_once_without_holding_a_slot(client, pending_order, user_headers, hub):
+    pending_order.statut_paiement = 'paye'
+    db.session.commit()
+
+    response = client.get(f'/api/payment/status/{pending_order.id}/stream', headers=user_headers)
+
+    assert response.get_data() == b'retry: 3000\n\n' + sse_event('status', 'paye').encode()
+    assert hub._streams == 0
+
+
+def test_streams_beyond_the_limit_fall_back_to_polling(app, client, pending_order, user_headers, hub):
+    app.config['PAYMENT_STREAM_MAX_CONCURRENT'] = 1
+    first = open_stream(client, pending_order.id, user_headers)
+
+    refused = open_stream(client, pending_order.id, user_headers)
+    assert refused.status_code == 503
+    assert refused.get_json()['status_url'] == f'/api/payment/status/{pending_order.id}'
+
+    # Fermé avant la première lecture : la place est quand même rendue
+    first.close()
+    assert hub._streams == 0
+    assert open_stream(client, pending_order.id, user_headers).status_code == 200
+
+
+def test_stream_accepts_token_in_query_string(client, pending_order, user_headers, hub):
+    token = user_headers['Authorization'].split()[1]
+    response = client.get(f'/api/payment/status/{pending_order.id}/stream?jwt={token}', buffered=False)
+    assert response.status_code == 200
+    response.close()
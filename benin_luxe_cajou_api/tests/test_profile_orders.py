@@ -0,0 +1,29 @@
+# tests/test_profile_orders.py
+
+from sqlalchemy import text
+
+from app.extensions import db
+from app.payment.routes import process_payment_confirmation
+
+
+def statuts(client, headers, query='?limit=2'):
+    body = client.get('/api/profile/orders' + query, headers=headers).get_json()
+    orders = body['items'] if isinstance(body, dict) else body
+    return [(order['id'], order['statut'], order['total']) for order in orders]
+
+
+def test_cached_first_page_follows_order_changes(app, client, pending_order, user_headers, admin_headers):
+    # Commande en attente de paiement : masquée, et la page vide est mise en cache
+    assert statuts(client, user_headers) == statuts(client, user_headers, '') == []
+
+    process_payment_confirmation(pending_order, '42', 'test')
+    assert statuts(client, user_headers) == statuts(client, user_headers, '') == [(1, 'confirmee', '2000.00')]
+
+    # Une écriture hors ORM ne bumpe pas la version : la page vient bien du cache
+    db.session.execute(text("UPDATE commandes SET total = 1 WHERE id = 1"))
+    db.session.commit()
+    assert statuts(client, user_headers) == [(1, 'confirmee', '2000.00')]
+
+    response = client.put('/api/admin/orders/1/status', json={'statut': 'expedie'}, headers=admin_headers)
+    assert response.status_code == 200
+    assert statuts(client, user_headers) == statuts(client, user_headers, '') == [(1, 'expedie', '1.00')]
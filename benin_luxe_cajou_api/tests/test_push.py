@@ -0,0 +1,79 @@
+# tests/test_push.py
+
+import pytest
+from firebase_admin import exceptions, messaging
+
+from app.extensions import db
+from app.models import Utilisateur
+from app.payment.routes import send_low_stock_notification
+from app.push import push_dispatcher, PushDeliveryError, FakeFirebaseTransport, FCM_MAX_TOKENS_PER_BATCH
+
+
+def add_admins(count, prefix='token'):
+    db.session.add_all([
+        Utilisateur(nom='Admin', prenom=str(i), email=f'admin{i}@example.com', mot_de_passe='x',
+                    role='admin', fcm_token=f'{prefix}-{i}')
+        for i in range(count)
+    ])
+    db.session.commit()
+
+
+def notify():
+    return push_dispatcher.send_to_admins(notification=messaging.Notification(title='Test', body='Corps'))
+
+
+def test_tokens_are_sent_in_batches_of_500(app):
+    add_admins(FCM_MAX_TOKENS_PER_BATCH + 1)
+
+    assert notify() == FCM_MAX_TOKENS_PER_BATCH + 1
+    assert [len(message.tokens) for message in push_dispatcher.transport.sent] == [FCM_MAX_TOKENS_PER_BATCH, 1]
+
+
+def test_only_admin_tokens_are_notified(app, admin_user, client_user):
+    client_user.fcm_token = 'token-client'
+    db.session.commit()
+
+    assert notify() == 1
+    assert push_dispatcher.transport.sent[0].tokens == ['token-admin']
+
+
+def test_unregistered_tokens_are_pruned(app):
+    add_admins(3)
+    push_dispatcher.transport.unregistered = {'token-1'}
+
+    assert notify() == 2
+    tokens = {user.email: user.fcm_token for user in Utilisateur.query.all()}
+    assert tokens == {'admin0@example.com': 'token-0', 'admin1@example.com': None, 'admin2@example.com': 'token-2'}
+
+
+class UnavailableTransport(FakeFirebaseTransport):
+    """FCM répond 503 pour chaque token."""
+
+    def send_each_for_multicast(self, message):
+        self.sent.append(message)
+        return messaging.BatchResponse([
+            messaging.SendResponse(None, exceptions.UnavailableError('Service indisponible'))
+            for _ in message.tokens
+        ])
+
+
+def test_temporary_failures_raise_for_retry(app, monkeypatch):
+    add_admins(2)
+    monkeypatch.setattr(push_dispatcher, 'transport', UnavailableTransport())
+
+    with pytest.raises(PushDeliveryError):
+        notify()
+    # Les tokens ne sont pas effacés sur une erreur temporaire
+    assert Utilisateur.query.filter(Utilisateur.fcm_token.is_(None)).count() == 0
+
+
+def test_low_stock_notification_reaches_admins(app, catalogue, admin_user):
+    produit = catalogue[0]
+    produit.stock_disponible = 2
+
+    send_low_stock_notification(produit)
+
+    message, = push_dispatcher.transport.sent
+    assert message.tokens == ['token-admin']
+    assert message.data == {'product_id': str(produit.id), 'type': 'low_stock_alert'}
+    assert message.android.notification.channel_id == 'low_stock_channel'
@@ -0,0 +1,12 @@
+# tests/test_query_plans.py
+
+from app.extensions import db
+from app.models import Commande, Panier, Utilisateur
+
+
+def test_db_explain_seeds_then_rolls_back(app):
+    result = app.test_cli_runner().invoke(args=['db-explain', '--seed-rows', '300'])
+
+    assert result.exit_code == 0, result.output
+    assert 'requête(s) servie(s) par un index' in result.output
+    assert (Utilisateur.query.count(), Commande.query.count(), Panier.query.count()) == (0, 0, 0)
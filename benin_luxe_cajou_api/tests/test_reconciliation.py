@@ -0,0 +1,56 @@
+# tests/test_reconciliation.py
+
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.extensions import db
+from app.models import Paiement
+from app.payment.reconciliation import reconcile_pending_payments, _get_watermark
+from tests.conftest import create_order
+
+PENDING = {'v1/transaction': {'id': 0, 'status': 'pending'}}
+
+
+@pytest.fixture
+def old_pending_payments(catalogue, client_user, fedapay_stub_config):
+    """Trois paiements 'pending' assez anciens pour être vérifiés, toujours en attente chez FedaPay."""
+    fedapay_stub_config.default = (200, PENDING)
+    orders = [create_order(client_user, produit, transaction_id=str(100 + i)) for i, produit in enumerate(catalogue)]
+    Paiement.query.update({Paiement.date_creation: datetime.utcnow() - timedelta(hours=1)})
+    db.session.commit()
+    return [order.paiements[0] for order in orders]
+
+
+def checked_transactions(server):
+    checked = sorted(path.rsplit('/', 1)[1] for _, path, _ in server.requests)
+    server.requests.clear()
+    return checked
+
+
+def test_batches_resume_from_watermark_then_wrap_around(app, old_pending_payments, fedapay_stub_config):
+    second = old_pending_payments[1]
+
+    assert reconcile_pending_payments(limit=2) == {'pending': 2}
+    assert checked_transactions(fedapay_stub_config) == ['100', '101']
+    assert _get_watermark() == second.id
+
+    # Lot incomplet : fin de la table, le passage suivant repart du début
+    assert reconcile_pending_payments(limit=2) == {'pending': 1}
+    assert checked_transactions(fedapay_stub_config) == ['102']
+    assert _get_watermark() == 0
+
+    assert reconcile_pending_payments(limit=2) == {'pending': 2}
+    assert checked_transactions(fedapay_stub_config) == ['100', '101']
+    assert _get_watermark() == second.id
+
+
+def test_recent_and_closed_payments_are_skipped(app, old_pending_payments, fedapay_stub_config):
+    first, second, _ = old_pending_payments
+    first.date_creation = datetime.utcnow()
+    second.statut = 'approved'
+    db.session.commit()
+
+    assert reconcile_pending_payments(limit=2) == {'pending': 1}
+    assert checked_transactions(fedapay_stub_config) == ['102']
+    assert _get_watermark() == 0
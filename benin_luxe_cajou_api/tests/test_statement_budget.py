@@ -0,0 +1,75 @@
+# tests/test_statement_budget.py
+
+import pytest
+from flask import jsonify
+
+from app.extensions import db
+from app.models import Categorie, TypeProduit, Produit, ImageProduit, Panier
+from app.statement_budget import statement_budget
+
+
+@pytest.fixture
+def many_products(app):
+    """20 produits, répartis sur deux types, avec deux images chacun."""
+    categorie = Categorie(nom='Noix')
+    db.session.add(categorie)
+    db.session.flush()
+    types = [TypeProduit(category_id=categorie.id, nom=nom) for nom in ('Grillée', 'Nature')]
+    db.session.add_all(types)
+    db.session.flush()
+    produits = []
+    for i in range(20):
+        produit = Produit(type_produit_id=types[i % 2].id, nom=f'Cajou {i}', quantite_contenant=250,
+                          prix_unitaire=1000 + i, stock_disponible=10)
+        db.session.add(produit)
+        db.session.flush()
+        db.session.add_all([ImageProduit(produit_id=produit.id, url_image=f'https://img/{i}-{j}',
+                                         est_principale=j == 0) for j in range(2)])
+        produits.append(produit)
+    db.session.commit()
+    return produits
+
+
+def test_budget_trips_in_testing(app, client, many_products):
+    @app.route('/_test/n-plus-one')
+    @statement_budget(1)
+    def n_plus_one():
+        # Une requête pour la liste, puis une par produit pour ses images
+        return jsonify([len(produit.images) for produit in Produit.query.all()])
+
+    with pytest.raises(AssertionError, match=r'GET /_test/n-plus-one a exécuté \d+ requêtes SQL \(budget: 1\)'):
+        client.get('/_test/n-plus-one')
+
+
+def test_lazy_loading_regression_trips_product_listing(app, client, many_products, monkeypatch):
+    # Sans les options de chargement, images et types sont chargés produit par produit
+    monkeypatch.setattr('app.public_api.routes.eager', lambda query, schema: query)
+    with pytest.raises(AssertionError, match=r'budget: 4'):
+        client.get('/api/products')
+
+
+@pytest.mark.parametrize('url', [
+    '/api/products',
+    '/api/products?limit=5&sort=price_asc',
+    '/api/products?facets=1&en_stock=1',
+    '/api/products/1',
+    '/api/products/batch?ids=' + ','.join(str(i) for i in range(1, 21)),
+    '/api/products/search?q=cajou',
+])
+def test_public_product_endpoints_stay_within_budget(client, many_products, url):
+    assert client.get(url).status_code == 200
+
+
+def test_admin_product_endpoints_stay_within_budget(client, many_products, admin_headers):
+    assert client.get('/api/admin/products', headers=admin_headers).status_code == 200
+    assert client.get('/api/admin/products/1', headers=admin_headers).status_code == 200
+
+
+def test_cart_stays_within_budget(client, many_products, client_user, user_headers):
+    db.session.add_all([Panier(utilisateur_id=client_user.id, produit_id=produit.id, quantite=1)
+                        for produit in many_products])
+    db.session.commit()
+
+    response = client.post('/api/cart/', headers=user_headers, json={})
+    assert response.status_code == 200
+    assert len(response.get_json()) == 20
@@ -0,0 +1,51 @@
+# tests/test_stats.py
+
+from datetime import datetime
+
+from app import stats
+from app.extensions import db
+from app.models import Commande, StatistiqueJournaliere
+from app.payment.routes import abandon_order, process_payment_confirmation
+from tests.conftest import create_order
+
+
+def rollup():
+    db.session.expire_all()
+    return {row.jour: {column: getattr(row, column) for column in ('chiffre_affaires', *stats.COUNTERS)}
+            for row in StatistiqueJournaliere.query.all()}
+
+
+def test_incremental_rollup_matches_backfill(app, client, catalogue, client_user, admin_headers):
+    stats.record_new_client(client_user)   # fait par l'inscription
+    orders = {name: create_order(client_user, catalogue[i % 3], quantite=1 + i, transaction_id=str(100 + i)).id
+              for i, name in enumerate(['livree', 'remboursee', 'confirmee', 'abandonnee', 'en_attente'])}
+
+    for name in ('livree', 'remboursee', 'confirmee'):
+        order = db.session.get(Commande, orders[name])
+        assert process_payment_confirmation(order, order.paiements[0].fedapay_transaction_id, 'webhook')
+    for statut in ('en_preparation', 'expedie', 'livree'):
+        response = client.put(f"/api/admin/orders/{orders['livree']}/status", json={'statut': statut},
+                              headers=admin_headers)
+        assert response.status_code == 200
+    assert client.post(f"/api/admin/orders/{orders['remboursee']}/cancel", headers=admin_headers).status_code == 200
+    assert abandon_order(orders['abandonnee'], "Paiement expiré.")
+
+    incremental = rollup()
+    today = datetime.utcnow().date()
+    totals = stats.dashboard_totals(today)
+    row = incremental[today]
+    assert (row['commandes_livree'], row['commandes_annulee'], row['commandes_confirmee'],
+            row['commandes_en_attente'], row['commandes_payees'], row['nouveaux_clients']) == (1, 2, 1, 1, 2, 1)
+
+    stats.backfill()
+    assert rollup() == incremental
+    assert stats.dashboard_totals(today) == totals
+
+
+def test_dashboard_reads_the_rollup(app, client, catalogue, client_user, admin_headers):
+    order = create_order(client_user, catalogue[0])
+    process_payment_confirmation(order, '42', 'webhook')
+
+    response = client.get('/api/admin/dashboard/stats', headers=admin_headers)
+    assert response.status_code == 200
+    assert response.get_json()['pending_orders_count'] == 1
@@ -0,0 +1,140 @@
+# tests/test_webhooks.py
+
+from app import outbox
+from app.extensions import db
+from app.models import Commande, ConfirmationPaiement, EvenementWebhook, Paiement, Produit
+from app.payment import webhooks
+from tests.conftest import create_order, post_webhook
+
+
+def transaction(id, status, reference):
+    return {'v1/transaction': {'id': id, 'status': status, 'merchant_reference': reference}}
+
+
+def statut_paiement(order_id):
+    db.session.expire_all()
+    return db.session.get(Commande, order_id).statut_paiement
+
+
+# --- AUTHENTIFICATION ---
+
+def test_webhooks_refused_without_configured_secret(app, client, pending_order, monkeypatch):
+    monkeypatch.setitem(app.config, 'FEDAPAY_WEBHOOK_SECRET', None)
+
+    response = client.post('/api/payment/webhook', json={'name': 'transaction.approved', 'entity': {'id': 42}})
+
+    assert response.status_code == 503
+    assert EvenementWebhook.query.count() == 0
+
+
+def test_webhooks_with_invalid_signature_are_rejected(client, pending_order):
+    response = post_webhook(client, 'transaction.approved', {'id': 42}, secret='autre-secret')
+
+    assert response.status_code == 400
+    assert EvenementWebhook.query.count() == 0
+
+
+# --- VÉRIFICATION AUPRÈS DE FEDAPAY ---
+
+def test_approved_webhook_is_confirmed_against_fedapay(app, client, pending_order, fedapay_stub_config):
+    assert post_webhook(client, 'transaction.approved', {'id': 42}).status_code == 200
+    outbox.drain(app)
+
+    assert statut_paiement(pending_order.id) == 'paye'
+    assert ('GET', '/v1/transactions/42') in [(m, p) for m, p, _ in fedapay_stub_config.requests]
+
+
+def test_forged_approval_of_a_pending_transaction_is_ignored(app, client, pending_order, fedapay_stub_config):
+    fedapay_stub_config.default = (200, transaction(42, 'pending', 'BLC-1'))
+
+    post_webhook(client, 'transaction.approved', {'id': 42, 'status': 'approved'})
+    outbox.drain(app)
+
+    assert statut_paiement(pending_order.id) == 'en_attente'
+    assert EvenementWebhook.query.one().statut == 'ignore'
+
+
+def test_forged_merchant_reference_cannot_pay_another_order(app, client, catalogue, client_user,
+                                                            pending_order, fedapay_stub_config):
+    # La commande 2 n'a pas encore de transaction ; l'attaquant rejoue sa
+    # propre transaction approuvée (42, commande 1) en annonçant BLC-2.
+    other = create_order(client_user, catalogue[1], transaction_id=None)
+    fedapay_stub_config.default = (200, transaction(77, 'approved', 'BLC-1'))
+
+    post_webhook(client, 'transaction.approved', {'id': 77, 'merchant_reference': f'BLC-{other.id}'})
+    outbox.drain(app)
+
+    assert statut_paiement(other.id) == 'en_attente'
+    assert Paiement.query.filter_by(commande_id=other.id).count() == 0
+
+
+def test_reference_must_match_the_recorded_payment(app, client, catalogue, client_user,
+                                                   pending_order, fedapay_stub_config):
+    other = create_order(client_user, catalogue[1], transaction_id='99')
+    fedapay_stub_config.default = (200, transaction(99, 'approved', 'BLC-1'))
+
+    post_webhook(client, 'transaction.approved', {'id': 99})
+    outbox.drain(app)
+
+    assert statut_paiement(other.id) == statut_paiement(pending_order.id) == 'en_attente'
+
+
+def test_unknown_payment_is_recorded_from_the_verified_reference(app, client, catalogue, client_user,
+                                                                 fedapay_stub_config):
+    order = create_order(client_user, catalogue[0], transaction_id=None)
+    fedapay_stub_config.default = (200, transaction(55, 'approved', f'BLC-{order.id}'))
+
+    post_webhook(client, 'transaction.approved', {'id': 55})
+    outbox.drain(app)
+
+    assert statut_paiement(order.id) == 'paye'
+    assert Paiement.query.filter_by(commande_id=order.id).one().fedapay_transaction_id == '55'
+
+
+def test_unknown_transaction_is_retried_not_applied(app, client, pending_order, fedapay_stub_config):
+    fedapay_stub_config.default = (404, {'message': 'Transaction introuvable'})
+
+    post_webhook(client, 'transaction.approved', {'id': 42})
+
+    assert outbox.drain(app) == (0, 1)
+    assert statut_paiement(pending_order.id) == 'en_attente'
+    event = EvenementWebhook.query.one()
+    assert (event.statut, bool(event.derniere_erreur)) == ('recu', True)
+    assert ConfirmationPaiement.query.count() == 0
+
+
+# --- ORDRE ET REJEU ---
+
+def test_events_of_a_transaction_are_applied_in_reception_order(app, client, pending_order,
+                                                                 fedapay_stub_config, monkeypatch):
+    applied = []
+    apply_event = webhooks.apply_event
+    monkeypatch.setattr(webhooks, 'apply_event', lambda event: applied.append(event.id) or apply_event(event))
+    for _ in range(3):
+        post_webhook(client, 'transaction.approved', {'id': 42})
+
+    # Le dernier événement reçu entraîne les précédents, dans l'ordre
+    first, second, third = [event.id for event in EvenementWebhook.query.order_by(EvenementWebhook.id)]
+    webhooks.handle_fedapay_webhook(third)
+    assert applied == [first, second, third]
+
+    # Les messages outbox des deux premiers trouvent leur événement déjà traité
+    assert outbox.drain(app) == (5, 0)
+    assert applied == [first, second, third]
+    assert {event.statut for event in EvenementWebhook.query} == {'traite'}
+    assert ConfirmationPaiement.query.count() == 1
+
+
+def test_replaying_events_is_idempotent(app, client, pending_order, fedapay_stub_config):
+    post_webhook(client, 'transaction.approved', {'id': 42})
+    assert outbox.drain(app) == (3, 0)   # webhook, puis e-mail et push de confirmation
+
+    assert webhooks.replay_events(inline=True)[0] == 1
+    assert webhooks.replay_events(transaction_id=42)[0] == 1
+    # Seul le rejeu via l'outbox reste à traiter : aucune nouvelle notification
+    assert outbox.drain(app) == (1, 0)
+
+    assert statut_paiement(pending_order.id) == 'paye'
+    assert EvenementWebhook.query.one().statut == 'traite'
+    assert ConfirmationPaiement.query.count() == 1
+    assert db.session.get(Produit, pending_order.details[0].produit_id).stock_disponible == 8